@@ -0,0 +1,113 @@
+"""
+Bulk patching of late-arriving actuals.
+
+``actual_drawal`` and ``actual_generation`` arrive days after the schedules
+they belong to. ``apply_actuals`` takes a batch of ``(entity, date, block,
+actual)`` values, looks up exactly those schedule rows (one condition per
+entity and day, naming its blocks), and writes the values that changed with ``bulk_update`` (batched
+``UPDATE ... CASE`` statements). Keys without a schedule row are reported
+as missing rather than created, since a block has no schedule to go with
+them. Keys dated before the archive boundary are patched in the archive
+tier, where their rows live. Only the slot and day-profile rows of the
+updated blocks are refreshed.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import tiering
+from .merge import refresh_rollups
+from .models import LoadSchedule, GenerationSchedule
+
+UPDATE_BATCH = 1000
+
+# (entity, date) conditions ORed into one lookup query; SQLite limits the expression depth
+KEY_QUERY_BATCH = 500
+
+# Keys of missing rows returned to the caller
+MAX_REPORTED_MISSING = 100
+
+# schedule model -> (entity field, actual field)
+ACTUAL_FIELDS = {
+    LoadSchedule: ('discom', 'actual_drawal'),
+    GenerationSchedule: ('generator', 'actual_generation'),
+}
+
+
+def _stored_rows(model, keys, using='default'):
+    """``{(entity_id, date, block): row}`` for the stored rows of ``keys``, and no others."""
+    entity_id = f'{ACTUAL_FIELDS[model][0]}_id'
+    days = {}
+    for entity, day, block in keys:
+        days.setdefault((entity, day), set()).add(block)
+    days = list(days.items())
+    rows = {}
+    for start in range(0, len(days), KEY_QUERY_BATCH):
+        condition = Q()
+        for (entity, day), blocks in days[start:start + KEY_QUERY_BATCH]:
+            condition |= Q(**{entity_id: entity, 'date': day, 'block_number__in': blocks})
+        for row in model.objects.using(using).filter(condition):
+            rows[getattr(row, entity_id), row.date, row.block_number] = row
+    return rows
+
+
+def _split_archived(model, values, using):
+    """``(hot, archived)`` values: keys before the archive boundary live in the archive."""
+    boundary = tiering.archive_boundary(model) if using == 'default' else None
+    if boundary is None:
+        return values, {}
+    hot, archived = {}, {}
+    for key, value in values.items():
+        (archived if key[1] < boundary else hot)[key] = value
+    return hot, archived
+
+
+def apply_actuals(model, objs, batch_size=UPDATE_BATCH, using='default'):
+    """
+    Set the actuals carried by ``objs`` (unsaved ``model`` instances holding
+    the entity id, date, block_number and actual) on the stored rows.
+    Returns ``{'updated', 'unchanged', 'missing'}`` and up to
+    MAX_REPORTED_MISSING ``missing_keys`` as ``[entity_id, date, block]``.
+    """
+    entity, actual = ACTUAL_FIELDS[model]
+    entity_id = f'{entity}_id'
+    # Last value wins for a key sent twice
+    values = {(getattr(obj, entity_id), obj.date, obj.block_number): getattr(obj, actual) for obj in objs}
+    values, archived = _split_archived(model, values, using)
+    result = _apply(model, values, batch_size, using)
+    if archived:
+        archived_result = _apply(model, archived, batch_size, tiering.archive_alias())
+        for name in ('updated', 'unchanged', 'missing'):
+            result[name] += archived_result[name]
+        result['missing_keys'] = (result['missing_keys'] + archived_result['missing_keys'])[:MAX_REPORTED_MISSING]
+    return result
+
+
+def _apply(model, values, batch_size, using):
+    _, actual = ACTUAL_FIELDS[model]
+    result = {'updated': 0, 'unchanged': 0, 'missing': 0, 'missing_keys': []}
+    if not values:
+        return result
+
+    rows = _stored_rows(model, values, using)
+
+    changed = []
+    now = timezone.now()
+    for key, value in values.items():
+        row = rows.get(key)
+        if row is None:
+            result['missing'] += 1
+            if len(result['missing_keys']) < MAX_REPORTED_MISSING:
+                result['missing_keys'].append([key[0], key[1].isoformat(), key[2]])
+        elif getattr(row, actual) == value:
+            result['unchanged'] += 1
+        else:
+            setattr(row, actual, value)
+            row.updated_at = now
+            changed.append(row)
+
+    with transaction.atomic(using=using):
+        model.objects.using(using).bulk_update(changed, [actual, 'updated_at'], batch_size=batch_size)
+        refresh_rollups(model, changed, using)
+    result['updated'] = len(changed)
+    return result
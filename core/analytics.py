@@ -0,0 +1,257 @@
+"""
+Optional columnar analytics sidecar.
+
+When ANALYTICS_DB_PATH is set and the ``duckdb`` package is installed,
+MarketData, LoadSchedule and GenerationSchedule are mirrored into a DuckDB
+file. ``sync`` copies the rows changed since the last sync (by
+``updated_at``, from both tiers on the first run), so it is cheap to call
+after every ingest. Writers stamp ``updated_at`` before they commit, so a
+row can become visible after a sync has moved the watermark past it; each
+sync therefore re-reads SYNC_LAG seconds below the watermark and the
+upsert absorbs the repeats. Range aggregations in ``market_aggregation``, the
+analytics endpoints and NLPAgent ask this module first; every query helper
+returns None when the sidecar is disabled, not built yet or busy, and the
+caller falls back to the ORM.
+
+DuckDB lets one process write a file or several read it, so readers open a
+short read-only connection per query and a sync that finds the file in use
+is skipped; the next one catches up from the stored watermark. Each sync
+first drops the keys deleted since the watermark (see core/changes.py); rows
+moved by ``archive_data`` stay, since the sidecar serves both tiers. Nothing
+syncs on API writes, so queries answer only while the watermark covers the
+newest write or delete on the primary, and fall back to the ORM otherwise.
+"""
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Max
+
+from . import changes, metrics, tiering
+from .models import MarketData, LoadSchedule, GenerationSchedule
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH = 10000
+
+# sidecar table -> (model, key columns)
+TABLES = {
+    'market_data': (MarketData, ('product_id', 'timestamp', 'block_number')),
+    'load_schedule': (LoadSchedule, ('discom_id', 'date', 'block_number')),
+    'generation_schedule': (GenerationSchedule, ('generator_id', 'date', 'block_number')),
+}
+
+# One sync at a time per process
+_sync_lock = threading.Lock()
+
+
+def enabled():
+    return duckdb is not None and bool(getattr(settings, 'ANALYTICS_DB_PATH', None))
+
+
+def _columns(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def _column_type(field):
+    if isinstance(field, models.ForeignKey):
+        return 'BIGINT'
+    if isinstance(field, models.DecimalField):
+        return f'DECIMAL({min(field.max_digits, 38)}, {field.decimal_places})'
+    if isinstance(field, models.DateTimeField):
+        return 'TIMESTAMPTZ'
+    if isinstance(field, models.DateField):
+        return 'DATE'
+    if isinstance(field, (models.BigIntegerField, models.IntegerField)):
+        return 'BIGINT'
+    return 'VARCHAR'
+
+
+def _create_tables(con):
+    con.execute('CREATE TABLE IF NOT EXISTS sync_state (name VARCHAR PRIMARY KEY, synced_until TIMESTAMPTZ)')
+    for name, (model, key) in TABLES.items():
+        columns = ', '.join(f'{field.attname} {_column_type(field)}' for field in _columns(model))
+        con.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns}, PRIMARY KEY ({', '.join(key)}))")
+
+
+def _sources(model, since):
+    """Both tiers, limited to the rows updated since the watermark after the first sync."""
+    queryset = model.objects.using('default').order_by()
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since - timedelta(seconds=settings.SYNC_LAG))
+    return tiering.tiers(queryset)
+
+
+def _drop_deleted(con, name, model, key, since):
+    """Delete the keys removed since the watermark; returns the newest deletion time."""
+    newest = None
+    rows = []
+    for deleted in changes.deleted_since(model, since):
+        rows.append([deleted.entity_id, deleted.timestamp if 'timestamp' in key else deleted.date, deleted.block_number])
+        newest = deleted.deleted_at
+    if rows:
+        con.executemany(f"DELETE FROM {name} WHERE {' AND '.join(f'{column} = ?' for column in key)}", rows)
+    return newest
+
+
+def sync(rebuild=False, batch_size=SYNC_BATCH):
+    """
+    Copy rows changed since the last sync into the sidecar. Returns
+    ``{table: rows copied}``. Raises ImportError without duckdb and
+    ``duckdb.Error`` if the file is in use.
+    """
+    if duckdb is None:
+        raise ImportError('The analytics sidecar needs the duckdb package')
+    path = settings.ANALYTICS_DB_PATH
+    if rebuild and os.path.exists(path):
+        os.remove(path)
+
+    copied = {}
+    with _sync_lock:
+        con = duckdb.connect(str(path))
+        try:
+            _create_tables(con)
+            for name, (model, key) in TABLES.items():
+                state = con.execute('SELECT synced_until FROM sync_state WHERE name = ?', [name]).fetchone()
+                since = state[0] if state else None
+                # Deletes first: a key written again after its delete is re-read below.
+                # A first sync has nothing to drop, but its watermark covers earlier deletes
+                if since is not None:
+                    deleted = _drop_deleted(con, name, model, key, since)
+                else:
+                    deleted = changes.last_deleted(model)
+                columns = [field.attname for field in _columns(model)]
+                insert = (
+                    f"INSERT OR REPLACE INTO {name} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join(['?'] * len(columns))})"
+                )
+                # Rows within SYNC_LAG of the watermark are copied again; the upsert makes that harmless
+                updated_index = columns.index('updated_at')
+                newest = tiering.COMBINE[Max](since, deleted)
+                count = 0
+                for queryset in _sources(model, since):
+                    batch = []
+                    for row in queryset.values_list(*columns).iterator(chunk_size=batch_size):
+                        batch.append(row)
+                        if newest is None or row[updated_index] > newest:
+                            newest = row[updated_index]
+                        if len(batch) >= batch_size:
+                            con.executemany(insert, batch)
+                            count += len(batch)
+                            batch = []
+                    if batch:
+                        con.executemany(insert, batch)
+                        count += len(batch)
+                if newest is not None:
+                    con.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', [name, newest])
+                copied[name] = count
+        finally:
+            con.close()
+    return copied
+
+
+def sync_after_write():
+    """Bring the sidecar up to date after an ingest; never fails the ingest."""
+    if not enabled():
+        return None
+    try:
+        return sync()
+    except Exception:
+        logger.warning('Analytics sync skipped; the next one will catch up', exc_info=True)
+        return None
+
+
+def _query(table, sql, params):
+    """Rows from the sidecar, or None if it cannot answer or misses later changes to ``table``."""
+    if not enabled() or not os.path.exists(settings.ANALYTICS_DB_PATH):
+        return None
+    try:
+        con = duckdb.connect(str(settings.ANALYTICS_DB_PATH), read_only=True)
+        try:
+            state = con.execute('SELECT synced_until FROM sync_state WHERE name = ?', [table]).fetchone()
+            model, _ = TABLES[table]
+            rows = None if changes.is_stale(model, state and state[0]) else con.execute(sql, params).fetchall()
+        finally:
+            con.close()
+    except duckdb.Error:
+        logger.debug('Analytics query fell back to the database', exc_info=True)
+        rows = None
+    if rows is None:
+        metrics.record_cache('analytics', False)
+        return None
+    metrics.record_cache('analytics', True)
+    return rows
+
+
+def _market_filter(start_date, end_date, product_id):
+    where = 'trade_date BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)'
+    params = [str(start_date), str(end_date)]
+    if product_id is not None:
+        where += ' AND product_id = ?'
+        params.append(product_id)
+    return where, params
+
+
+def market_daily(start_date, end_date, product_id=None):
+    """Per day and product: total_volume, turnover, min_price, max_price."""
+    where, params = _market_filter(start_date, end_date, product_id)
+    rows = _query(
+        'market_data',
+        'SELECT trade_date, product_id, SUM(mcv), SUM(turnover), MIN(mcp), MAX(mcp) '
+        f'FROM market_data WHERE {where} GROUP BY trade_date, product_id ORDER BY trade_date, product_id',
+        params,
+    )
+    if rows is None:
+        return None
+    return [
+        {'date': day, 'product': product, 'total_volume': volume, 'turnover': turnover,
+         'min_price': low, 'max_price': high}
+        for day, product, volume, turnover, low, high in rows
+    ]
+
+
+def market_monthly(start_date, end_date, product_id=None):
+    """Per month and product: the market_daily figures plus the number of days."""
+    where, params = _market_filter(start_date, end_date, product_id)
+    rows = _query(
+        'market_data',
+        "SELECT CAST(date_trunc('month', trade_date) AS DATE), product_id, SUM(mcv), SUM(turnover), MIN(mcp), MAX(mcp), "
+        f'COUNT(DISTINCT trade_date) FROM market_data WHERE {where} GROUP BY 1, 2 ORDER BY 1, 2',
+        params,
+    )
+    if rows is None:
+        return None
+    return [
+        {'month': month, 'product': product, 'total_volume': volume, 'turnover': turnover,
+         'min_price': low, 'max_price': high, 'days': days}
+        for month, product, volume, turnover, low, high, days in rows
+    ]
+
+
+def market_totals(start_date, end_date, product_id=None):
+    """rows, total_volume and turnover over a range, as ``tiering.aggregate`` returns them."""
+    where, params = _market_filter(start_date, end_date, product_id)
+    rows = _query('market_data', f'SELECT COUNT(*), SUM(mcv), SUM(turnover) FROM market_data WHERE {where}', params)
+    if rows is None:
+        return None
+    count, volume, turnover = rows[0]
+    return {'rows': count, 'total_volume': volume, 'turnover': turnover}
+
+
+def schedule_total(model, column, start_date, end_date):
+    """SUM(``column``) of a schedule table over a date range."""
+    table = next(name for name, (table_model, _) in TABLES.items() if table_model is model)
+    rows = _query(
+        table,
+        f'SELECT SUM({column}) FROM {table} WHERE date BETWEEN CAST(? AS DATE) AND CAST(? AS DATE)',
+        [str(start_date), str(end_date)],
+    )
+    return None if rows is None else rows[0][0] or 0
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import changes, profiles, refdata, slots, slow_queries, sqlite
+        from .models import MarketData, LoadSchedule, GenerationSchedule, Product, Discom, Generator
+        connection_created.connect(sqlite.configure, dispatch_uid='core.sqlite')
+        connection_created.connect(slow_queries.install, dispatch_uid='core.slow_queries')
+        for model in (MarketData, LoadSchedule, GenerationSchedule):
+            post_save.connect(slots.mirror_saved, sender=model, dispatch_uid=f'core.slots.{model.__name__}')
+            post_delete.connect(slots.remove_deleted, sender=model, dispatch_uid=f'core.slots.delete.{model.__name__}')
+            post_delete.connect(changes.record_deleted, sender=model, dispatch_uid=f'core.changes.{model.__name__}')
+        for model in (LoadSchedule, GenerationSchedule):
+            post_save.connect(profiles.update_saved_block, sender=model, dispatch_uid=f'core.profiles.{model.__name__}')
+            post_delete.connect(profiles.clear_deleted_block, sender=model, dispatch_uid=f'core.profiles.delete.{model.__name__}')
+        for model, cache in ((Product, refdata.products), (Discom, refdata.discoms), (Generator, refdata.generators)):
+            post_save.connect(cache.invalidate, sender=model, dispatch_uid=f'core.refdata.save.{model.__name__}')
+            post_delete.connect(cache.invalidate, sender=model, dispatch_uid=f'core.refdata.delete.{model.__name__}')
@@ -0,0 +1,223 @@
+"""
+Batch upserts of block rows over the API.
+
+A batch arrives as a JSON array (or ``{"rows": [...]}``), NDJSON or CSV
+and is validated in one pass: reference names resolve through the
+reference cache and values are checked with serializer fields, without a
+query per row. A batch with any invalid row is rejected as a whole with
+the errors of every row; otherwise it is applied with ``merge_rows`` on
+the model's ``unique_together`` key in a single transaction.
+
+Actuals batches carry only the key and the actual value, and patch the
+schedule rows that already exist (see core/actuals.py).
+
+The analytics sidecar and the snapshot are not refreshed here: a sync
+holds the DuckDB write lock and a snapshot refresh holds its file lock
+for as long as they run, which a request should not wait on. They catch
+up on the next ``sync_analytics``, ``build_snapshot`` or ingest command
+run.
+"""
+import codecs
+import csv
+import json
+import time
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import actuals, metrics, refdata, slots
+from .market_ingest import block_timestamp
+from .merge import merge_rows
+from .models import MarketData, LoadSchedule, GenerationSchedule
+
+# Errors reported for a rejected batch, so a bad file does not produce a huge response
+MAX_REPORTED_ERRORS = 100
+
+
+class NDJSONParser(BaseParser):
+    """One JSON object per line."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        rows = []
+        for number, line in enumerate(codecs.getreader('utf-8')(stream), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number}: {exc}')
+        return rows
+
+
+class CSVParser(BaseParser):
+    """A header row naming the fields, then one row per block."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+        # Empty cells are missing values, as in JSON
+        return [{key: value for key, value in row.items() if value != ''} for row in reader]
+
+
+def _decimal(max_digits, **kwargs):
+    return serializers.DecimalField(max_digits=max_digits, decimal_places=2, **kwargs)
+
+
+# model -> ingest metrics table label
+LABELS = {
+    MarketData: 'market_data',
+    LoadSchedule: 'load_schedule',
+    GenerationSchedule: 'generation_schedule',
+}
+
+# model -> (reference field, value fields)
+SPECS = {
+    MarketData: ('product', {
+        'mcp': _decimal(10),
+        'mcv': _decimal(15),
+        'purchase_bid_volume': _decimal(15, default=0),
+        'sell_bid_volume': _decimal(15, default=0),
+    }),
+    LoadSchedule: ('discom', {
+        'scheduled_drawal': _decimal(15),
+        'actual_drawal': _decimal(15, allow_null=True, default=None),
+    }),
+    GenerationSchedule: ('generator', {
+        'scheduled_generation': _decimal(15),
+        'actual_generation': _decimal(15, allow_null=True, default=None),
+    }),
+}
+
+# schedule model -> value fields of an actuals batch
+ACTUAL_SPECS = {
+    LoadSchedule: {'actual_drawal': _decimal(15, allow_null=True)},
+    GenerationSchedule: {'actual_generation': _decimal(15, allow_null=True)},
+}
+
+TIMESTAMP_FIELD = serializers.DateTimeField()
+DATE_FIELD = serializers.DateField()
+BLOCK_FIELD = serializers.IntegerField(min_value=1, max_value=slots.BLOCKS_PER_DAY)
+
+
+def _run(field, row, name, errors, required=True):
+    if name not in row:
+        if field.default is not serializers.empty:
+            return field.default
+        if required:
+            errors[name] = 'This field is required.'
+        return None
+    try:
+        return field.run_validation(row[name])
+    except serializers.ValidationError as exc:
+        errors[name] = ' '.join(str(detail) for detail in exc.detail)
+        return None
+
+
+def _reference_id(reference, row, errors):
+    # A name ("DAM", "UPCL") or a primary key in <reference>_id
+    cache = refdata.CACHES[reference]
+    if reference in row:
+        pk = cache.id_for(str(row[reference]).strip())
+        if pk is None:
+            errors[reference] = f"Unknown {reference} '{row[reference]}'."
+        return pk
+    if f'{reference}_id' in row:
+        pk = _run(serializers.IntegerField(), row, f'{reference}_id', errors)
+        if pk is not None and cache.get(pk) is None:
+            errors[f'{reference}_id'] = f'Unknown {reference} id {pk}.'
+        return pk
+    errors[reference] = 'This field is required.'
+    return None
+
+
+def _block_fields(model, row, errors):
+    """The key columns besides the reference: (timestamp, block) or (date, block)."""
+    block_number = _run(BLOCK_FIELD, row, 'block_number', errors, required=model is not MarketData)
+    if model is not MarketData:
+        return {'date': _run(DATE_FIELD, row, 'date', errors), 'block_number': block_number}
+
+    timestamp = _run(TIMESTAMP_FIELD, row, 'timestamp', errors)
+    if timestamp is None:
+        return {}
+    derived = slots.block_for(timestamp)
+    if block_number is not None and block_number != derived:
+        errors['block_number'] = f'Timestamp falls in block {derived}.'
+    # Snapped to the block start, as the feed ingest does, so a block has one key
+    return {
+        'timestamp': block_timestamp(slots.market_day(timestamp), derived),
+        'block_number': derived,
+    }
+
+
+def validate(model, rows, value_fields=None):
+    """Build ``model`` objects from ``rows``; returns ``(objects, errors)``."""
+    reference, default_fields = SPECS[model]
+    value_fields = default_fields if value_fields is None else value_fields
+    objs = []
+    errors = []
+    for index, row in enumerate(rows):
+        row_errors = {}
+        if not isinstance(row, dict):
+            errors.append({'row': index, 'errors': {'non_field_errors': 'Expected an object.'}})
+            continue
+        values = {f'{reference}_id': _reference_id(reference, row, row_errors)}
+        values.update(_block_fields(model, row, row_errors))
+        for name, field in value_fields.items():
+            values[name] = _run(field, row, name, row_errors)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+        else:
+            objs.append(model(**values))
+    return objs, errors
+
+
+def rows_from(data):
+    """The list of rows in a parsed request body."""
+    if isinstance(data, dict) and 'rows' in data:
+        data = data['rows']
+    if not isinstance(data, list):
+        raise ParseError('Expected a list of rows or an object with a "rows" list.')
+    return data
+
+
+def _check_size(rows):
+    limit = getattr(settings, 'BULK_UPSERT_MAX_ROWS', 50000)
+    if len(rows) > limit:
+        raise ParseError(f'A batch may hold at most {limit} rows; got {len(rows)}.')
+
+
+def upsert(model, rows):
+    """
+    Validate and merge one batch. Returns ``(result, errors)``: the merge
+    counts, or None and the row errors if the batch was rejected.
+    """
+    _check_size(rows)
+    started = time.perf_counter()
+    objs, errors = validate(model, rows)
+    if errors:
+        return None, errors[:MAX_REPORTED_ERRORS]
+    result = merge_rows(model, objs)
+    if objs:
+        last = objs[-1]
+        last_timestamp = last.timestamp if model is MarketData else block_timestamp(last.date, last.block_number)
+        metrics.record_ingest(LABELS[model], len(objs), time.perf_counter() - started, last_timestamp)
+    result['rows'] = len(objs)
+    return result, None
+
+
+def patch_actuals(model, rows):
+    """
+    Validate one batch of actuals and apply it to the stored schedule rows.
+    Returns ``(result, errors)`` like ``upsert``, with the counts of
+    ``apply_actuals``.
+    """
+    _check_size(rows)
+    objs, errors = validate(model, rows, ACTUAL_SPECS[model])
+    if errors:
+        return None, errors[:MAX_REPORTED_ERRORS]
+    result = actuals.apply_actuals(model, objs)
+    result['rows'] = len(objs)
+    return result, None
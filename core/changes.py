@@ -0,0 +1,70 @@
+"""
+Change tracking for the read stores derived from the block tables.
+
+The analytics sidecar and the mapped snapshot copy MarketData, LoadSchedule
+and GenerationSchedule rows by ``updated_at`` and remember the newest one
+they copied. ``last_change`` is the newest write or delete on the primary;
+while it is later than a store's watermark the store is stale and readers
+use the ORM instead. Deletes leave no row to find by ``updated_at``, so the
+post_delete receiver records each deleted key as a DeletedBlock for the
+next sync or refresh to drop. Archive moves are not recorded: both stores
+hold the two tiers.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import tiering
+from .models import DeletedBlock, MarketData
+
+# model name -> entity id attribute of the key
+ENTITY_FIELDS = {'MarketData': 'product_id', 'LoadSchedule': 'discom_id', 'GenerationSchedule': 'generator_id'}
+
+
+def tracked():
+    from . import analytics, snapshot
+    return analytics.enabled() or snapshot.enabled()
+
+
+def record_deleted(sender, instance, **kwargs):
+    """post_delete receiver keeping a tombstone of the deleted key on the primary."""
+    if tiering.is_moving() or not tracked():
+        return
+    DeletedBlock.objects.using('default').create(
+        table=sender._meta.db_table,
+        entity_id=getattr(instance, ENTITY_FIELDS[sender.__name__]),
+        date=instance.trade_date if sender is MarketData else instance.date,
+        block_number=instance.block_number,
+        timestamp=instance.timestamp if sender is MarketData else None,
+    )
+
+
+def deleted_since(model, since):
+    """Keys of ``model`` deleted from SYNC_LAG seconds before ``since`` on."""
+    return DeletedBlock.objects.using('default').filter(
+        table=model._meta.db_table,
+        deleted_at__gte=since - timedelta(seconds=settings.SYNC_LAG),
+    ).order_by('deleted_at')
+
+
+def last_deleted(model):
+    """When a row of ``model`` was last deleted, or None."""
+    return DeletedBlock.objects.using('default').filter(
+        table=model._meta.db_table
+    ).aggregate(newest=Max('deleted_at'))['newest']
+
+
+def last_change(model):
+    """When ``model`` was last written or had a row deleted, in either tier."""
+    newest = last_deleted(model)
+    written = tiering.aggregate(
+        tiering.tiers(model.objects.using('default').order_by()), newest=Max('updated_at')
+    )['newest']
+    return tiering.COMBINE[Max](newest, written)
+
+
+def is_stale(model, synced_until):
+    """Whether a store synced up to ``synced_until`` misses later changes."""
+    newest = last_change(model)
+    return newest is not None and (synced_until is None or newest > synced_until)
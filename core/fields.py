@@ -0,0 +1,121 @@
+import struct
+from base64 import b64encode
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core import exceptions
+from django.db import models
+
+
+class FixedPointField(models.BigIntegerField):
+    """
+    A decimal quantity stored as a scaled integer, e.g. rupees as paise
+    (``decimal_places=2``) or MWh as kWh (``decimal_places=3``).
+
+    Python code sees ``Decimal`` values; the database only stores and sums
+    integers, so aggregates need no per-row decimal conversion.
+    """
+
+    def __init__(self, *args, decimal_places=2, **kwargs):
+        self.decimal_places = decimal_places
+        self.scale = 10 ** decimal_places
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['decimal_places'] = self.decimal_places
+        return name, path, args, kwargs
+
+    def to_scaled(self, value):
+        if value is None:
+            return None
+        if isinstance(value, float):
+            value = Decimal(repr(value))
+        try:
+            value = Decimal(value)
+        except (TypeError, ValueError, ArithmeticError):
+            raise exceptions.ValidationError(
+                f"'{value}' value must be a decimal number.", code='invalid'
+            )
+        return int((value * self.scale).to_integral_value(rounding=ROUND_HALF_UP))
+
+    def from_scaled(self, value):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-self.decimal_places)
+
+    def from_db_value(self, value, expression, connection):
+        return self.from_scaled(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        return self.from_scaled(self.to_scaled(value))
+
+    def get_prep_value(self, value):
+        if hasattr(value, 'resolve_expression'):
+            return value
+        return self.to_scaled(value)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return '' if value is None else str(value)
+
+
+class BlockArrayField(models.BinaryField):
+    """
+    A fixed-length list of per-block decimals (``None`` for missing values),
+    packed into one blob of little-endian int64 fixed-point numbers.
+    """
+    MISSING = -2 ** 63
+
+    def __init__(self, *args, length=96, decimal_places=3, **kwargs):
+        self.length = length
+        self.decimal_places = decimal_places
+        self.scale = 10 ** decimal_places
+        self.format = f'<{length}q'
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['length'] = self.length
+        kwargs['decimal_places'] = self.decimal_places
+        return name, path, args, kwargs
+
+    def pack(self, values):
+        values = list(values)
+        if len(values) != self.length:
+            raise exceptions.ValidationError(
+                f'Expected {self.length} values, got {len(values)}.', code='invalid'
+            )
+        scaled = []
+        for value in values:
+            if value is None:
+                scaled.append(self.MISSING)
+            else:
+                if isinstance(value, float):
+                    value = Decimal(repr(value))
+                scaled.append(int((Decimal(value) * self.scale).to_integral_value(rounding=ROUND_HALF_UP)))
+        return struct.pack(self.format, *scaled)
+
+    def unpack(self, data):
+        return [
+            None if value == self.MISSING else Decimal(value).scaleb(-self.decimal_places)
+            for value in struct.unpack(self.format, bytes(data))
+        ]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.unpack(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, list):
+            return value
+        return self.unpack(super().to_python(value))
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return self.pack(value)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return '' if value is None else b64encode(self.pack(value)).decode('ascii')
@@ -0,0 +1,434 @@
+"""
+Incremental, resumable CSV ingest.
+
+Every ingested file has an ``IngestLedger`` row holding the number of bytes
+already committed to the database and the SHA-256 of the header line and
+the last TAIL_WINDOW bytes before that offset. A run checks the hash (so a
+rewritten file is not mistaken for an appended one) without reading the
+rest of the committed prefix, skips files that have not grown, and reads
+appended files from the stored offset. Rows are inserted in batches and each batch commits together with
+the ledger update, so a crash leaves the database and the ledger in step
+and the next run carries on after the last committed batch.
+
+Batches are inserted with COPY on PostgreSQL and bulk_create elsewhere.
+Sources that feed a block model with a unique key (``market_data``) are
+written with the staging merge instead, so overlapping files update rows,
+and actuals files (``load_actuals``, ``generation_actuals``) patch the
+schedule rows they refer to.
+Only complete lines are consumed: a trailing line without a newline is
+taken to be still being written and is left for the next run, unless the
+file has not changed size since the previous run. Quoted fields must not
+contain newlines.
+
+``.csv.gz`` and ``.csv.zst`` files and the CSV members of ``.zip`` bundles
+are decompressed as they are read, never to disk. Their ledger offsets count
+decompressed bytes, and a bundle read to the end is not opened again until
+its size changes.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import os
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import actuals, market_ingest, metrics, pgcopy, refdata, slots
+from .merge import merge_rows, refresh_rollups
+from .models import (
+    IngestLedger, IEXData, LoadData, GenerationData, MarketData, LoadSchedule, GenerationSchedule
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BATCH_SIZE = 1000
+HASH_CHUNK = 1024 * 1024
+TAIL_WINDOW = 64 * 1024
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+
+class FileChanged(Exception):
+    """The file no longer starts with the bytes that were ingested from it."""
+
+
+class CsvInput:
+    """One CSV stream: a plain file, a compressed file or a member of a zip bundle."""
+
+    def __init__(self, path, member=None):
+        self.path = os.path.abspath(path)
+        self.member = member
+        self.key = f'{self.path}::{member}' if member else self.path
+        self.size = os.path.getsize(self.path)
+        # Only plain files are appended to; compressed ones are complete once readable
+        self.growing = member is None and not self.path.endswith(COMPRESSED_SUFFIXES)
+
+    def __str__(self):
+        return self.key
+
+    @contextmanager
+    def open(self):
+        if self.member:
+            with zipfile.ZipFile(self.path) as bundle, bundle.open(self.member) as stream:
+                yield stream
+        elif self.path.endswith('.gz'):
+            with gzip.open(self.path, 'rb') as stream:
+                yield stream
+        elif self.path.endswith('.zst'):
+            if zstandard is None:
+                raise ImportError(f"Reading {self.path} needs the zstandard package")
+            with open(self.path, 'rb') as file:
+                yield io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(file))
+        else:
+            with open(self.path, 'rb') as stream:
+                yield stream
+
+
+class _Tail:
+    """The bytes from ``start`` up to the current offset, trimmed to the last TAIL_WINDOW."""
+
+    def __init__(self, start):
+        self.start = start
+        self.data = bytearray()
+
+    def add(self, chunk):
+        self.data += chunk
+        if len(self.data) > 2 * TAIL_WINDOW:
+            self.trim()
+
+    def trim(self):
+        excess = len(self.data) - TAIL_WINDOW
+        if excess > 0:
+            del self.data[:excess]
+            self.start += excess
+
+    def digest(self, header):
+        return hashlib.sha256(header + self.data).hexdigest()
+
+
+def _skip(stream, current, position):
+    """Move ``stream`` forward from byte ``current`` to ``position``."""
+    if stream.seekable():
+        stream.seek(position)
+        return
+    remaining = position - current
+    while remaining > 0:
+        chunk = stream.read(min(HASH_CHUNK, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+
+
+def _read_tail(stream, length, hasher, tail):
+    remaining = length
+    while remaining:
+        chunk = stream.read(min(HASH_CHUNK, remaining))
+        if not chunk:
+            break
+        hasher.update(chunk)
+        tail.add(chunk)
+        remaining -= len(chunk)
+
+
+def _parse_line(fieldnames, line):
+    values = next(csv.reader([line.decode('utf-8-sig')]), [])
+    return dict(zip(fieldnames, values))
+
+
+def build_iex_data(row):
+    return IEXData(
+        timestamp=datetime.fromisoformat(row['timestamp']),
+        price=row['price'],
+        volume=row['volume']
+    )
+
+
+def build_load_data(row):
+    return LoadData(
+        timestamp=datetime.fromisoformat(row['timestamp']),
+        load_value=row['load_value'],
+        region=row['region']
+    )
+
+
+def build_generation_data(row):
+    return GenerationData(
+        timestamp=datetime.fromisoformat(row['timestamp']),
+        generation_value=row['generation_value'],
+        fuel_type=row['fuel_type'],
+        region=row['region']
+    )
+
+
+def _field(row, *names, default=None):
+    """``(name, value)`` of the first of ``names`` with a value; ValueError naming them if none has."""
+    for name in names:
+        if row.get(name) not in (None, ''):
+            return name, row[name]
+    if default is None:
+        raise ValueError(f"Missing {' or '.join(names)}")
+    return names[0], default
+
+
+def _decimal_field(row, *names, default=None):
+    name, value = _field(row, *names, default=default)
+    try:
+        return Decimal(value)
+    except ArithmeticError:
+        raise ValueError(f"Invalid {name} '{value}'")
+
+
+def build_market_data(row):
+    """
+    MarketData straight from an exchange feed row: the block is derived from
+    the timestamp and the product is read from the ``product`` column. The
+    feed's ``price``/``volume`` names are accepted for ``mcp``/``mcv``.
+    Raises ValueError naming the missing or malformed field.
+    """
+    _, value = _field(row, 'timestamp')
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}'")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    block_number = slots.block_for(timestamp)
+    return MarketData(
+        product_id=market_ingest.product_id(row.get('product')),
+        # Snapped to the block start so every row of a block shares one key
+        timestamp=market_ingest.block_timestamp(slots.market_day(timestamp), block_number),
+        block_number=block_number,
+        mcp=_decimal_field(row, 'mcp', 'price'),
+        mcv=_decimal_field(row, 'mcv', 'volume'),
+        purchase_bid_volume=_decimal_field(row, 'purchase_bid_volume', default=0),
+        sell_bid_volume=_decimal_field(row, 'sell_bid_volume', default=0),
+    )
+
+
+def _reference_id(field, name):
+    pk = refdata.CACHES[field].id_for((name or '').strip())
+    if pk is None:
+        raise ValueError(f"Unknown {field} '{name}'")
+    return pk
+
+
+def _actual(value):
+    return Decimal(value) if value not in (None, '') else None
+
+
+def build_load_actual(row):
+    """A LoadSchedule key and its actual drawal, to patch the stored block."""
+    return LoadSchedule(
+        discom_id=_reference_id('discom', row.get('discom')),
+        date=date.fromisoformat(row['date']),
+        block_number=int(row['block_number']),
+        actual_drawal=_actual(row['actual_drawal']),
+    )
+
+
+def build_generation_actual(row):
+    return GenerationSchedule(
+        generator_id=_reference_id('generator', row.get('generator')),
+        date=date.fromisoformat(row['date']),
+        block_number=int(row['block_number']),
+        actual_generation=_actual(row['actual_generation']),
+    )
+
+
+# source name (file name prefix) -> (model, row builder, label)
+SOURCES = {
+    'iex_data': (IEXData, build_iex_data, 'IEX'),
+    'load_data': (LoadData, build_load_data, 'Load'),
+    'generation_data': (GenerationData, build_generation_data, 'Generation'),
+    'market_data': (MarketData, build_market_data, 'Market'),
+    'load_actuals': (LoadSchedule, build_load_actual, 'Load actuals'),
+    'generation_actuals': (GenerationSchedule, build_generation_actual, 'Generation actuals'),
+}
+
+# Sources whose batches patch existing rows instead of adding them; the
+# writer's counts are added up in the ingest result
+WRITERS = {
+    'load_actuals': lambda batch: actuals.apply_actuals(LoadSchedule, batch),
+    'generation_actuals': lambda batch: actuals.apply_actuals(GenerationSchedule, batch),
+}
+
+# Models with a unique block key, written with merge_rows rather than plain inserts
+MERGED_MODELS = (MarketData,)
+
+
+def replayable(source):
+    """
+    Whether a file of ``source`` can be ingested again from the start: merged
+    and patched rows are keyed, but the plain feed tables have no unique key
+    and would get every row twice.
+    """
+    return source in WRITERS or SOURCES[source][0] in MERGED_MODELS
+
+
+def restart_hint(source):
+    """What to do about a FileChanged file of ``source``, for command output."""
+    if replayable(source):
+        return 'use --reset to ingest it again from the start'
+    return (f'{SOURCES[source][2]} rows have no unique key, so ingesting it again would duplicate them; '
+            'save new data under a new file name')
+
+
+def source_for(path):
+    """
+    The SOURCES entry a CSV belongs to, from its file name:
+    ``iex_data_2024-06.csv.gz`` -> ``'iex_data'``.
+    """
+    name = os.path.basename(path)
+    for suffix in COMPRESSED_SUFFIXES:
+        name = name.removesuffix(suffix)
+    if not name.endswith('.csv'):
+        return None
+    for source in SOURCES:
+        if name.startswith(source):
+            return source
+    return None
+
+
+def inputs_for(path):
+    """
+    ``(source, CsvInput)`` pairs for a data file: one for a plain or
+    compressed CSV, one per CSV member of a zip bundle. Members without a
+    recognised name take the bundle's source.
+    """
+    if path.endswith('.zip'):
+        bundle_source = source_for(path.removesuffix('.zip') + '.csv')
+        with zipfile.ZipFile(path) as bundle:
+            members = [info.filename for info in bundle.infolist() if not info.is_dir()]
+        for member in members:
+            source = source_for(member) or (bundle_source if member.endswith('.csv') else None)
+            if source:
+                yield source, CsvInput(path, member)
+        return
+    source = source_for(path)
+    if source:
+        yield source, CsvInput(path)
+
+
+def ingest_source(csv_input, source, batch_size=BATCH_SIZE):
+    """ingest_csv for one of the SOURCES, recording ingest metrics."""
+    model, build_object, _ = SOURCES[source]
+    started = time.perf_counter()
+    result = ingest_csv(csv_input, model, build_object, batch_size=batch_size, write=WRITERS.get(source))
+    if result['rows']:
+        last = result['last']
+        # Schedule blocks have no timestamp of their own
+        last_timestamp = last.timestamp if hasattr(last, 'timestamp') else market_ingest.block_timestamp(last.date, last.block_number)
+        metrics.record_ingest(source, result['rows'], time.perf_counter() - started, last_timestamp)
+    return result
+
+
+def ingest_csv(csv_input, model, build_object, batch_size=BATCH_SIZE, write=None):
+    """
+    Ingest the new lines of ``csv_input`` (a CsvInput or a path) as ``model``
+    rows built by ``build_object(record)``, or hand each batch to
+    ``write(batch)`` when given, adding up the counts it returns in
+    ``result['counts']``. Returns a dict with the number of
+    ``rows`` inserted, the byte offset the run ``started_at`` and the final
+    ``offset``, the last object inserted (``last``) and ``status``
+    (``'unchanged'``, ``'new'`` or ``'resumed'``). Raises FileChanged if the
+    file was rewritten, and ValueError naming the data row that cannot be
+    built; the batches before it stay committed.
+    """
+    if not isinstance(csv_input, CsvInput):
+        csv_input = CsvInput(csv_input)
+    size = csv_input.size
+    ledger = IngestLedger.objects.filter(path=csv_input.key).first()
+    if ledger is None:
+        ledger = IngestLedger(path=csv_input.key)
+        status = 'new'
+    else:
+        status = 'resumed'
+
+    result = {'rows': 0, 'started_at': ledger.offset, 'offset': ledger.offset, 'last': None, 'status': status,
+              'counts': {}}
+    if ledger.complete and size == ledger.size:
+        result['status'] = 'unchanged'
+        return result
+    if csv_input.growing and size < ledger.offset:
+        raise FileChanged(f"{csv_input} is shorter than the {ledger.offset} bytes already ingested")
+    # An unterminated last line is complete once the file stops growing
+    settled = not csv_input.growing or (ledger.pk is not None and size == ledger.size)
+
+    offset = ledger.offset
+    tail = None
+    batch = []
+
+    def commit(complete=False):
+        with transaction.atomic():
+            if write is not None:
+                for key, count in write(batch).items():
+                    if isinstance(count, int):
+                        result['counts'][key] = result['counts'].get(key, 0) + count
+            elif model in MERGED_MODELS:
+                # merge_rows refreshes the rollups itself
+                merge_rows(model, batch)
+            else:
+                pgcopy.bulk_insert(model, batch)
+                refresh_rollups(model, batch)
+            ledger.size = size
+            ledger.offset = offset
+            if tail is not None:
+                tail.trim()
+                ledger.hash_start = tail.start
+                ledger.content_hash = tail.digest(header)
+            ledger.rows += len(batch)
+            ledger.complete = complete
+            ledger.save()
+        result['rows'] += len(batch)
+        result['offset'] = offset
+        if batch:
+            result['last'] = batch[-1]
+        batch.clear()
+
+    with csv_input.open() as stream:
+        header = stream.readline()
+        if not header.endswith(b'\n') and not settled:
+            commit()
+            return result
+        fieldnames = next(csv.reader([header.decode('utf-8-sig')]))
+        if offset:
+            # Ledgers written before hash_start hash the whole prefix (start 0)
+            tail = _Tail(max(len(header), ledger.hash_start))
+            _skip(stream, len(header), tail.start)
+            hasher = hashlib.sha256(header)
+            _read_tail(stream, offset - tail.start, hasher, tail)
+            if hasher.hexdigest() != ledger.content_hash:
+                raise FileChanged(f"{csv_input} was rewritten since it was last ingested")
+            if csv_input.growing and size == offset:
+                result['status'] = 'unchanged'
+                return result
+        else:
+            offset = len(header)
+            tail = _Tail(offset)
+
+        for line in stream:
+            if not line.endswith(b'\n') and not settled:
+                break
+            tail.add(line)
+            offset += len(line)
+            if line.strip():
+                try:
+                    batch.append(build_object(_parse_line(fieldnames, line)))
+                except (KeyError, ValueError, ArithmeticError) as exc:
+                    reason = f"missing column {exc}" if isinstance(exc, KeyError) else exc
+                    raise ValueError(f"{csv_input} data row {ledger.rows + len(batch) + 1}: {reason}") from exc
+            if len(batch) >= batch_size:
+                commit()
+        # Commit even an empty batch so blank lines and the size are recorded
+        commit(complete=not csv_input.growing)
+
+    return result
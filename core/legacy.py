@@ -0,0 +1,246 @@
+"""
+Set-based conversion of the legacy feed tables into the block models.
+
+``IEXData``, ``LoadData`` and ``GenerationData`` rows are read in id
+ranges. Each range names the market days its rows fall on, and those whole
+days are converted from every legacy row, so a block whose readings span
+two ranges (or arrive in a later run) is averaged over all of them. The
+database derives the market day and block from the timestamp, maps region
+(and fuel type) to a DISCOM or generator with a CASE expression and
+averages readings that fall into the same block. Load and generation days
+are written with a single ``INSERT ... SELECT ... ON CONFLICT DO UPDATE``.
+IEX days come back as at most 96 averaged blocks a day, which are given
+their block-start timestamp and written with ``merge_rows``. No legacy row
+is loaded into Python. The last converted id of each table is kept in
+``IngestLedger`` under ``legacy:<table>``, and each chunk commits together
+with it, so an interrupted run resumes after the last committed chunk.
+
+Legacy rows carry one value per reading, so ``LoadData.load_value`` fills
+both ``scheduled_drawal`` and ``actual_drawal`` (likewise for generation),
+and IEX volumes become ``mcv`` with zero bid volumes.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Avg, Case, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, ExtractHour, ExtractMinute, Round, TruncDate
+from django.utils import timezone
+
+from . import refdata, slots
+from .market_ingest import block_timestamp
+from .merge import merge_rows
+from .models import (
+    IngestLedger, IEXData, LoadData, GenerationData, MarketData, LoadSchedule, GenerationSchedule
+)
+
+CHUNK_SIZE = 50000
+
+# legacy model -> (block model, value columns filled from the averaged reading)
+TARGETS = {
+    IEXData: (MarketData, ()),
+    LoadData: (LoadSchedule, ('scheduled_drawal', 'actual_drawal')),
+    GenerationData: (GenerationSchedule, ('scheduled_generation', 'actual_generation')),
+}
+
+
+def ledger_key(model):
+    return f'legacy:{model._meta.db_table}'
+
+
+def _block_expression():
+    # Cast: PostgreSQL's EXTRACT returns numeric, where / 15 would not truncate
+    minutes = Cast(ExtractHour('timestamp'), IntegerField()) * 60 + Cast(ExtractMinute('timestamp'), IntegerField())
+    return minutes / slots.BLOCK_MINUTES + 1
+
+
+def discom_mapping(overrides=None):
+    """
+    ``{region: discom_id}`` for the regions in LoadData. A region maps to
+    the DISCOM of that name, else to the only DISCOM in that region;
+    ``overrides`` (``{region: discom name}``) take precedence.
+    """
+    discoms = refdata.discoms.all()
+    mapping = {}
+    for region in LoadData.objects.order_by().values_list('region', flat=True).distinct():
+        matches = [d for d in discoms if d.name.lower() == region.lower()]
+        if not matches:
+            matches = [d for d in discoms if d.region.lower() == region.lower()]
+        if len(matches) == 1:
+            mapping[region] = matches[0].pk
+    for region, name in (overrides or {}).items():
+        mapping[region] = _resolve(refdata.discoms, name)
+    return mapping
+
+
+def generator_mapping(overrides=None):
+    """
+    ``{(fuel_type, region): generator_id}`` for the pairs in GenerationData.
+    A pair maps to the only generator with that fuel type located in that
+    region; ``overrides`` (``{(fuel_type, region): generator name}``) take
+    precedence.
+    """
+    generators = refdata.generators.all()
+    mapping = {}
+    pairs = GenerationData.objects.order_by().values_list('fuel_type', 'region').distinct()
+    for fuel_type, region in pairs:
+        matches = [
+            g for g in generators
+            if g.fuel_type.lower() == fuel_type.lower() and g.location.lower() == region.lower()
+        ]
+        if len(matches) == 1:
+            mapping[(fuel_type, region)] = matches[0].pk
+    for pair, name in (overrides or {}).items():
+        mapping[pair] = _resolve(refdata.generators, name)
+    return mapping
+
+
+def _resolve(cache, name):
+    pk = cache.id_for(name)
+    if pk is None:
+        raise ValueError(f"Unknown {cache.model_name.lower()} '{name}'")
+    return pk
+
+
+def _entity_case(model, mapping):
+    """CASE mapping legacy rows to an entity id, and the filter for mapped rows."""
+    if model is LoadData:
+        whens = [When(region=region, then=Value(pk)) for region, pk in mapping.items()]
+        mapped = Q(region__in=list(mapping))
+    else:
+        whens = [When(fuel_type=fuel, region=region, then=Value(pk)) for (fuel, region), pk in mapping.items()]
+        mapped = Q()
+        for fuel, region in mapping:
+            mapped |= Q(fuel_type=fuel, region=region)
+    if not whens:
+        return None, None
+    return Case(*whens, output_field=IntegerField()), mapped
+
+
+def _touched_days(model, lo, hi, using='default'):
+    """The market days of the legacy rows with ids in (lo, hi]."""
+    queryset = model.objects.using(using).filter(pk__gt=lo, pk__lte=hi).order_by()
+    return sorted(queryset.annotate(day=TruncDate('timestamp')).values_list('day', flat=True).distinct())
+
+
+def _days_filter(days):
+    """Timestamp ranges covering ``days`` (sorted), one per run of consecutive days."""
+    condition = Q()
+    first = last = None
+    for day in days + [None]:
+        if last is not None and day == last + timedelta(days=1):
+            last = day
+            continue
+        if first is not None:
+            condition |= Q(timestamp__gte=block_timestamp(first, 1),
+                           timestamp__lt=block_timestamp(last + timedelta(days=1), 1))
+        first = last = day
+    return condition
+
+
+def _select(model, days, mapping=None, using='default'):
+    """The legacy SELECT grouped by block over whole ``days``, or None if no row can be mapped."""
+    queryset = model.objects.using(using).filter(_days_filter(days)).order_by()
+    block = _block_expression()
+    if model is IEXData:
+        return queryset.annotate(
+            day=TruncDate('timestamp'), block=block,
+        ).values('day', 'block').annotate(
+            mcp=Round(Avg('price'), 2), mcv=Round(Avg('volume'), 2),
+        )
+    entity, mapped = _entity_case(model, mapping)
+    if entity is None:
+        return None
+    value = 'load_value' if model is LoadData else 'generation_value'
+    return queryset.filter(mapped).annotate(
+        entity=entity, day=TruncDate('timestamp'), block=block,
+    ).values('entity', 'day', 'block').annotate(value=Round(Avg(value), 2))
+
+
+def _insert_sql(model, select_sql, connection):
+    """
+    Wrap the grouped load or generation SELECT in an upsert into the block
+    model. created_at and updated_at are parameters of the outer SELECT.
+    """
+    qn = connection.ops.quote_name
+
+    def legacy(column):
+        return f'legacy.{qn(column)}'
+
+    target, value_columns = TARGETS[model]
+    table = qn(target._meta.db_table)
+    entity = 'discom_id' if model is LoadData else 'generator_id'
+    columns = {entity: legacy('entity'), 'date': legacy('day'), 'block_number': legacy('block')}
+    columns.update({column: legacy('value') for column in value_columns})
+    keys = (entity, 'date', 'block_number')
+    columns.update({'created_at': '%s', 'updated_at': '%s'})
+    updated = [column for column in columns if column not in keys and column != 'created_at']
+    return (
+        f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+        f"SELECT {', '.join(columns.values())} FROM ({select_sql}) legacy WHERE 1 = 1 "
+        f"ON CONFLICT ({', '.join(qn(key) for key in keys)}) DO UPDATE SET "
+        + ', '.join(f'{qn(column)} = excluded.{qn(column)}' for column in updated)
+    )
+
+
+def _merge_market_blocks(select, product_id, using='default'):
+    """Write the averaged IEX blocks as MarketData stamped with their block start."""
+    objs = [
+        MarketData(
+            product_id=product_id,
+            timestamp=block_timestamp(row['day'], row['block']),
+            block_number=row['block'],
+            mcp=Decimal(str(row['mcp'])),
+            mcv=Decimal(str(row['mcv'])),
+        )
+        for row in select
+    ]
+    merge_rows(MarketData, objs, using=using)
+    return len(objs)
+
+
+def migrate(model, product_id=None, mapping=None, chunk_size=CHUNK_SIZE, progress=None, using='default'):
+    """
+    Convert the market days of ``model``'s rows past the ledger position
+    into its block model, ``chunk_size`` ids at a time.
+    ``progress(done_id, last_id, written)`` is called after each committed
+    chunk. Returns the number of block rows written; a day whose rows span
+    several chunks is counted once per chunk.
+    """
+    connection = connections[using]
+    ledger, _ = IngestLedger.objects.using(using).get_or_create(path=ledger_key(model))
+    last_id = model.objects.using(using).aggregate(last=Max('pk'))['last'] or 0
+    written = 0
+    lo = ledger.offset
+    while lo < last_id:
+        hi = min(lo + chunk_size, last_id)
+        days = _touched_days(model, lo, hi, using=using)
+        select = _select(model, days, mapping=mapping, using=using) if days else None
+        with transaction.atomic(using=using):
+            count = 0
+            if select is not None and model is IEXData:
+                count = _merge_market_blocks(select, product_id, using=using)
+            elif select is not None:
+                select_sql, select_params = select.query.sql_with_params()
+                now = timezone.now()
+                with connection.cursor() as cursor:
+                    cursor.execute(_insert_sql(model, select_sql, connection), [now, now, *select_params])
+                    count = max(cursor.rowcount, 0)
+            ledger.offset = hi
+            ledger.rows += count
+            ledger.save(using=using)
+        written += count
+        lo = hi
+        if progress:
+            progress(hi, last_id, written)
+    return written
+
+
+def unmapped_count(model, mapping):
+    """Legacy rows that no DISCOM or generator mapping covers."""
+    if model is IEXData:
+        return 0
+    _, mapped = _entity_case(model, mapping)
+    if mapped is None:
+        return model.objects.count()
+    return model.objects.exclude(mapped).count()
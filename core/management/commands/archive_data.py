@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.models import (
+    Product, Generator, Discom, MarketData, LoadSchedule,
+    GenerationSchedule, ArchivedRange
+)
+from core.tiering import archive_alias, moving
+
+# model, date filter field, unique key, value fields copied on conflict
+TIERED_MODELS = [
+    (MarketData, 'trade_date', ['product', 'timestamp', 'block_number'],
+     ['mcp', 'mcv', 'purchase_bid_volume', 'sell_bid_volume', 'turnover', 'trade_date', 'updated_at']),
+    (LoadSchedule, 'date', ['discom', 'date', 'block_number'],
+     ['scheduled_drawal', 'actual_drawal', 'updated_at']),
+    (GenerationSchedule, 'date', ['generator', 'date', 'block_number'],
+     ['scheduled_generation', 'actual_generation', 'updated_at']),
+]
+
+REFERENCE_MODELS = [
+    (Product, ['name', 'description', 'updated_at']),
+    (Generator, ['name', 'capacity_mw', 'fuel_type', 'location', 'updated_at']),
+    (Discom, ['name', 'state', 'region', 'updated_at']),
+]
+
+
+class Command(BaseCommand):
+    help = 'Move block data older than a cutoff from the live tables into the archive database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365),
+            help='Archive rows dated more than this many days ago',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows moved per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many rows would be archived',
+        )
+
+    def handle(self, *args, **options):
+        archive = archive_alias()
+        if archive is None:
+            raise CommandError('The archive tier is off; set GNA_ARCHIVE=1 to enable it')
+
+        cutoff = date.today() - timedelta(days=options['older_than_days'])
+
+        if not options['dry_run']:
+            self.sync_reference_data(archive)
+
+        for model, date_field, unique_fields, update_fields in TIERED_MODELS:
+            queryset = model.objects.using('default').filter(**{f'{date_field}__lt': cutoff})
+            if options['dry_run']:
+                self.stdout.write(f"{model.__name__}: {queryset.count()} rows before {cutoff} would be archived")
+                continue
+            # Copy, then move the boundary, then delete: reads take each side
+            # of the boundary from one tier only (see tiering.tiers), so rows
+            # are never missing or counted twice while the move is under way
+            started = timezone.now()
+            self.copy_rows(queryset, archive, unique_fields, update_fields, options['batch_size'])
+            self.update_boundary(model, cutoff)
+            self.copy_rows(
+                queryset.filter(updated_at__gte=started), archive, unique_fields, update_fields, options['batch_size']
+            )
+            moved = self.delete_rows(queryset, options['batch_size'])
+            self.stdout.write(f"{model.__name__}: archived {moved} rows before {cutoff}")
+
+    def sync_reference_data(self, archive):
+        # Archived rows keep their foreign keys, so the archive needs the
+        # same products, generators and discoms under the same ids.
+        for model, update_fields in REFERENCE_MODELS:
+            objects = list(model.objects.using('default').all())
+            if objects:
+                model.objects.using(archive).bulk_create(
+                    objects,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=update_fields,
+                )
+
+    def copy_rows(self, queryset, archive, unique_fields, update_fields, batch_size):
+        """
+        Upsert the rows into the archive with their own created_at and
+        updated_at. An archived copy is only overwritten by a newer row.
+        """
+        model = queryset.model
+        connection = connections[archive]
+        qn = connection.ops.quote_name
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        table = qn(model._meta.db_table)
+        columns = ', '.join(qn(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        keys = ', '.join(qn(model._meta.get_field(name).column) for name in unique_fields)
+        updates = ', '.join(
+            f'{qn(column)} = excluded.{qn(column)}'
+            for column in (model._meta.get_field(name).column for name in update_fields)
+        )
+        sql = (
+            f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates} '
+            f"WHERE excluded.{qn('updated_at')} > {table}.{qn('updated_at')}"
+        )
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return
+            rows = [
+                [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+                for obj in batch
+            ]
+            with transaction.atomic(using=archive), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+            last_pk = batch[-1].pk
+
+    def delete_rows(self, queryset, batch_size):
+        # The slot and day-profile rows stay: they cover both tiers
+        deleted = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            with transaction.atomic(using='default'), moving():
+                queryset.model.objects.using('default').filter(pk__in=pks).delete()
+            deleted += len(pks)
+
+    def update_boundary(self, model, cutoff):
+        boundary, created = ArchivedRange.objects.using('default').get_or_create(
+            table=model._meta.db_table,
+            defaults={'archived_before': cutoff},
+        )
+        if not created and boundary.archived_before < cutoff:
+            boundary.archived_before = cutoff
+            boundary.save(using='default')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core import profiles, tiering
+from core.models import LoadSchedule, GenerationSchedule
+
+
+class Command(BaseCommand):
+    help = 'Convert LoadSchedule and GenerationSchedule blocks into one-row-per-day profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-date',
+            type=str,
+            help='First day to convert (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--end-date',
+            type=str,
+            help='Last day to convert (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Profiles written per batch',
+        )
+
+    def handle(self, *args, **options):
+        for model in (LoadSchedule, GenerationSchedule):
+            queryset = model.objects.all()
+            if options['start_date']:
+                queryset = queryset.filter(date__gte=options['start_date'])
+            if options['end_date']:
+                queryset = queryset.filter(date__lte=options['end_date'])
+            converted = sum(
+                profiles.build_profiles(tier, batch_size=options['batch_size'])
+                for tier in tiering.tiers(queryset, options['start_date'])
+            )
+            self.stdout.write(f"{model.__name__}: wrote {converted} day profiles")
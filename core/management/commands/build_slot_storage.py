@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core import slots, tiering
+from core.models import (
+    MarketData, LoadSchedule, GenerationSchedule, MarketSlot, LoadSlot, GenerationSlot
+)
+
+
+class Command(BaseCommand):
+    help = 'Populate the fixed-point, slot-indexed tables from MarketData, LoadSchedule and GenerationSchedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows converted per batch',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Empty the slot tables before converting',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            for model in (MarketSlot, LoadSlot, GenerationSlot):
+                model.objects.all().delete()
+
+        for model in (MarketData, LoadSchedule, GenerationSchedule):
+            converted = 0
+            # The slot tables keep archived rows too
+            for queryset in tiering.tiers(model.objects.all()):
+                last_pk = 0
+                while True:
+                    batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                    if not batch:
+                        break
+                    converted += slots.mirror(batch)
+                    last_pk = batch[-1].pk
+            self.stdout.write(f"{model.__name__}: converted {converted} rows")
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write or update the memory-mapped columnar snapshot of MarketData and LoadSchedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Write every row again instead of patching and appending the changed ones',
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'SNAPSHOT_PATH', None):
+            raise CommandError('Set GNA_SNAPSHOT_PATH to the path of the snapshot file')
+        for section, (how, rows) in snapshot.refresh(rebuild=options['rebuild']).items():
+            self.stdout.write(f"{section}: {how}, {rows} rows written")
@@ -1,22 +1,23 @@
-import csv
 import os
 import random
+import time
 from datetime import datetime, timedelta, date
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from core import analytics, ingest, market_ingest, merge, metrics, refdata, snapshot
 from core.models import (
     Product, Generator, Discom, MarketData, LoadSchedule, 
-    GenerationSchedule, IEXData, LoadData, GenerationData
+    GenerationSchedule, IngestLedger
 )
 
 class Command(BaseCommand):
-    help = 'Ingest data from CSV files or generate sample data'
+    help = 'Ingest data from CSV files or exchange workbooks, or generate sample data'
 
     def add_arguments(self, parser):
         parser.add_argument(
             '--file',
             type=str,
-            help='Specific CSV file to ingest',
+            help='Source to ingest (iex_data, market_data, load_actuals, ... see core.ingest.SOURCES), as .csv, .csv.gz, .csv.zst or .zip',
         )
         parser.add_argument(
             '--generate-sample',
@@ -29,17 +30,47 @@ class Command(BaseCommand):
             default=90,
             help='Number of days of sample data to generate',
         )
+        parser.add_argument(
+            '--data-dir',
+            type=str,
+            default=os.path.join(settings.BASE_DIR, 'core', 'sample_data'),
+            help='Directory holding the CSV files',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'INGEST_BATCH_SIZE', ingest.BATCH_SIZE),
+            help='Rows inserted per transaction',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'xlsx'],
+            default='csv',
+            help='csv for the feed files, xlsx for exchange market workbooks (into MarketData)',
+        )
+        parser.add_argument(
+            '--product',
+            type=str,
+            help='Product for workbook rows and sheets that do not name one',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Forget earlier progress and ingest the files again from the start (market and actuals files only)',
+        )
 
     def handle(self, *args, **options):
         if options['generate_sample']:
             self.generate_sample_data(options['days'])
+        elif options['format'] == 'xlsx':
+            self.ingest_workbooks(options)
         else:
-            sample_data_dir = os.path.join(settings.BASE_DIR, 'core', 'sample_data')
-            
             if options['file']:
-                self.ingest_specific_file(sample_data_dir, options['file'])
+                self.ingest_specific_file(options['data_dir'], options['file'], options)
             else:
-                self.ingest_all_files(sample_data_dir)
+                self.ingest_all_files(options['data_dir'], options)
+        analytics.sync_after_write()
+        snapshot.refresh_after_write()
 
     def generate_sample_data(self, days):
         self.stdout.write("Generating sample data...")
@@ -85,17 +116,28 @@ class Command(BaseCommand):
         end_date = date.today()
         start_date = end_date - timedelta(days=days-1)
         
+        created = {'market_data': 0, 'load_schedule': 0, 'generation_schedule': 0}
+        elapsed = dict.fromkeys(created, 0.0)
         current_date = start_date
         while current_date <= end_date:
-            self.generate_daily_data(current_date)
+            for table, (count, seconds) in self.generate_daily_data(current_date).items():
+                created[table] += count
+                elapsed[table] += seconds
             current_date += timedelta(days=1)
         
+        last_timestamp = datetime.combine(end_date, datetime.min.time()) + timedelta(minutes=95*15)
+        for table, count in created.items():
+            metrics.record_ingest(table, count, elapsed[table], last_timestamp)
+        
+        for table, count in created.items():
+            self.stdout.write(f"{table}: {count} rows inserted")
         self.stdout.write(f"Successfully generated {days} days of sample data")
 
     def generate_daily_data(self, target_date):
-        products = Product.objects.all()
-        generators = Generator.objects.all()
-        discoms = Discom.objects.all()
+        products = refdata.products.all()
+        generators = refdata.generators.all()
+        discoms = refdata.discoms.all()
+        rows = {'market_data': [], 'load_schedule': [], 'generation_schedule': []}
         
         # Generate market data for 96 blocks (15-minute intervals)
         for block in range(1, 97):
@@ -112,17 +154,15 @@ class Command(BaseCommand):
                 purchase_bid = mcv * random.uniform(1.1, 1.5)
                 sell_bid = mcv * random.uniform(1.1, 1.5)
                 
-                MarketData.objects.get_or_create(
+                rows['market_data'].append(MarketData(
                     product=product,
                     timestamp=timestamp,
                     block_number=block,
-                    defaults={
-                        'mcp': round(mcp, 2),
-                        'mcv': round(mcv, 2),
-                        'purchase_bid_volume': round(purchase_bid, 2),
-                        'sell_bid_volume': round(sell_bid, 2),
-                    }
-                )
+                    mcp=round(mcp, 2),
+                    mcv=round(mcv, 2),
+                    purchase_bid_volume=round(purchase_bid, 2),
+                    sell_bid_volume=round(sell_bid, 2),
+                ))
         
         # Generate load schedules
         for discom in discoms:
@@ -133,15 +173,13 @@ class Command(BaseCommand):
                 scheduled_drawal = max(100, base_load + load_variation * time_factor)
                 actual_drawal = scheduled_drawal * random.uniform(0.95, 1.05)
                 
-                LoadSchedule.objects.get_or_create(
+                rows['load_schedule'].append(LoadSchedule(
                     discom=discom,
                     date=target_date,
                     block_number=block,
-                    defaults={
-                        'scheduled_drawal': round(scheduled_drawal, 2),
-                        'actual_drawal': round(actual_drawal, 2),
-                    }
-                )
+                    scheduled_drawal=round(scheduled_drawal, 2),
+                    actual_drawal=round(actual_drawal, 2),
+                ))
         
         # Generate generation schedules
         for generator in generators:
@@ -161,73 +199,107 @@ class Command(BaseCommand):
                 scheduled_gen = max(0, base_gen * time_factor * random.uniform(0.8, 1.0))
                 actual_gen = scheduled_gen * random.uniform(0.95, 1.05)
                 
-                GenerationSchedule.objects.get_or_create(
+                rows['generation_schedule'].append(GenerationSchedule(
                     generator=generator,
                     date=target_date,
                     block_number=block,
-                    defaults={
-                        'scheduled_generation': round(scheduled_gen, 2),
-                        'actual_generation': round(actual_gen, 2),
-                    }
-                )
+                    scheduled_generation=round(scheduled_gen, 2),
+                    actual_generation=round(actual_gen, 2),
+                ))
+        
+        # Existing rows are kept, as get_or_create used to do. Each table's
+        # write is timed on its own for its ingest throughput metric
+        models = {'market_data': MarketData, 'load_schedule': LoadSchedule, 'generation_schedule': GenerationSchedule}
+        written = {}
+        for table, objs in rows.items():
+            started = time.perf_counter()
+            inserted = merge.merge_rows(models[table], objs, update_existing=False)['inserted']
+            written[table] = (inserted, time.perf_counter() - started)
+        return written
 
-    def ingest_specific_file(self, data_dir, file_type):
-        file_map = {
-            'iex_data': ('iex_data.csv', self.ingest_iex_data),
-            'load_data': ('load_data.csv', self.ingest_load_data),
-            'generation_data': ('generation_data.csv', self.ingest_generation_data),
-        }
-        
-        if file_type in file_map:
-            filename, ingest_func = file_map[file_type]
-            file_path = os.path.join(data_dir, filename)
-            if os.path.exists(file_path):
-                ingest_func(file_path)
-            else:
-                self.stdout.write(f"File {filename} not found")
+    def ingest_specific_file(self, data_dir, file_type, options):
+        if file_type in ingest.SOURCES:
+            file_paths = self.source_files(data_dir, file_type)
+            if not file_paths:
+                self.stdout.write(f"File {file_type}.csv not found")
+            for file_path in file_paths:
+                self.ingest_path(file_path, options)
 
-    def ingest_all_files(self, data_dir):
-        files = [
-            ('iex_data.csv', self.ingest_iex_data),
-            ('load_data.csv', self.ingest_load_data),
-            ('generation_data.csv', self.ingest_generation_data),
-        ]
-        
-        for filename, ingest_func in files:
-            file_path = os.path.join(data_dir, filename)
-            if os.path.exists(file_path):
-                ingest_func(file_path)
+    def ingest_all_files(self, data_dir, options):
+        for source in ingest.SOURCES:
+            for file_path in self.source_files(data_dir, source):
+                self.ingest_path(file_path, options)
+
+    def source_files(self, data_dir, source):
+        # Plain, compressed or bundled copies of <source>.csv
+        names = [f'{source}.csv', f'{source}.csv.gz', f'{source}.csv.zst', f'{source}.zip']
+        paths = [os.path.join(data_dir, name) for name in names]
+        return [path for path in paths if os.path.exists(path)]
 
-    def ingest_iex_data(self, file_path):
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                IEXData.objects.create(
-                    timestamp=datetime.fromisoformat(row['timestamp']),
-                    price=row['price'],
-                    volume=row['volume']
-                )
-        self.stdout.write(f"Successfully ingested IEX data from {file_path}")
+    def ingest_path(self, file_path, options):
+        for source, csv_input in ingest.inputs_for(file_path):
+            self.ingest_file(csv_input, source, options)
 
-    def ingest_load_data(self, file_path):
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                LoadData.objects.create(
-                    timestamp=datetime.fromisoformat(row['timestamp']),
-                    load_value=row['load_value'],
-                    region=row['region']
-                )
-        self.stdout.write(f"Successfully ingested Load data from {file_path}")
+    def ingest_workbooks(self, options):
+        data_dir = options['data_dir']
+        if options['file']:
+            file_path = options['file']
+            if not os.path.exists(file_path):
+                file_path = os.path.join(data_dir, file_path)
+            file_paths = [file_path]
+        else:
+            file_paths = sorted(
+                os.path.join(data_dir, name) for name in os.listdir(data_dir) if name.endswith('.xlsx')
+            )
+        
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                self.stdout.write(f"File {file_path} not found")
+                continue
+            if options['reset']:
+                IngestLedger.objects.filter(path=os.path.abspath(file_path)).delete()
+            try:
+                result = market_ingest.ingest_xlsx(file_path, product=options['product'], batch_size=options['batch_size'])
+            except ImportError as exc:
+                raise CommandError(str(exc))
+            except ValueError as exc:
+                raise CommandError(f"Nothing merged from {file_path}: {exc}")
+            for title in result['skipped_sheets']:
+                self.stderr.write(f"Skipped sheet '{title}' of {file_path}: no market data header found")
+            if result['status'] == 'unchanged':
+                self.stdout.write(f"Market workbook {file_path} is up to date")
+                continue
+            self.stdout.write(
+                f"Merged {result['rows']} market rows from {file_path}: {result['inserted']} inserted, "
+                f"{result['updated']} updated, {result['unchanged']} unchanged"
+            )
 
-    def ingest_generation_data(self, file_path):
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                GenerationData.objects.create(
-                    timestamp=datetime.fromisoformat(row['timestamp']),
-                    generation_value=row['generation_value'],
-                    fuel_type=row['fuel_type'],
-                    region=row['region']
-                )
-        self.stdout.write(f"Successfully ingested Generation data from {file_path}")
+    def ingest_file(self, csv_input, source, options):
+        file_path = csv_input.key
+        label = ingest.SOURCES[source][2]
+        if options['reset'] and not ingest.replayable(source):
+            self.stderr.write(f"Not resetting {file_path}: {label} rows have no unique key and would be duplicated")
+        elif options['reset']:
+            IngestLedger.objects.filter(path=file_path).delete()
+        
+        try:
+            result = ingest.ingest_source(csv_input, source, batch_size=options['batch_size'])
+        except ingest.FileChanged as exc:
+            self.stderr.write(f"Skipped {file_path}: {exc}; {ingest.restart_hint(source)}")
+            return
+        except ValueError as exc:
+            # The rows before it are committed; the next run resumes at the bad row
+            raise CommandError(f"Stopped at {exc}")
+        
+        if result['status'] == 'unchanged':
+            self.stdout.write(f"{label} data in {file_path} is up to date")
+            return
+        
+        if result['status'] == 'resumed':
+            self.stdout.write(f"Resumed {file_path} at byte {result['started_at']}")
+        self.stdout.write(f"Successfully ingested {result['rows']} rows of {label} data from {file_path}")
+        counts = result['counts']
+        if counts:
+            self.stdout.write(", ".join(f"{count} {key}" for key, count in counts.items()))
+            if counts.get('missing'):
+                self.stderr.write(f"{counts['missing']} rows in {file_path} have no schedule block to patch")
@@ -0,0 +1,329 @@
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+
+from core import sqlite
+from core.models import Discom, Generator, MarketData, Product
+
+DEFAULT_QUESTIONS = [
+    'average price for DAM last week',
+    'average price for RTM last 30 days',
+    'total volume for DAM last month',
+    'total volume for RTM past week',
+    'load data for last 30 days',
+    'generation data last month',
+    'price trend for DAM',
+    'price trend for RTM',
+]
+
+DEFAULT_MIX = 'list=4,aggregation=3,nlp=3'
+
+# Scratch table written by --ingest; it shares the database file (and its
+# locks) with the real tables without changing their data
+INGEST_TABLE = 'loadtest_ingest'
+
+# Distinct failure reasons printed after a run
+MAX_REPORTED_ERRORS = 20
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def describe(exc):
+    """Exception type and message, as reported for a failed request or commit."""
+    return f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = 'Fire a mix of API requests with concurrent workers and report throughput and latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Total number of requests to send',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of concurrent workers',
+        )
+        parser.add_argument(
+            '--mix',
+            type=str,
+            default=DEFAULT_MIX,
+            help='Relative weights of request groups, e.g. "list=4,aggregation=3,nlp=3"',
+        )
+        parser.add_argument(
+            '--corpus',
+            type=str,
+            help='File of NLP questions, one per line',
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            help='Send requests to a running server (e.g. http://127.0.0.1:8000) instead of the in-process client',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Width of the date range used in list and aggregation filters',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed for a reproducible request mix',
+        )
+        parser.add_argument(
+            '--ingest',
+            action='store_true',
+            help='Run a bulk ingest into a scratch table while the requests are sent',
+        )
+        parser.add_argument(
+            '--ingest-batch',
+            type=int,
+            default=getattr(settings, 'INGEST_BATCH_SIZE', 1000),
+            help='Rows per ingest transaction with --ingest',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        rng = random.Random(options['seed'])
+        templates = self.build_templates(options['days'], self.load_questions(options['corpus']))
+        weights = self.parse_mix(options['mix'], templates)
+
+        groups = list(weights)
+        plan = []
+        for group in rng.choices(groups, weights=[weights[g] for g in groups], k=options['requests']):
+            plan.append(rng.choice(templates[group]))
+
+        send = self.http_sender(options['base_url']) if options['base_url'] else self.client_sender()
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        reasons = Counter()
+        lock = threading.Lock()
+
+        def run(spec):
+            name, method, path, payload = spec
+            start = time.perf_counter()
+            try:
+                error = send(method, path, payload)
+            except Exception as exc:
+                error = describe(exc)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if error:
+                    errors[name] += 1
+                    reasons[name, error] += 1
+
+        def worker(specs):
+            try:
+                for spec in specs:
+                    run(spec)
+            finally:
+                connection.close()
+
+        chunks = [plan[i::options['concurrency']] for i in range(options['concurrency'])]
+        ingest = self.start_ingest(options['ingest_batch']) if options['ingest'] else None
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(worker, chunks))
+        wall_time = time.perf_counter() - started
+
+        self.report(latencies, errors, wall_time, options['concurrency'])
+        self.report_errors(reasons)
+        if ingest:
+            self.report_ingest(*ingest)
+
+    def start_ingest(self, batch_size):
+        """
+        Insert batches into the scratch table in a background thread, one
+        transaction each, until stopped. Returns the arguments of
+        ``report_ingest``.
+        """
+        stop = threading.Event()
+        stats = {'rows': 0, 'commits': [], 'errors': 0, 'reasons': Counter(), 'journal_mode': None}
+        ready = threading.Event()
+
+        def run():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {INGEST_TABLE}')
+                    cursor.execute(f'CREATE TABLE {INGEST_TABLE} (slot INTEGER, value REAL, payload TEXT)')
+                if connection.vendor == 'sqlite':
+                    stats['journal_mode'] = sqlite.current(connection, 'journal_mode')
+                ready.set()
+                slot = 0
+                while not stop.is_set():
+                    rows = [(slot + i, random.random(), 'x' * 64) for i in range(batch_size)]
+                    begin = time.perf_counter()
+                    try:
+                        with transaction.atomic(), connection.cursor() as cursor:
+                            cursor.executemany(
+                                f'INSERT INTO {INGEST_TABLE} (slot, value, payload) VALUES (%s, %s, %s)', rows
+                            )
+                    except Exception as exc:
+                        # e.g. "database is locked" once the busy timeout runs out
+                        stats['errors'] += 1
+                        stats['reasons']['ingest', describe(exc)] += 1
+                        stop.wait(0.01)
+                        continue
+                    stats['commits'].append(time.perf_counter() - begin)
+                    stats['rows'] += batch_size
+                    slot += batch_size
+            finally:
+                ready.set()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {INGEST_TABLE}')
+                connection.close()
+
+        thread = threading.Thread(target=run, name='loadtest-ingest', daemon=True)
+        thread.start()
+        ready.wait()
+        return stop, thread, stats, time.perf_counter()
+
+    def report_ingest(self, stop, thread, stats, started):
+        stop.set()
+        thread.join()
+        elapsed = time.perf_counter() - started
+        commits = sorted(stats['commits'])
+        mode = f" (journal_mode={stats['journal_mode']})" if stats['journal_mode'] else ''
+        self.stdout.write(
+            f"Concurrent ingest{mode}: {stats['rows']} rows in {len(commits)} commits, "
+            f"{stats['rows'] / elapsed:.0f} rows/s, {stats['errors']} failed commits, "
+            f"commit p50 {percentile(commits, 50) * 1000:.1f} ms, p95 {percentile(commits, 95) * 1000:.1f} ms"
+        )
+        self.report_errors(stats['reasons'])
+
+    def load_questions(self, corpus):
+        if not corpus:
+            return DEFAULT_QUESTIONS
+        try:
+            with open(corpus) as handle:
+                questions = [line.strip() for line in handle if line.strip() and not line.startswith('#')]
+        except OSError as exc:
+            raise CommandError(f'Cannot read corpus file: {exc}')
+        if not questions:
+            raise CommandError(f'Corpus file {corpus} contains no questions')
+        return questions
+
+    def parse_mix(self, mix, templates):
+        weights = {}
+        for part in mix.split(','):
+            group, _, weight = part.partition('=')
+            group = group.strip()
+            if group not in templates:
+                raise CommandError(f"Unknown request group '{group}'; choose from {', '.join(templates)}")
+            try:
+                weights[group] = float(weight or 1)
+            except ValueError:
+                raise CommandError(f"Invalid weight '{weight}' for '{group}'")
+        if not any(weights.values()):
+            raise CommandError('--mix must give at least one group a positive weight')
+        return weights
+
+    def build_templates(self, days, questions):
+        # Anchor the filters on the newest data so requests hit real rows
+        latest = MarketData.objects.order_by('-timestamp').values_list('timestamp', flat=True).first()
+        end_date = latest.date() if latest else date.today()
+        start_date = end_date - timedelta(days=days - 1)
+        products = list(Product.objects.values_list('name', flat=True)) or ['DAM']
+        discoms = list(Discom.objects.values_list('name', flat=True))
+        generators = list(Generator.objects.values_list('name', flat=True))
+        date_range = {'start_date': start_date, 'end_date': end_date}
+
+        def get(name, **params):
+            return (name, 'GET', f"{reverse(f'core:{name}')}?{urlencode(params)}", None)
+
+        templates = {
+            'list': [get('market_data_list', product=p, **date_range) for p in products],
+            'aggregation': [get('market_aggregation', product=p, **date_range) for p in products],
+            'nlp': [('nlp_query', 'POST', reverse('core:nlp_query'), {'query': q}) for q in questions],
+        }
+        templates['list'].append(get('load_schedule_list', date=end_date))
+        templates['list'].extend(get('load_schedule_list', discom=d, date=end_date) for d in discoms)
+        templates['list'].extend(get('generation_schedule_list', generator=g, date=end_date) for g in generators)
+        templates['aggregation'].append(get('load_aggregation', date=end_date))
+        return templates
+
+    def client_sender(self):
+        local = threading.local()
+
+        def send(method, path, payload):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            if method == 'POST':
+                response = local.client.post(path, payload, content_type='application/json')
+            else:
+                response = local.client.get(path)
+            return None if response.status_code < 400 else f'HTTP {response.status_code}'
+
+        return send
+
+    def http_sender(self, base_url):
+        base_url = base_url.rstrip('/')
+
+        def send(method, path, payload):
+            data = json.dumps(payload).encode() if payload is not None else None
+            request = urllib.request.Request(
+                base_url + path,
+                data=data,
+                method=method,
+                headers={'Content-Type': 'application/json'} if data else {},
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                    return None if response.status < 400 else f'HTTP {response.status}'
+            except urllib.error.HTTPError as exc:
+                return f'HTTP {exc.code}'
+
+        return send
+
+    def report_errors(self, reasons):
+        """The distinct failures, most frequent first."""
+        for (name, reason), count in reasons.most_common(MAX_REPORTED_ERRORS):
+            self.stderr.write(f"{name}: {count} x {reason}")
+
+    def report(self, latencies, errors, wall_time, concurrency):
+        total = sum(len(values) for values in latencies.values())
+        self.stdout.write(
+            f"{total} requests in {wall_time:.2f}s with {concurrency} workers: "
+            f"{total / wall_time:.1f} req/s"
+        )
+        header = f"{'endpoint':<26}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name in sorted(latencies):
+            values = sorted(latencies[name])
+            self.stdout.write(
+                f"{name:<26}{len(values):>7}{errors[name]:>8}{len(values) / wall_time:>9.1f}"
+                f"{percentile(values, 50) * 1000:>10.1f}"
+                f"{percentile(values, 95) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}"
+            )
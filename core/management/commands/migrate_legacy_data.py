@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import analytics, legacy, profiles, refdata, slots, snapshot
+from core.models import IngestLedger, IEXData, LoadData, GenerationData
+
+TABLES = {
+    'iex_data': IEXData,
+    'load_data': LoadData,
+    'generation_data': GenerationData,
+}
+
+
+class Command(BaseCommand):
+    help = 'Convert IEXData, LoadData and GenerationData history into MarketData, LoadSchedule and GenerationSchedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table',
+            choices=list(TABLES),
+            action='append',
+            help='Legacy table to convert (repeatable; default all)',
+        )
+        parser.add_argument(
+            '--product',
+            type=str,
+            default='DAM',
+            help='Product the IEX history belongs to',
+        )
+        parser.add_argument(
+            '--discom',
+            action='append',
+            default=[],
+            metavar='REGION=DISCOM',
+            help='Map a LoadData region to a DISCOM by name (repeatable)',
+        )
+        parser.add_argument(
+            '--generator',
+            action='append',
+            default=[],
+            metavar='FUEL/REGION=GENERATOR',
+            help='Map a GenerationData fuel type and region to a generator by name (repeatable)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=legacy.CHUNK_SIZE,
+            help='Legacy ids converted per statement',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Convert from the first row again instead of resuming',
+        )
+
+    def handle(self, *args, **options):
+        for name in options['table'] or TABLES:
+            model = TABLES[name]
+            if options['reset']:
+                IngestLedger.objects.filter(path=legacy.ledger_key(model)).delete()
+            try:
+                self.migrate_table(name, model, options)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        analytics.sync_after_write()
+        snapshot.refresh_after_write()
+
+        if slots.enabled() or profiles.enabled():
+            self.stdout.write(
+                "Run build_slot_storage and build_day_profiles to bring the derived tables up to date"
+            )
+
+    def migrate_table(self, name, model, options):
+        product_id = mapping = None
+        if model is IEXData:
+            product_id = refdata.products.id_for(options['product'])
+            if product_id is None:
+                raise ValueError(f"Unknown product '{options['product']}'")
+        elif model is LoadData:
+            mapping = legacy.discom_mapping(self.parse_mapping(options['discom']))
+        else:
+            mapping = legacy.generator_mapping(self.parse_mapping(options['generator'], pair=True))
+
+        target = legacy.TARGETS[model][0].__name__
+        started = time.perf_counter()
+
+        def progress(done_id, last_id, written):
+            self.stdout.write(
+                f"{name}: {done_id}/{last_id} ids ({done_id * 100 // last_id}%), "
+                f"{written} {target} rows, {time.perf_counter() - started:.1f}s"
+            )
+
+        written = legacy.migrate(model, product_id=product_id, mapping=mapping,
+                                 chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(f"{name}: wrote {written} {target} rows")
+        skipped = legacy.unmapped_count(model, mapping)
+        if skipped:
+            self.stderr.write(
+                f"{name}: {skipped} rows have no matching {'DISCOM' if model is LoadData else 'generator'}; "
+                f"map them with --{'discom' if model is LoadData else 'generator'} and rerun with --reset"
+            )
+
+    def parse_mapping(self, values, pair=False):
+        mapping = {}
+        for value in values:
+            key, sep, target = value.partition('=')
+            if not sep or (pair and '/' not in key):
+                raise CommandError(f"Expected {'FUEL/REGION' if pair else 'REGION'}=NAME, got '{value}'")
+            mapping[tuple(key.strip().split('/', 1)) if pair else key.strip()] = target.strip()
+        return mapping
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = 'Copy new and changed block rows into the DuckDB analytics sidecar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Delete the sidecar file and copy every row again',
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'ANALYTICS_DB_PATH', None):
+            raise CommandError('Set GNA_ANALYTICS_DB to the path of the analytics file')
+        try:
+            copied = analytics.sync(rebuild=options['rebuild'])
+        except ImportError as exc:
+            raise CommandError(str(exc))
+        for name, count in copied.items():
+            self.stdout.write(f"{name}: copied {count} rows")
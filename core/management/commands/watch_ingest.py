@@ -0,0 +1,103 @@
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core import analytics, ingest, snapshot
+
+
+class Command(BaseCommand):
+    help = 'Watch a directory and ingest new or appended CSV files as they arrive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data-dir',
+            type=str,
+            default=str(settings.INGEST_WATCH_DIR),
+            help='Directory to watch',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.INGEST_WATCH_INTERVAL,
+            help='Seconds between directory scans',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'INGEST_BATCH_SIZE', ingest.BATCH_SIZE),
+            help='Rows inserted per transaction',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Scan the directory once and exit',
+        )
+
+    def handle(self, *args, **options):
+        data_dir = options['data_dir']
+        if not os.path.isdir(data_dir):
+            raise CommandError(f"{data_dir} is not a directory")
+
+        self.seen = {}
+        self.stdout.write(f"Watching {data_dir} every {options['interval']}s")
+        try:
+            while True:
+                self.scan(data_dir, options['batch_size'])
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
+
+    def scan(self, data_dir, batch_size):
+        # Long-running process: drop connections the database has timed out
+        close_old_connections()
+        self.ingested = 0
+        for name in sorted(os.listdir(data_dir)):
+            path = os.path.join(data_dir, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            # Files untouched since the last scan need no ledger lookup
+            if self.seen.get(path) == signature:
+                continue
+            if self.ingest_path(path, name, batch_size):
+                self.seen[path] = signature
+        if self.ingested:
+            analytics.sync_after_write()
+            snapshot.refresh_after_write()
+
+    def ingest_path(self, path, name, batch_size):
+        """Ingest every CSV in ``path``; False if some rows are held back for the next scan."""
+        done = True
+        try:
+            inputs = list(ingest.inputs_for(path))
+        except zipfile.BadZipFile:
+            # Most likely still being copied in
+            return False
+        for source, csv_input in inputs:
+            try:
+                result = ingest.ingest_source(csv_input, source, batch_size=batch_size)
+            except ingest.FileChanged as exc:
+                self.stderr.write(f"Skipped {csv_input}: {exc}; {ingest.restart_hint(source)}")
+                continue
+            except EOFError:
+                # A compressed file cut short; committed batches are kept
+                done = False
+                continue
+            except ValueError as exc:
+                # Retried once the file changes; ingest resumes at the bad row
+                self.stderr.write(f"Stopped at {exc}")
+                continue
+            if result['rows']:
+                self.ingested += result['rows']
+                self.stdout.write(f"Ingested {result['rows']} rows from {name}")
+            # A held-back unterminated last line is retried on the next scan
+            if csv_input.growing and result['offset'] != csv_input.size:
+                done = False
+        return done
@@ -0,0 +1,256 @@
+"""
+Ingest of exchange market results straight into MarketData.
+
+Exchange reports name their columns in several ways ("MCP (Rs/MWh)",
+"Time Block", "Purchase Bid (MW)"...). ``market_columns`` maps a header row
+onto MarketData fields, and ``build_market_data`` turns one report row into
+a MarketData object, resolving the product through the reference cache.
+Rows are written with the staging merge, so re-ingesting a report updates
+the blocks it covers instead of duplicating them.
+
+``ingest_xlsx`` reads IEX DAM/RTM workbooks with openpyxl in read-only
+mode, one row at a time, so a workbook is never loaded into memory whole.
+Every row is checked before the first batch is merged, so an unknown
+product or a malformed row rejects the workbook without writing part of it.
+Sheets without a recognisable header are reported, not read.
+"""
+import hashlib
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, refdata, slots
+from .merge import merge_rows
+from .models import IngestLedger, MarketData
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+BATCH_SIZE = 1000
+
+# MarketData field -> accepted (normalised) column names
+MARKET_COLUMNS = {
+    'product': ['product', 'market', 'segment'],
+    'date': ['date', 'delivery_date', 'trade_date'],
+    'block_number': ['block', 'block_no', 'block_number', 'time_block'],
+    'mcp': ['mcp', 'market_clearing_price'],
+    'mcv': ['mcv', 'market_clearing_volume', 'cleared_volume'],
+    'purchase_bid_volume': ['purchase_bid', 'purchase_bid_volume'],
+    'sell_bid_volume': ['sell_bid', 'sell_bid_volume'],
+}
+REQUIRED_COLUMNS = ('date', 'block_number', 'mcp', 'mcv')
+
+
+def normalise(name):
+    """``'MCP (Rs/MWh)'`` -> ``'mcp'``, ``'Time Block'`` -> ``'time_block'``."""
+    name = re.sub(r'\(.*?\)', '', str(name or '')).strip().lower()
+    return re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+
+
+def market_columns(header):
+    """Map MarketData fields to their index in ``header``, or None if the row is not a header."""
+    positions = {normalise(name): index for index, name in enumerate(header)}
+    columns = {}
+    for field, names in MARKET_COLUMNS.items():
+        for name in names:
+            if name in positions:
+                columns[field] = positions[name]
+                break
+    if not all(field in columns for field in REQUIRED_COLUMNS):
+        return None
+    return columns
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d-%b-%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+
+def _parse_block(value):
+    """A block number, or the block starting at a time such as ``'00:15 - 00:30'``."""
+    if isinstance(value, (int, float, Decimal)):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    match = re.match(r'(\d{1,2}):(\d{2})', text)
+    if not match:
+        raise ValueError(f"Unrecognised block '{value}'")
+    return (int(match.group(1)) * 60 + int(match.group(2))) // slots.BLOCK_MINUTES + 1
+
+
+def _block_number(value):
+    block_number = _parse_block(value)
+    if not 1 <= block_number <= slots.BLOCKS_PER_DAY:
+        raise ValueError(f"Block '{value}' is not between 1 and {slots.BLOCKS_PER_DAY}")
+    return block_number
+
+
+def _decimal(value, default=None):
+    if value is None or value == '':
+        return default
+    return Decimal(str(value).replace(',', ''))
+
+
+def _required_decimal(value, name):
+    amount = _decimal(value)
+    if amount is None:
+        raise ValueError(f"Missing {name}")
+    return amount
+
+
+def block_timestamp(day, block_number):
+    """Start of a block as an aware datetime in the market (local) time zone."""
+    start = datetime.combine(day, datetime.min.time()) + timedelta(minutes=(block_number - 1) * slots.BLOCK_MINUTES)
+    return timezone.make_aware(start)
+
+
+def product_id(name):
+    """Product id for a name as written in a report (``'dam'``, ``' RTM'``); ValueError if unknown."""
+    if not name:
+        raise ValueError('Row has no product and no default product was given')
+    pk = refdata.products.id_for(str(name).strip().upper())
+    if pk is None:
+        raise ValueError(f"Unknown product '{name}'")
+    return pk
+
+
+def build_market_data(values, columns, product=None):
+    """MarketData for one report row (a sequence indexed by ``columns``)."""
+    def value(field):
+        index = columns.get(field)
+        return None if index is None or index >= len(values) else values[index]
+
+    day = _parse_date(value('date'))
+    block_number = _block_number(value('block_number'))
+    return MarketData(
+        product_id=product_id(value('product') or product),
+        timestamp=block_timestamp(day, block_number),
+        block_number=block_number,
+        mcp=_required_decimal(value('mcp'), 'MCP'),
+        mcv=_required_decimal(value('mcv'), 'MCV'),
+        purchase_bid_volume=_decimal(value('purchase_bid_volume'), Decimal('0')),
+        sell_bid_volume=_decimal(value('sell_bid_volume'), Decimal('0')),
+    )
+
+
+def _file_hash(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _sheet_rows(workbook, product, skipped=None):
+    """
+    Yield ``(sheet title, values, columns, product)`` for every data row of
+    every sheet, adding the titles of sheets without a header to ``skipped``.
+    """
+    for sheet in workbook.worksheets:
+        # Sheets named after a product (DAM, RTM) supply it when no column does
+        sheet_product = product or (sheet.title if refdata.products.id_for(sheet.title.upper()) else None)
+        columns = None
+        for values in sheet.iter_rows(values_only=True):
+            if columns is None:
+                # Reports often carry title rows above the header
+                columns = market_columns(values)
+                continue
+            if all(cell is None or cell == '' for cell in values):
+                continue
+            yield sheet.title, values, columns, sheet_product
+        if columns is None and skipped is not None:
+            skipped.append(sheet.title)
+
+
+def _check_rows(workbook, product, start):
+    """Build every data row after the first ``start`` rows; ValueError naming the first bad one."""
+    for position, (title, values, columns, sheet_product) in enumerate(_sheet_rows(workbook, product), 1):
+        if position <= start:
+            continue
+        try:
+            build_market_data(values, columns, sheet_product)
+        except (ValueError, ArithmeticError) as exc:
+            raise ValueError(f"Sheet '{title}', data row {position}: {exc}") from exc
+
+
+def ingest_xlsx(path, product=None, batch_size=BATCH_SIZE):
+    """
+    Merge the market rows of an Excel workbook into MarketData. The ledger
+    counts data rows already merged, so an interrupted workbook resumes
+    after the last committed batch. Returns ``{'rows', 'status',
+    'inserted', 'updated', 'unchanged', 'skipped_sheets'}``. Raises
+    ValueError, before writing anything, if a row cannot be read.
+    """
+    if openpyxl is None:
+        raise ImportError('Reading .xlsx workbooks needs the openpyxl package')
+
+    path = os.path.abspath(path)
+    size = os.path.getsize(path)
+    content_hash = _file_hash(path)
+    ledger = IngestLedger.objects.filter(path=path).first()
+    if ledger is None:
+        ledger = IngestLedger(path=path)
+    elif ledger.content_hash != content_hash:
+        # A revised workbook is merged again from the top; the merge is idempotent
+        ledger.offset = 0
+        ledger.complete = False
+    result = {'rows': 0, 'status': 'resumed' if ledger.offset else 'new',
+              'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped_sheets': []}
+    if ledger.complete:
+        result['status'] = 'unchanged'
+        return result
+
+    started = time.perf_counter()
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    batch = []
+    position = 0
+
+    def commit(complete=False):
+        with transaction.atomic():
+            counts = merge_rows(MarketData, batch)
+            ledger.size = size
+            ledger.offset = position
+            ledger.content_hash = content_hash
+            ledger.rows += len(batch)
+            ledger.complete = complete
+            ledger.save()
+        for key, count in counts.items():
+            result[key] += count
+        result['rows'] += len(batch)
+        if batch:
+            result['last'] = batch[-1]
+        batch.clear()
+
+    try:
+        _check_rows(workbook, product, ledger.offset)
+        for _, values, columns, sheet_product in _sheet_rows(workbook, product, result['skipped_sheets']):
+            position += 1
+            if position <= ledger.offset:
+                continue
+            batch.append(build_market_data(values, columns, sheet_product))
+            if len(batch) >= batch_size:
+                commit()
+        commit(complete=True)
+    finally:
+        workbook.close()
+
+    if result['rows']:
+        metrics.record_ingest('market_data', result['rows'], time.perf_counter() - started, result['last'].timestamp)
+    return result
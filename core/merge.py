@@ -0,0 +1,160 @@
+"""
+Set-based merge of block rows through a staging table.
+
+``merge_rows`` loads MarketData, LoadSchedule or GenerationSchedule objects
+into a temporary staging table with no constraints, then applies them to the
+real table with one ``INSERT ... SELECT ... ON CONFLICT DO UPDATE`` on the
+model's ``unique_together`` key. Rows whose values already match are left
+alone, and the merge reports how many rows were inserted, updated and
+unchanged. It works on SQLite (3.24+) and PostgreSQL, where the staging
+table is filled with COPY.
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import pgcopy, profiles, slots, tiering
+from .models import MarketData, LoadSchedule, GenerationSchedule
+
+INSERT_CHUNK = 500
+
+# Columns whose change does not count as an update
+BOOKKEEPING_FIELDS = ('created_at', 'updated_at')
+
+
+def refresh_rollups(model, objs, using='default'):
+    """
+    Bring the derived tables up to date for bulk-written rows, which skip
+    the post_save receivers that maintain them for ORM saves. ``using`` is
+    the tier the rows were written to; the derived tables live on the
+    primary and cover both tiers.
+    """
+    if model in (MarketData, LoadSchedule, GenerationSchedule) and slots.enabled():
+        slots.mirror(objs)
+    if model in (LoadSchedule, GenerationSchedule) and profiles.enabled():
+        profiles.refresh(model, objs, using)
+
+
+def _stored_rows(model, objs, using='default'):
+    """The rows now stored for ``objs``' keys, read back for the rollups."""
+    if model is MarketData:
+        days = {slots.market_day(obj.timestamp) for obj in objs}
+        return list(model.objects.using(using).filter(
+            trade_date__in=days, product_id__in={obj.product_id for obj in objs}
+        ))
+    entity = 'discom' if model is LoadSchedule else 'generator'
+    return list(model.objects.using(using).filter(**{
+        'date__in': {obj.date for obj in objs},
+        f'{entity}_id__in': {getattr(obj, f'{entity}_id') for obj in objs},
+    }))
+
+
+def _row_date(obj):
+    if isinstance(obj, MarketData):
+        obj.fill_derived_fields()
+        return obj.trade_date
+    return obj.date
+
+
+def _split_archived(model, objs, using):
+    """``(hot, archived)`` objects: keys before the archive boundary already live in the archive."""
+    boundary = tiering.archive_boundary(model) if using == 'default' else None
+    if boundary is None:
+        return objs, []
+    hot, archived = [], []
+    for obj in objs:
+        (archived if _row_date(obj) < boundary else hot).append(obj)
+    return hot, archived
+
+
+def _key_fields(model):
+    return [model._meta.get_field(name) for name in model._meta.unique_together[0]]
+
+
+def merge_rows(model, objs, update_existing=True, using='default'):
+    """
+    Upsert ``objs`` into ``model``'s table. With ``update_existing=False``
+    existing rows are kept as they are, like ``get_or_create``. Returns
+    ``{'inserted': n, 'updated': n, 'unchanged': n}``. Rows dated before the
+    archive boundary are merged into the archive tier, next to the rows with
+    the same key.
+    """
+    objs, archived = _split_archived(model, list(objs), using)
+    if archived:
+        archived_counts = merge_rows(model, archived, update_existing, using=tiering.archive_alias())
+        counts = merge_rows(model, objs, update_existing, using)
+        return {name: counts[name] + archived_counts[name] for name in counts}
+
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    key_fields = _key_fields(model)
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    compared = [field for field in fields if field not in key_fields and field.name not in BOOKKEEPING_FIELDS]
+
+    # Last object wins for repeated keys, as one ON CONFLICT statement may
+    # not touch the same row twice
+    now = timezone.now()
+    staged = {}
+    for obj in objs:
+        if isinstance(obj, MarketData):
+            obj.fill_derived_fields()
+        obj.created_at = obj.updated_at = now
+        staged[tuple(getattr(obj, field.attname) for field in key_fields)] = obj
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not staged:
+        return counts
+
+    table = qn(model._meta.db_table)
+    staging = qn(f'staging_{model._meta.db_table}')
+    columns = ', '.join(qn(field.column) for field in fields)
+    keys = ', '.join(qn(field.column) for field in key_fields)
+    key_match = ' AND '.join(f't.{qn(f.column)} = s.{qn(f.column)}' for f in key_fields)
+    distinct = 'IS NOT' if connection.vendor == 'sqlite' else 'IS DISTINCT FROM'
+    differs = ' OR '.join(f't.{qn(f.column)} {distinct} s.{qn(f.column)}' for f in compared)
+    excluded_differs = ' OR '.join(
+        f'{table}.{qn(f.column)} {distinct} excluded.{qn(f.column)}' for f in compared
+    )
+    rows = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+        for obj in staged.values()
+    ]
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+        cursor.execute(f'CREATE TEMPORARY TABLE {staging} AS SELECT {columns} FROM {table} WHERE 1 = 0')
+        if pgcopy.supported(connection):
+            pgcopy.copy_rows(cursor, f'staging_{model._meta.db_table}', [f.column for f in fields], rows)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            for start in range(0, len(rows), INSERT_CHUNK):
+                cursor.executemany(
+                    f'INSERT INTO {staging} ({columns}) VALUES ({placeholders})',
+                    rows[start:start + INSERT_CHUNK],
+                )
+
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {staging} s WHERE NOT EXISTS '
+            f'(SELECT 1 FROM {table} t WHERE {key_match})'
+        )
+        counts['inserted'] = cursor.fetchone()[0]
+        if update_existing:
+            cursor.execute(f'SELECT COUNT(*) FROM {staging} s JOIN {table} t ON {key_match} WHERE {differs}')
+            counts['updated'] = cursor.fetchone()[0]
+            updates = ', '.join(
+                f'{qn(f.column)} = excluded.{qn(f.column)}' for f in compared
+            ) + f", {qn('updated_at')} = excluded.{qn('updated_at')}"
+            conflict = f'DO UPDATE SET {updates} WHERE {excluded_differs}'
+        else:
+            conflict = 'DO NOTHING'
+        counts['unchanged'] = len(rows) - counts['inserted'] - counts['updated']
+
+        # "WHERE 1 = 1" lets SQLite parse ON CONFLICT after a SELECT
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} WHERE 1 = 1 '
+            f'ON CONFLICT ({keys}) {conflict}'
+        )
+        cursor.execute(f'DROP TABLE {staging}')
+
+        if counts['inserted'] or counts['updated']:
+            if slots.enabled() or (profiles.enabled() and model is not MarketData):
+                refresh_rollups(model, _stored_rows(model, staged.values(), using), using)
+    return counts
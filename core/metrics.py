@@ -0,0 +1,328 @@
+"""
+Process-safe metrics exposed in the Prometheus text format.
+
+Every process keeps its counters in memory and periodically writes them to
+its own ``<pid>-<token>.json`` file in METRICS_DIR. The ``/metrics`` view
+merges all files, so totals are correct no matter which gunicorn worker is
+scraped. Files of processes that have exited are folded into
+``exited.json``, so restarted workers neither lose nor overwrite counts.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'gna_http_request_duration_seconds': ('histogram', 'API and page latency by URL name'),
+    'gna_nlp_queries_total': ('counter', 'NLP queries processed by intent'),
+    'gna_nlp_query_duration_seconds': ('histogram', 'NLP query latency by intent'),
+    'gna_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'gna_cache_hit_ratio': ('gauge', 'Cache hit ratio since start'),
+    'gna_ingest_rows_total': ('counter', 'Rows written by ingest_data'),
+    'gna_ingest_rows_per_second': ('gauge', 'Ingest throughput of the last run'),
+    'gna_ingest_lag_seconds': ('gauge', 'Age of the newest ingested row'),
+}
+
+
+def _key(name, labels):
+    return name + '|' + ','.join(f'{k}={v}' for k, v in sorted(labels.items()))
+
+
+def _split_key(key):
+    name, _, label_text = key.partition('|')
+    labels = dict(pair.split('=', 1) for pair in label_text.split(',') if pair)
+    return name, labels
+
+
+def _file_pid(filename):
+    try:
+        return int(filename[:-len('.json')].split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def _merge(data, counters, gauges, histograms):
+    for key, value in data['counters'].items():
+        counters[key] += value
+    for key, (value, updated) in data['gauges'].items():
+        if key not in gauges or updated > gauges[key][1]:
+            gauges[key] = (value, updated)
+    for key, histogram in data['histograms'].items():
+        merged = histograms.setdefault(key, {
+            'buckets': histogram['buckets'],
+            'counts': [0] * len(histogram['counts']),
+            'sum': 0.0,
+        })
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+        merged['sum'] += histogram['sum']
+
+
+def _write_json(directory, path, payload):
+    # A private temporary file per write, so concurrent writers never share one
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            handle.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class MetricsStore:
+    def __init__(self, directory=None, flush_interval=None):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        # A reused pid gets a new file rather than the old process's one
+        self.filename = f'{self.pid}-{uuid.uuid4().hex[:8]}.json'
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        # A forked worker must not re-report the counts of its parent
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def get_directory(self):
+        return str(self.directory or settings.METRICS_DIR)
+
+    def inc(self, name, labels=None, amount=1):
+        with self.lock:
+            self._check_fork()
+            self.counters[_key(name, labels or {})] += amount
+        self.maybe_flush()
+
+    def set_gauge(self, name, labels=None, value=0):
+        with self.lock:
+            self._check_fork()
+            self.gauges[_key(name, labels or {})] = [value, time.time()]
+        self.maybe_flush()
+
+    def observe(self, name, labels=None, value=0, buckets=LATENCY_BUCKETS):
+        with self.lock:
+            self._check_fork()
+            key = _key(name, labels or {})
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * (len(buckets) + 1),
+                    'sum': 0.0,
+                }
+            histogram['counts'][bisect_left(histogram['buckets'], value)] += 1
+            histogram['sum'] += value
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        interval = self.flush_interval
+        if interval is None:
+            interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        # Threads of one process take turns; the newest snapshot is written last
+        with self.flush_lock:
+            with self.lock:
+                self._check_fork()
+                payload = json.dumps({
+                    'counters': self.counters,
+                    'gauges': self.gauges,
+                    'histograms': self.histograms,
+                })
+                filename = self.filename
+                self.last_flush = time.monotonic()
+            directory = self.get_directory()
+            os.makedirs(directory, exist_ok=True)
+            _write_json(directory, os.path.join(directory, filename), payload)
+
+    def compact(self):
+        """Fold the files of exited processes into EXITED_FILE."""
+        if fcntl is None:
+            return
+        directory = self.get_directory()
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+            # One compactor per host at a time, or two would both count a file
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                stale = []
+                for filename in os.listdir(directory):
+                    if not filename.endswith('.json') or filename == EXITED_FILE:
+                        continue
+                    pid = _file_pid(filename)
+                    if pid is not None and pid != self.pid and not _running(pid):
+                        stale.append(filename)
+                if not stale:
+                    return
+                counters, gauges, histograms = defaultdict(float), {}, {}
+                for filename in [EXITED_FILE] + stale:
+                    data = self._load(os.path.join(directory, filename))
+                    if data is not None:
+                        _merge(data, counters, gauges, histograms)
+                _write_json(directory, os.path.join(directory, EXITED_FILE), json.dumps({
+                    'counters': counters,
+                    'gauges': gauges,
+                    'histograms': histograms,
+                }))
+                for filename in stale:
+                    os.remove(os.path.join(directory, filename))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self, path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def collect(self):
+        """Merge the metrics written by every process on this host."""
+        self.flush()
+        try:
+            self.compact()
+        except OSError:
+            logger.warning('Could not compact the metrics of exited processes', exc_info=True)
+        counters = defaultdict(float)
+        gauges = {}
+        histograms = {}
+        directory = self.get_directory()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            data = self._load(os.path.join(directory, filename))
+            if data is not None:
+                _merge(data, counters, gauges, histograms)
+        return counters, gauges, histograms
+
+
+store = MetricsStore()
+
+
+def inc(name, labels=None, amount=1):
+    store.inc(name, labels, amount)
+
+
+def set_gauge(name, labels=None, value=0):
+    store.set_gauge(name, labels, value)
+
+
+def observe(name, labels=None, value=0, buckets=LATENCY_BUCKETS):
+    store.observe(name, labels, value, buckets)
+
+
+def record_cache(cache, hit):
+    inc('gna_cache_requests_total', {'cache': cache, 'result': 'hit' if hit else 'miss'})
+
+
+def record_ingest(table, rows, seconds, last_timestamp=None):
+    labels = {'table': table}
+    inc('gna_ingest_rows_total', labels, rows)
+    set_gauge('gna_ingest_rows_per_second', labels, rows / seconds if seconds > 0 else 0)
+    if last_timestamp is not None:
+        if timezone.is_naive(last_timestamp):
+            last_timestamp = timezone.make_aware(last_timestamp)
+        set_gauge('gna_ingest_last_row_timestamp', labels, last_timestamp.timestamp())
+    store.flush()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in sorted(labels.items())
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render():
+    counters, gauges, histograms = store.collect()
+    samples = defaultdict(list)
+
+    for key, value in sorted(counters.items()):
+        name, labels = _split_key(key)
+        samples[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    cache_totals = defaultdict(lambda: {'hit': 0.0, 'miss': 0.0})
+    for key, value in counters.items():
+        name, labels = _split_key(key)
+        if name == 'gna_cache_requests_total':
+            cache_totals[labels['cache']][labels['result']] += value
+    for cache, totals in sorted(cache_totals.items()):
+        lookups = totals['hit'] + totals['miss']
+        ratio = totals['hit'] / lookups if lookups else 0
+        samples['gna_cache_hit_ratio'].append(
+            f'gna_cache_hit_ratio{_format_labels({"cache": cache})} {_format_value(ratio)}'
+        )
+
+    now = time.time()
+    for key, (value, _) in sorted(gauges.items()):
+        name, labels = _split_key(key)
+        if name == 'gna_ingest_last_row_timestamp':
+            name, value = 'gna_ingest_lag_seconds', max(now - value, 0)
+        samples[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    for key, histogram in sorted(histograms.items()):
+        name, labels = _split_key(key)
+        cumulative = 0
+        bounds = [_format_value(b) for b in histogram['buckets']] + ['+Inf']
+        for bound, count in zip(bounds, histogram['counts']):
+            cumulative += count
+            samples[name].append(
+                f'{name}_bucket{_format_labels({**labels, "le": bound})} {cumulative}'
+            )
+        samples[name].append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram["sum"])}')
+        samples[name].append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    lines = []
+    for name in sorted(samples):
+        metric_type, help_text = HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,181 @@
+import logging
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .profiling import Profiler, ProfilerBusy
+
+logger = logging.getLogger(__name__)
+
+_current_timing = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Per-request counters for SQL queries and named timing spans."""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+        self._depth = defaultdict(int)
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+
+    @contextmanager
+    def span(self, name):
+        # Only the outermost span of a given name is timed, so nested
+        # serializers do not count their time twice.
+        self._depth[name] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+            if not self._depth[name]:
+                self.spans[name] += time.perf_counter() - start
+
+    def server_timing(self, total):
+        entries = [
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.query_count} queries"',
+            f'app;dur={max(total - self.db_time, 0) * 1000:.2f}',
+        ]
+        for name, duration in self.spans.items():
+            entries.append(f'{name};dur={duration * 1000:.2f}')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def current_timing():
+    return _current_timing.get()
+
+
+@contextmanager
+def timed(name):
+    """Time a block under ``name`` for the current request, if any."""
+    timing = current_timing()
+    if timing is None:
+        yield
+        return
+    with timing.span(name):
+        yield
+
+
+class QueryTimingMiddleware:
+    """
+    Count SQL queries and split request time into DB, Python and
+    serializer time. The totals are returned in a ``Server-Timing`` header
+    and requests over REQUEST_QUERY_BUDGET / REQUEST_TIME_BUDGET_MS are logged.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.query_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current_timing.reset(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = timing.server_timing(total)
+        request.timing = timing
+        self.check_budgets(request, timing, total)
+        return response
+
+    def check_budgets(self, request, timing, total):
+        query_budget = getattr(settings, 'REQUEST_QUERY_BUDGET', None)
+        time_budget = getattr(settings, 'REQUEST_TIME_BUDGET_MS', None)
+        over_queries = query_budget is not None and timing.query_count > query_budget
+        over_time = time_budget is not None and total * 1000 > time_budget
+        if over_queries or over_time:
+            logger.warning(
+                'Request over budget: %s %s took %.1fms (db %.1fms, serialize %.1fms) with %d queries',
+                request.method,
+                request.path,
+                total * 1000,
+                timing.db_time * 1000,
+                timing.spans.get('serialize', 0.0) * 1000,
+                timing.query_count,
+            )
+
+
+class MetricsMiddleware:
+    """Record request latency per URL name for the /metrics endpoint."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        try:
+            metrics.observe(
+                'gna_http_request_duration_seconds',
+                {'url_name': match.url_name if match else 'unmatched', 'method': request.method},
+                time.perf_counter() - start,
+            )
+        except Exception:
+            # Losing a sample is better than failing the request
+            logger.warning('Could not record request metrics', exc_info=True)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Let staff users profile any core URL with ``?profile=1`` or an
+    ``X-Profile: 1`` header. The normal response is replaced by a JSON summary
+    of the cProfile stats and SQL statements, with the original body embedded.
+    ``profile=flamegraph`` also writes collapsed stack samples to PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get('profile') or request.headers.get('X-Profile')
+        if not mode or mode == '0':
+            return self.get_response(request)
+        user = getattr(request, 'user', None)
+        if not (user and user.is_authenticated and user.is_staff):
+            return self.get_response(request)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        if match.namespace != 'core':
+            return self.get_response(request)
+
+        profiler = Profiler(flamegraph=mode == 'flamegraph')
+        try:
+            response = profiler.run(self.get_response, request)
+        except ProfilerBusy:
+            # A concurrent request holds the profiler; serve this one unprofiled
+            logger.info('Profiling skipped for %s: another request is being profiled', request.path)
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'busy'
+            return response
+        summary = profiler.summary(match.url_name)
+        summary['status_code'] = response.status_code
+        if not response.streaming:
+            summary['response'] = response.content.decode(response.charset, errors='replace')
+        return JsonResponse(summary)
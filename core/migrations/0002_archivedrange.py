@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('table', models.CharField(max_length=100, unique=True)),
+                ('archived_before', models.DateField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
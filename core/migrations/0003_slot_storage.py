@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:20
+
+import core.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_archivedrange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField(help_text='Days since 1970-01-01 x 96 + block - 1')),
+                ('mcp', core.fields.FixedPointField(decimal_places=2, help_text='Market Clearing Price in paise')),
+                ('mcv', core.fields.FixedPointField(decimal_places=3, help_text='Market Clearing Volume in kWh')),
+                ('purchase_bid_volume', core.fields.FixedPointField(decimal_places=3, default=0)),
+                ('sell_bid_volume', core.fields.FixedPointField(decimal_places=3, default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.product')),
+            ],
+            options={
+                'ordering': ['-slot'],
+                'unique_together': {('product', 'slot')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LoadSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('scheduled_drawal', core.fields.FixedPointField(decimal_places=3)),
+                ('actual_drawal', core.fields.FixedPointField(blank=True, decimal_places=3, null=True)),
+                ('discom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.discom')),
+            ],
+            options={
+                'ordering': ['-slot'],
+                'unique_together': {('discom', 'slot')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GenerationSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField()),
+                ('scheduled_generation', core.fields.FixedPointField(decimal_places=3)),
+                ('actual_generation', core.fields.FixedPointField(blank=True, decimal_places=3, null=True)),
+                ('generator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.generator')),
+            ],
+            options={
+                'ordering': ['-slot'],
+                'unique_together': {('generator', 'slot')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:22
+
+import core.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_slot_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('scheduled_drawal', core.fields.BlockArrayField(decimal_places=3, length=96)),
+                ('actual_drawal', core.fields.BlockArrayField(decimal_places=3, length=96)),
+                ('discom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.discom')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('discom', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GenerationProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('scheduled_generation', core.fields.BlockArrayField(decimal_places=3, length=96)),
+                ('actual_generation', core.fields.BlockArrayField(decimal_places=3, length=96)),
+                ('generator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.generator')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('generator', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:25
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_turnover(apps, schema_editor):
+    MarketData = apps.get_model('core', 'MarketData')
+    MarketData.objects.using(schema_editor.connection.alias).update(turnover=F('mcp') * F('mcv'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_day_profiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketdata',
+            name='turnover',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, help_text='mcp × mcv, kept in step on save and bulk ingest', max_digits=25, null=True),
+        ),
+        migrations.RunPython(backfill_turnover, migrations.RunPython.noop),
+    ]
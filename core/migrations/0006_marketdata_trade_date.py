@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:26
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_trade_date(apps, schema_editor):
+    # TruncDate converts to the current time zone (TIME_ZONE, Asia/Kolkata)
+    MarketData = apps.get_model('core', 'MarketData')
+    MarketData.objects.using(schema_editor.connection.alias).update(trade_date=TruncDate('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_marketdata_turnover'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketdata',
+            name='trade_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, help_text='Market (IST) day of the timestamp, kept in step on save and bulk ingest', null=True),
+        ),
+        migrations.RunPython(backfill_trade_date, migrations.RunPython.noop),
+    ]
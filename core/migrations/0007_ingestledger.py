@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_marketdata_trade_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('size', models.BigIntegerField(default=0, help_text='File size when last read')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes ingested and committed')),
+                ('content_hash', models.CharField(blank=True, help_text='SHA-256 of the first `offset` bytes', max_length=64)),
+                ('rows', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_ingestledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestledger',
+            name='complete',
+            field=models.BooleanField(default=False, help_text='A compressed file or zip member read to the end'),
+        ),
+        migrations.AlterField(
+            model_name='ingestledger',
+            name='offset',
+            field=models.BigIntegerField(default=0, help_text='Bytes ingested and committed, after decompression'),
+        ),
+        migrations.AlterField(
+            model_name='ingestledger',
+            name='path',
+            field=models.CharField(help_text='File path, or bundle::member for zip members', max_length=500, unique=True),
+        ),
+    ]
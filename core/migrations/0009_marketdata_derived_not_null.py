@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:05
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import TruncDate
+
+
+def backfill_derived_fields(apps, schema_editor):
+    # Rows written by QuerySet.update, a plain bulk_create or raw SQL since
+    # 0005 and 0006 may still be NULL
+    MarketData = apps.get_model('core', 'MarketData')
+    rows = MarketData.objects.using(schema_editor.connection.alias)
+    rows.filter(turnover__isnull=True).update(turnover=F('mcp') * F('mcv'))
+    rows.filter(trade_date__isnull=True).update(trade_date=TruncDate('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_ingestledger_complete'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_derived_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='marketdata',
+            name='trade_date',
+            field=models.DateField(db_index=True, editable=False, help_text='Market (IST) day of the timestamp, kept in step on save and bulk ingest'),
+        ),
+        migrations.AlterField(
+            model_name='marketdata',
+            name='turnover',
+            field=models.DecimalField(decimal_places=4, editable=False, help_text='mcp × mcv, kept in step on save and bulk ingest', max_digits=25),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_marketdata_derived_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestledger',
+            name='hash_start',
+            field=models.BigIntegerField(default=0, help_text='Start of the hashed tail window; 0 hashes the whole prefix'),
+        ),
+        migrations.AlterField(
+            model_name='ingestledger',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the header and bytes hash_start to offset', max_length=64),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_ingestledger_hash_start'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100)),
+                ('entity_id', models.BigIntegerField(help_text='Product, discom or generator id')),
+                ('date', models.DateField(help_text='trade_date for market data')),
+                ('block_number', models.IntegerField()),
+                ('timestamp', models.DateTimeField(blank=True, help_text='Market data only', null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='generationschedule',
+            index=models.Index(fields=['updated_at'], name='core_genera_updated_5bc665_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loadschedule',
+            index=models.Index(fields=['updated_at'], name='core_loadsc_updated_eccbe5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketdata',
+            index=models.Index(fields=['updated_at'], name='core_market_updated_6258b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedblock',
+            index=models.Index(fields=['table', 'deleted_at'], name='core_delete_table_530e87_idx'),
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import TruncDate
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from . import profiles, slots
+from .fields import BlockArrayField, FixedPointField
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -33,18 +38,75 @@ class Discom(BaseModel):
     def __str__(self):
         return self.name
 
+class MarketDataQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create skips save(), so fill the derived columns here."""
+        objs = list(objs)
+        for obj in objs:
+            obj.fill_derived_fields()
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def update(self, **kwargs):
+        """Recompute the derived columns in the same UPDATE when mcp, mcv or timestamp change."""
+        def new_value(name):
+            value = kwargs.get(name, F(name))
+            if hasattr(value, 'resolve_expression'):
+                return value
+            return Value(value, output_field=self.model._meta.get_field(name))
+        
+        if {'mcp', 'mcv'} & kwargs.keys() and 'turnover' not in kwargs:
+            kwargs['turnover'] = ExpressionWrapper(
+                new_value('mcp') * new_value('mcv'), output_field=self.model._meta.get_field('turnover')
+            )
+        if 'timestamp' in kwargs and 'trade_date' not in kwargs:
+            # TruncDate converts to TIME_ZONE, the market's time zone
+            kwargs['trade_date'] = TruncDate(new_value('timestamp'))
+        return super().update(**kwargs)
+
 class MarketData(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     timestamp = models.DateTimeField()
+    trade_date = models.DateField(
+        editable=False, db_index=True,
+        help_text="Market (IST) day of the timestamp, kept in step on save and bulk ingest"
+    )
     block_number = models.IntegerField(validators=[MinValueValidator(1)])  # 1-96 for 15-min blocks
     mcp = models.DecimalField(max_digits=10, decimal_places=2, help_text="Market Clearing Price")
     mcv = models.DecimalField(max_digits=15, decimal_places=2, help_text="Market Clearing Volume")
     purchase_bid_volume = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     sell_bid_volume = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    turnover = models.DecimalField(
+        max_digits=25, decimal_places=4, editable=False,
+        help_text="mcp × mcv, kept in step on save and bulk ingest"
+    )
+    
+    objects = MarketDataQuerySet.as_manager()
     
     class Meta:
         ordering = ['-timestamp', 'block_number']
         unique_together = ['product', 'timestamp', 'block_number']
+        # Newest-write lookups of the analytics sidecar and snapshot (core/changes.py)
+        indexes = [models.Index(fields=['updated_at'])]
+    
+    def fill_derived_fields(self):
+        """Set the stored columns derived from the row's values."""
+        self.trade_date = None if self.timestamp is None else slots.market_day(self.timestamp)
+        if self.mcp is None or self.mcv is None:
+            self.turnover = None
+        else:
+            self.turnover = Decimal(str(self.mcp)) * Decimal(str(self.mcv))
+    
+    def save(self, *args, **kwargs):
+        self.fill_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'mcp', 'mcv'} & update_fields:
+                update_fields.add('turnover')
+            if 'timestamp' in update_fields:
+                update_fields.add('trade_date')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
 class LoadSchedule(BaseModel):
     discom = models.ForeignKey(Discom, on_delete=models.CASCADE)
@@ -56,6 +118,8 @@ class LoadSchedule(BaseModel):
     class Meta:
         ordering = ['-date', 'block_number']
         unique_together = ['discom', 'date', 'block_number']
+        # Newest-write lookups of the analytics sidecar and snapshot (core/changes.py)
+        indexes = [models.Index(fields=['updated_at'])]
 
 class GenerationSchedule(BaseModel):
     generator = models.ForeignKey(Generator, on_delete=models.CASCADE)
@@ -67,6 +131,8 @@ class GenerationSchedule(BaseModel):
     class Meta:
         ordering = ['-date', 'block_number']
         unique_together = ['generator', 'date', 'block_number']
+        # Newest-write lookups of the analytics sidecar and snapshot (core/changes.py)
+        indexes = [models.Index(fields=['updated_at'])]
 
 # Legacy models for backward compatibility
 class IEXData(BaseModel):
@@ -93,3 +159,129 @@ class GenerationData(BaseModel):
     
     class Meta:
         ordering = ['-timestamp']
+
+class ArchivedRange(BaseModel):
+    """Rows of `table` dated before `archived_before` live in the archive database."""
+    table = models.CharField(max_length=100, unique=True)
+    archived_before = models.DateField()
+    
+    def __str__(self):
+        return f"{self.table} < {self.archived_before}"
+
+class DeletedBlock(models.Model):
+    """A deleted MarketData/LoadSchedule/GenerationSchedule key (see core/changes.py)."""
+    table = models.CharField(max_length=100)
+    entity_id = models.BigIntegerField(help_text="Product, discom or generator id")
+    date = models.DateField(help_text="trade_date for market data")
+    block_number = models.IntegerField()
+    timestamp = models.DateTimeField(null=True, blank=True, help_text="Market data only")
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [models.Index(fields=['table', 'deleted_at'])]
+    
+    def __str__(self):
+        return f"{self.table} {self.entity_id} {self.date} #{self.block_number}"
+
+class IngestLedger(BaseModel):
+    """How much of an ingested file is already in the database (see core/ingest.py)."""
+    path = models.CharField(max_length=500, unique=True, help_text="File path, or bundle::member for zip members")
+    size = models.BigIntegerField(default=0, help_text="File size when last read")
+    offset = models.BigIntegerField(default=0, help_text="Bytes ingested and committed, after decompression")
+    content_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the header and bytes hash_start to offset")
+    hash_start = models.BigIntegerField(default=0, help_text="Start of the hashed tail window; 0 hashes the whole prefix")
+    rows = models.BigIntegerField(default=0)
+    complete = models.BooleanField(default=False, help_text="A compressed file or zip member read to the end")
+    
+    def __str__(self):
+        return f"{self.path} @ {self.offset}"
+
+# Slot-indexed, fixed-point layout (see core/slots.py). These tables skip the
+# BaseModel timestamps to keep rows narrow.
+class MarketSlot(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    slot = models.IntegerField(help_text="Days since 1970-01-01 x 96 + block - 1")
+    mcp = FixedPointField(decimal_places=2, help_text="Market Clearing Price in paise")
+    mcv = FixedPointField(decimal_places=3, help_text="Market Clearing Volume in kWh")
+    purchase_bid_volume = FixedPointField(decimal_places=3, default=0)
+    sell_bid_volume = FixedPointField(decimal_places=3, default=0)
+    
+    class Meta:
+        ordering = ['-slot']
+        unique_together = ['product', 'slot']
+    
+    @property
+    def date(self):
+        return slots.slot_date(self.slot)
+    
+    @property
+    def block_number(self):
+        return slots.slot_block(self.slot)
+    
+    @property
+    def timestamp(self):
+        return slots.slot_timestamp(self.slot)
+
+class LoadSlot(models.Model):
+    discom = models.ForeignKey(Discom, on_delete=models.CASCADE)
+    slot = models.IntegerField()
+    scheduled_drawal = FixedPointField(decimal_places=3)
+    actual_drawal = FixedPointField(decimal_places=3, null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-slot']
+        unique_together = ['discom', 'slot']
+    
+    @property
+    def date(self):
+        return slots.slot_date(self.slot)
+    
+    @property
+    def block_number(self):
+        return slots.slot_block(self.slot)
+
+class GenerationSlot(models.Model):
+    generator = models.ForeignKey(Generator, on_delete=models.CASCADE)
+    slot = models.IntegerField()
+    scheduled_generation = FixedPointField(decimal_places=3)
+    actual_generation = FixedPointField(decimal_places=3, null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-slot']
+        unique_together = ['generator', 'slot']
+    
+    @property
+    def date(self):
+        return slots.slot_date(self.slot)
+    
+    @property
+    def block_number(self):
+        return slots.slot_block(self.slot)
+
+# One row per entity and day, with the 96 block values packed into arrays
+# (see core/profiles.py)
+class LoadProfile(BaseModel):
+    discom = models.ForeignKey(Discom, on_delete=models.CASCADE)
+    date = models.DateField()
+    scheduled_drawal = BlockArrayField()
+    actual_drawal = BlockArrayField()
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['discom', 'date']
+    
+    def blocks(self):
+        return profiles.unpack_blocks(self.scheduled_drawal, self.actual_drawal)
+
+class GenerationProfile(BaseModel):
+    generator = models.ForeignKey(Generator, on_delete=models.CASCADE)
+    date = models.DateField()
+    scheduled_generation = BlockArrayField()
+    actual_generation = BlockArrayField()
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['generator', 'date']
+    
+    def blocks(self):
+        return profiles.unpack_blocks(self.scheduled_generation, self.actual_generation)
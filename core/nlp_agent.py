@@ -1,6 +1,9 @@
 import re
+import time
 from datetime import datetime, timedelta
-from django.db.models import Avg, Sum, Min, Max
+from django.db.models import Avg, Sum, Min, Max, Count
+from . import analytics, metrics, refdata, tiering
+from .routers import replica_reads
 from .models import MarketData, LoadSchedule, GenerationSchedule, Product
 
 class NLPAgent:
@@ -45,20 +48,24 @@ class NLPAgent:
 
     def process_query(self, query):
         query = query.lower().strip()
-        
-        # Detect query type and extract parameters
-        if self._match_patterns(query, 'average_price'):
-            return self._handle_average_price(query)
-        elif self._match_patterns(query, 'total_volume'):
-            return self._handle_total_volume(query)
-        elif self._match_patterns(query, 'load_data'):
-            return self._handle_load_data(query)
-        elif self._match_patterns(query, 'generation_data'):
-            return self._handle_generation_data(query)
-        elif self._match_patterns(query, 'price_trend'):
-            return self._handle_price_trend(query)
-        else:
-            return self._handle_general_query(query)
+        intent = self._detect_intent(query)
+        handler = getattr(self, f'_handle_{intent}')
+        
+        start = time.perf_counter()
+        try:
+            with replica_reads():
+                return handler(query)
+        finally:
+            labels = {'intent': intent}
+            metrics.inc('gna_nlp_queries_total', labels)
+            metrics.observe('gna_nlp_query_duration_seconds', labels, time.perf_counter() - start)
+
+    def _detect_intent(self, query):
+        # Pattern groups are checked in order; the first match wins
+        for intent in ('average_price', 'total_volume', 'load_data', 'generation_data', 'price_trend'):
+            if self._match_patterns(query, intent):
+                return intent
+        return 'general_query'
 
     def _match_patterns(self, query, pattern_type):
         patterns = self.patterns.get(pattern_type, [])
@@ -94,30 +101,63 @@ class NLPAgent:
             return 'RTM'
         return None
 
+    def _analytics_product(self, product_name):
+        """(usable, product id) for a sidecar query; unknown products are left to the database."""
+        if not analytics.enabled():
+            return False, None
+        if not product_name:
+            return True, None
+        product_id = refdata.products.id_for(product_name)
+        return product_id is not None, product_id
+
+    def _market_totals_from_analytics(self, start_date, end_date, product_name):
+        usable, product_id = self._analytics_product(product_name)
+        return analytics.market_totals(start_date, end_date, product_id) if usable else None
+
+    def _daily_totals_from_analytics(self, start_date, end_date, product_name):
+        usable, product_id = self._analytics_product(product_name)
+        days = analytics.market_daily(start_date, end_date, product_id) if usable else None
+        if days is None:
+            return None
+        # market_daily groups by product as well; the trend is across products
+        groups = {}
+        for row in days:
+            group = groups.setdefault(row['date'], {'trade_date': row['date'], 'total_volume': 0, 'turnover': 0})
+            group['total_volume'] += row['total_volume'] or 0
+            group['turnover'] += row['turnover'] or 0
+        return [groups[day] for day in sorted(groups)]
+
     def _handle_average_price(self, query):
         start_date, end_date = self._extract_time_period(query)
         product_name = self._extract_product(query)
         
         queryset = MarketData.objects.filter(
-            timestamp__date__gte=start_date,
-            timestamp__date__lte=end_date
+            trade_date__gte=start_date,
+            trade_date__lte=end_date
         )
         
         if product_name:
-            queryset = queryset.filter(product__name=product_name)
-        
-        if not queryset.exists():
+            queryset = refdata.filter_by_name(queryset, 'product', product_name)
+        
+        totals = self._market_totals_from_analytics(start_date, end_date, product_name)
+        if totals is None:
+            totals = tiering.aggregate(
+                tiering.tiers(queryset, start_date),
+                rows=Count('id'),
+                total_volume=Sum('mcv'),
+                turnover=Sum('turnover'),
+            )
+        
+        if not totals['rows']:
             return {
                 'response': f"No data found for the specified period ({start_date} to {end_date})",
                 'data': None
             }
         
         # Calculate weighted average
-        total_volume = queryset.aggregate(Sum('mcv'))['mcv__sum'] or 0
+        total_volume = totals['total_volume'] or 0
         if total_volume > 0:
-            weighted_avg = sum(
-                float(item.mcp * item.mcv) for item in queryset
-            ) / float(total_volume)
+            weighted_avg = float(totals['turnover'] or 0) / float(total_volume)
         else:
             weighted_avg = 0
         
@@ -139,14 +179,17 @@ class NLPAgent:
         product_name = self._extract_product(query)
         
         queryset = MarketData.objects.filter(
-            timestamp__date__gte=start_date,
-            timestamp__date__lte=end_date
+            trade_date__gte=start_date,
+            trade_date__lte=end_date
         )
         
         if product_name:
-            queryset = queryset.filter(product__name=product_name)
+            queryset = refdata.filter_by_name(queryset, 'product', product_name)
         
-        total_volume = queryset.aggregate(Sum('mcv'))['mcv__sum'] or 0
+        totals = self._market_totals_from_analytics(start_date, end_date, product_name)
+        if totals is None:
+            totals = tiering.aggregate(tiering.tiers(queryset, start_date), total_volume=Sum('mcv'))
+        total_volume = totals['total_volume'] or 0
         
         product_text = f" for {product_name}" if product_name else ""
         period_text = f"from {start_date} to {end_date}"
@@ -168,7 +211,11 @@ class NLPAgent:
             date__lte=end_date
         )
         
-        total_load = queryset.aggregate(Sum('scheduled_drawal'))['scheduled_drawal__sum'] or 0
+        total_load = analytics.schedule_total(LoadSchedule, 'scheduled_drawal', start_date, end_date)
+        if total_load is None:
+            total_load = tiering.aggregate(
+                tiering.tiers(queryset, start_date), total_load=Sum('scheduled_drawal')
+            )['total_load'] or 0
         avg_daily_load = total_load / max((end_date - start_date).days, 1) if total_load > 0 else 0
         
         period_text = f"from {start_date} to {end_date}"
@@ -190,7 +237,11 @@ class NLPAgent:
             date__lte=end_date
         )
         
-        total_generation = queryset.aggregate(Sum('scheduled_generation'))['scheduled_generation__sum'] or 0
+        total_generation = analytics.schedule_total(GenerationSchedule, 'scheduled_generation', start_date, end_date)
+        if total_generation is None:
+            total_generation = tiering.aggregate(
+                tiering.tiers(queryset, start_date), total_generation=Sum('scheduled_generation')
+            )['total_generation'] or 0
         avg_daily_generation = total_generation / max((end_date - start_date).days, 1) if total_generation > 0 else 0
         
         period_text = f"from {start_date} to {end_date}"
@@ -209,30 +260,32 @@ class NLPAgent:
         start_date, end_date = self._extract_time_period(query)
         
         queryset = MarketData.objects.filter(
-            timestamp__date__gte=start_date,
-            timestamp__date__lte=end_date
+            trade_date__gte=start_date,
+            trade_date__lte=end_date
         )
         
         if product_name:
-            queryset = queryset.filter(product__name=product_name)
+            queryset = refdata.filter_by_name(queryset, 'product', product_name)
         
         # Group by date and calculate daily averages
+        groups = self._daily_totals_from_analytics(start_date, end_date, product_name)
+        if groups is None:
+            groups = tiering.group(
+                tiering.tiers(queryset, start_date),
+                ['trade_date'],
+                total_volume=Sum('mcv'),
+                turnover=Sum('turnover'),
+            )
+        
         daily_data = []
-        current_date = start_date
-        while current_date <= end_date:
-            day_data = queryset.filter(timestamp__date=current_date)
-            if day_data.exists():
-                total_volume = day_data.aggregate(Sum('mcv'))['mcv__sum'] or 0
-                if total_volume > 0:
-                    weighted_avg = sum(
-                        float(item.mcp * item.mcv) for item in day_data
-                    ) / float(total_volume)
-                    daily_data.append({
-                        'date': current_date.isoformat(),
-                        'price': round(weighted_avg, 2),
-                        'volume': float(total_volume)
-                    })
-            current_date += timedelta(days=1)
+        for row in groups:
+            total_volume = row['total_volume'] or 0
+            if total_volume > 0:
+                daily_data.append({
+                    'date': row['trade_date'].isoformat(),
+                    'price': round(float(row['turnover'] or 0) / float(total_volume), 2),
+                    'volume': float(total_volume)
+                })
         
         product_text = f" for {product_name}" if product_name else ""
         
@@ -0,0 +1,143 @@
+"""
+Wide, one-row-per-day storage for LoadSchedule and GenerationSchedule.
+
+LoadProfile and GenerationProfile hold a discom's or generator's 96 block
+values for one day in packed BlockArrayField columns, so a day profile is a
+single row read instead of 96. ``build_day_profiles`` converts existing
+schedules; with DAY_PROFILE_STORAGE enabled, schedule saves and deletes
+update the matching block in place and load_aggregation reads the profiles.
+"""
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+BLOCKS_PER_DAY = 96
+
+# schedule model name -> (profile model name, entity field, scheduled field, actual field)
+PROFILE_SOURCES = {
+    'LoadSchedule': ('LoadProfile', 'discom', 'scheduled_drawal', 'actual_drawal'),
+    'GenerationSchedule': ('GenerationProfile', 'generator', 'scheduled_generation', 'actual_generation'),
+}
+
+
+def enabled():
+    return getattr(settings, 'DAY_PROFILE_STORAGE', False)
+
+
+def empty_blocks():
+    return [None] * BLOCKS_PER_DAY
+
+
+def unpack_blocks(scheduled, actual):
+    return [
+        {'block_number': block, 'scheduled': s, 'actual': a}
+        for block, (s, a) in enumerate(zip(scheduled, actual), start=1)
+    ]
+
+
+def _profile_model(schedule_model):
+    from django.apps import apps
+    profile_name, entity, scheduled, actual = PROFILE_SOURCES[schedule_model.__name__]
+    return apps.get_model('core', profile_name), entity, scheduled, actual
+
+
+def build_profiles(queryset, batch_size=500):
+    """Convert a LoadSchedule/GenerationSchedule queryset into day profiles."""
+    profile_model, entity, scheduled, actual = _profile_model(queryset.model)
+    rows = queryset.order_by(f'{entity}_id', 'date', 'block_number').values_list(
+        f'{entity}_id', 'date', 'block_number', scheduled, actual
+    )
+    pending = []
+    converted = 0
+    for (entity_id, day), blocks in groupby(rows.iterator(), key=lambda row: (row[0], row[1])):
+        scheduled_values = empty_blocks()
+        actual_values = empty_blocks()
+        for _, _, block, scheduled_value, actual_value in blocks:
+            scheduled_values[block - 1] = scheduled_value
+            actual_values[block - 1] = actual_value
+        pending.append(profile_model(**{
+            f'{entity}_id': entity_id,
+            'date': day,
+            scheduled: scheduled_values,
+            actual: actual_values,
+        }))
+        if len(pending) >= batch_size:
+            converted += _upsert(profile_model, entity, scheduled, actual, pending)
+            pending = []
+    if pending:
+        converted += _upsert(profile_model, entity, scheduled, actual, pending)
+    return converted
+
+
+def refresh(schedule_model, objs, using='default'):
+    """Rebuild the day profiles touched by schedule rows bulk-written to ``using``."""
+    _, entity, _, _ = _profile_model(schedule_model)
+    days = {obj.date for obj in objs}
+    entity_ids = {getattr(obj, f'{entity}_id') for obj in objs}
+    if days:
+        build_profiles(schedule_model.objects.using(using).filter(**{
+            'date__in': days, f'{entity}_id__in': entity_ids
+        }))
+
+
+def _upsert(profile_model, entity, scheduled, actual, objs):
+    profile_model.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=[entity, 'date'],
+        update_fields=[scheduled, actual, 'updated_at'],
+    )
+    return len(objs)
+
+
+def _locked_profile(profile_model, key, defaults, using):
+    """The day profile for ``key``, write-locked until the surrounding transaction ends."""
+    profiles = profile_model.objects.using(using)
+    profiles.get_or_create(**key, defaults=defaults)
+    if connections[using].features.has_select_for_update:
+        return profiles.select_for_update().get(**key)
+    # SQLite has no row locks: the UPDATE takes the database write lock
+    # before the blocks are read, so concurrent savers queue
+    profiles.filter(**key).update(updated_at=timezone.now())
+    return profiles.get(**key)
+
+
+def update_saved_block(sender, instance, raw=False, using='default', **kwargs):
+    """
+    post_save receiver writing a saved schedule block into its day profile.
+    Bulk writes skip it and rebuild their days once through ``refresh``.
+    Profiles of both tiers live on the primary.
+    """
+    if not enabled() or raw:
+        return
+    _, _, scheduled, actual = _profile_model(sender)
+    _write_block(sender, instance, getattr(instance, scheduled), getattr(instance, actual))
+
+
+def clear_deleted_block(sender, instance, using='default', **kwargs):
+    """
+    post_delete receiver emptying a deleted schedule block in its day
+    profile. Archive moves keep the block, as they do for the slot tables.
+    """
+    from .tiering import is_moving
+    if not enabled() or is_moving():
+        return
+    _write_block(sender, instance, None, None)
+
+
+def _write_block(sender, instance, scheduled_value, actual_value, using='default'):
+    profile_model, entity, scheduled, actual = _profile_model(sender)
+    key = {f'{entity}_id': getattr(instance, f'{entity}_id'), 'date': instance.date}
+    with transaction.atomic(using=using):
+        profile = _locked_profile(profile_model, key, {scheduled: empty_blocks(), actual: empty_blocks()}, using)
+        scheduled_values = getattr(profile, scheduled)
+        actual_values = getattr(profile, actual)
+        scheduled_values[instance.block_number - 1] = scheduled_value
+        actual_values[instance.block_number - 1] = actual_value
+        profile_model.objects.using(using).filter(pk=profile.pk).update(**{
+            scheduled: scheduled_values,
+            actual: actual_values,
+            'updated_at': timezone.now(),
+        })
@@ -0,0 +1,127 @@
+"""
+On-demand request profiling for staff users.
+
+``Profiler`` runs cProfile around a request and records every SQL statement.
+With ``flamegraph=True`` it also samples the request thread's stack and
+writes the samples in the collapsed format read by flamegraph.pl and
+speedscope.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+class StackSampler(threading.Thread):
+    """Sample another thread's call stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+class ProfilerBusy(Exception):
+    """Another profiler is active; Python 3.12+ allows one per process."""
+
+
+class Profiler:
+    def __init__(self, flamegraph=False, limit=40):
+        self.flamegraph = flamegraph
+        self.limit = limit
+        self.queries = []
+        self.profile = cProfile.Profile()
+        self.sampler = None
+        self.duration = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'time_ms': round((time.perf_counter() - start) * 1000, 3),
+                'database': context['connection'].alias,
+            })
+
+    def run(self, func, *args, **kwargs):
+        """Call ``func`` under the profiler; raises ProfilerBusy without calling it."""
+        try:
+            self.profile.enable()
+        except ValueError as exc:
+            raise ProfilerBusy(str(exc))
+        if self.flamegraph:
+            self.sampler = StackSampler(
+                threading.get_ident(),
+                getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001),
+            )
+            self.sampler.start()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.record_query))
+                return func(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            self.duration = time.perf_counter() - start
+            if self.sampler:
+                self.sampler.stop()
+
+    def stats_text(self):
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(self.limit)
+        return stream.getvalue()
+
+    def write_flamegraph(self, name):
+        directory = str(settings.PROFILE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.folded')
+        with open(path, 'w') as handle:
+            handle.write(self.sampler.collapsed())
+        return path
+
+    def summary(self, name):
+        result = {
+            'view': name,
+            'duration_ms': round(self.duration * 1000, 3),
+            'query_count': len(self.queries),
+            'db_time_ms': round(sum(q['time_ms'] for q in self.queries), 3),
+            'queries': self.queries,
+            'profile': self.stats_text(),
+        }
+        if self.sampler:
+            result['sample_count'] = sum(self.sampler.samples.values())
+            result['flamegraph_file'] = self.write_flamegraph(name)
+        return result
@@ -0,0 +1,110 @@
+"""
+Process-wide cache of the reference tables (Product, Discom, Generator).
+
+The tables are tiny and change only through the admin or ingest setup, so
+each process keeps them in memory: names resolve to ids for join-free
+``<fk>_id`` filters, and ids resolve to the objects that serializers and
+templates display. Saves and deletes clear the local cache through signals;
+other processes pick changes up after REFERENCE_CACHE_TTL seconds, or
+sooner when they are asked for a name they have not seen.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# A miss reloads the table, but not more often than this
+MISS_RELOAD_INTERVAL = 5
+
+
+class ReferenceCache:
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        # (by_id, by_name, loaded_at), replaced as a whole so readers need no lock
+        self._snapshot = None
+
+    @property
+    def model(self):
+        from django.apps import apps
+        return apps.get_model('core', self.model_name)
+
+    def _load(self):
+        # Reference rows are written to the primary; replicas may lag behind
+        objects = list(self.model.objects.using('default').order_by('name'))
+        snapshot = (
+            {obj.pk: obj for obj in objects},
+            {obj.name: obj.pk for obj in objects},
+            time.monotonic(),
+        )
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _current(self, record=False):
+        snapshot = self._snapshot
+        ttl = getattr(settings, 'REFERENCE_CACHE_TTL', 300)
+        hit = snapshot is not None and time.monotonic() - snapshot[2] < ttl
+        if record:
+            metrics.record_cache('reference', hit)
+        return snapshot if hit else self._load()
+
+    def _reload_on_miss(self, snapshot):
+        if time.monotonic() - snapshot[2] > MISS_RELOAD_INTERVAL:
+            return self._load()
+        return snapshot
+
+    def invalidate(self, **kwargs):
+        with self._lock:
+            self._snapshot = None
+
+    def id_for(self, name):
+        """Primary key for a name, or None if no such row exists."""
+        snapshot = self._current(record=True)
+        if name not in snapshot[1]:
+            snapshot = self._reload_on_miss(snapshot)
+        return snapshot[1].get(name)
+
+    def get(self, pk):
+        snapshot = self._current()
+        if pk is not None and pk not in snapshot[0]:
+            snapshot = self._reload_on_miss(snapshot)
+        return snapshot[0].get(pk)
+
+    def name_for(self, pk):
+        obj = self.get(pk)
+        return None if obj is None else obj.name
+
+    def all(self):
+        """All rows, ordered by name."""
+        return list(self._current(record=True)[0].values())
+
+
+products = ReferenceCache('Product')
+discoms = ReferenceCache('Discom')
+generators = ReferenceCache('Generator')
+
+CACHES = {
+    'product': products,
+    'discom': discoms,
+    'generator': generators,
+}
+
+
+def filter_by_name(queryset, field, name):
+    """Filter ``queryset`` on ``<field>_id`` for the named reference row."""
+    pk = CACHES[field].id_for(name)
+    if pk is None:
+        return queryset.none()
+    return queryset.filter(**{f'{field}_id': pk})
+
+
+def attach(instance, field):
+    """Set the cached reference object on ``instance`` so ``instance.<field>`` needs no query."""
+    model_field = instance._meta.get_field(field)
+    if not model_field.is_cached(instance):
+        obj = CACHES[field].get(getattr(instance, model_field.attname))
+        if obj is not None:
+            model_field.set_cached_value(instance, obj)
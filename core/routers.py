@@ -0,0 +1,111 @@
+"""
+Database routers.
+
+``ReadReplicaRouter`` sends reads made inside ``replica_reads()`` (the
+analytics views and NLPAgent) to one of the DATABASE_REPLICAS, and every
+write to ``default``. A replica whose newest MarketData row is more than
+REPLICA_MAX_LAG_SECONDS behind the primary is considered stale; reads then
+go to the primary unless REPLICA_STALE_FALLBACK is ``'replica'``.
+
+``ArchiveRouter`` keeps the archive database limited to the core tables;
+queries reach it only through an explicit ``using()`` in core.tiering.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_lag_cache = {}
+_lag_lock = threading.Lock()
+_round_robin = itertools.count()
+
+
+@contextmanager
+def replica_reads():
+    """Route ORM reads made inside the block to a read replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_replicas(view_func):
+    """View decorator that serves the view's reads from a replica."""
+    @wraps(view_func)
+    def wrapped(*args, **kwargs):
+        with replica_reads():
+            return view_func(*args, **kwargs)
+    return wrapped
+
+
+def _newest_created_at(alias):
+    from .models import MarketData
+    return MarketData.objects.using(alias).order_by('-pk').values_list('created_at', flat=True).first()
+
+
+def replica_lag(alias):
+    """Seconds the replica's newest MarketData row trails the primary's."""
+    primary = _newest_created_at('default')
+    if primary is None:
+        return 0.0
+    replica = _newest_created_at(alias)
+    if replica is None:
+        return float('inf')
+    return max((primary - replica).total_seconds(), 0.0)
+
+
+def is_stale(alias):
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 30)
+    now = time.monotonic()
+    with _lag_lock:
+        cached = _lag_cache.get(alias)
+        if cached and now - cached[1] < interval:
+            return cached[0]
+    try:
+        stale = replica_lag(alias) > getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 300)
+    except Exception:
+        # An unreachable replica is treated like a stale one
+        stale = True
+    with _lag_lock:
+        _lag_cache[alias] = (stale, now)
+    return stale
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or not _replica_reads.get():
+            return None
+        start = next(_round_robin)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if not is_stale(alias):
+                return alias
+        if getattr(settings, 'REPLICA_STALE_FALLBACK', 'primary') == 'replica':
+            return replicas[start % len(replicas)]
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class ArchiveRouter:
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == getattr(settings, 'ARCHIVE_DATABASE', None):
+            return app_label == 'core'
+        return None
@@ -1,8 +1,26 @@
 from rest_framework import serializers
 from .models import (
     Product, Generator, Discom, MarketData, LoadSchedule, 
-    GenerationSchedule, IEXData, LoadData, GenerationData
+    GenerationSchedule, IEXData, LoadData, GenerationData,
+    MarketSlot, LoadSlot, GenerationSlot, LoadProfile, GenerationProfile
 )
+from . import refdata
+from .middleware import timed
+
+class TimedSerializerMixin:
+    """Report serialization time to the request's Server-Timing header."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+class CachedReferenceMixin:
+    """Read the product/discom/generator from the reference cache instead of the database."""
+    reference_field = None
+
+    def to_representation(self, instance):
+        refdata.attach(instance, self.reference_field)
+        return super().to_representation(instance)
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,7 +37,8 @@ class DiscomSerializer(serializers.ModelSerializer):
         model = Discom
         fields = '__all__'
 
-class MarketDataSerializer(serializers.ModelSerializer):
+class MarketDataSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'product'
     product = ProductSerializer(read_only=True)
     product_name = serializers.CharField(source='product.name', read_only=True)
     
@@ -27,14 +46,16 @@ class MarketDataSerializer(serializers.ModelSerializer):
         model = MarketData
         fields = '__all__'
 
-class LoadScheduleSerializer(serializers.ModelSerializer):
+class LoadScheduleSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'discom'
     discom_name = serializers.CharField(source='discom.name', read_only=True)
     
     class Meta:
         model = LoadSchedule
         fields = '__all__'
 
-class GenerationScheduleSerializer(serializers.ModelSerializer):
+class GenerationScheduleSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'generator'
     generator_name = serializers.CharField(source='generator.name', read_only=True)
     fuel_type = serializers.CharField(source='generator.fuel_type', read_only=True)
     
@@ -42,6 +63,70 @@ class GenerationScheduleSerializer(serializers.ModelSerializer):
         model = GenerationSchedule
         fields = '__all__'
 
+class MarketSlotSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'product'
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    timestamp = serializers.DateTimeField(read_only=True)
+    block_number = serializers.IntegerField(read_only=True)
+    mcp = serializers.DecimalField(max_digits=10, decimal_places=2)
+    mcv = serializers.DecimalField(max_digits=15, decimal_places=3)
+    purchase_bid_volume = serializers.DecimalField(max_digits=15, decimal_places=3)
+    sell_bid_volume = serializers.DecimalField(max_digits=15, decimal_places=3)
+    
+    class Meta:
+        model = MarketSlot
+        fields = ['id', 'product', 'product_name', 'slot', 'timestamp', 'block_number',
+                  'mcp', 'mcv', 'purchase_bid_volume', 'sell_bid_volume']
+
+class LoadSlotSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'discom'
+    discom_name = serializers.CharField(source='discom.name', read_only=True)
+    date = serializers.DateField(read_only=True)
+    block_number = serializers.IntegerField(read_only=True)
+    scheduled_drawal = serializers.DecimalField(max_digits=15, decimal_places=3)
+    actual_drawal = serializers.DecimalField(max_digits=15, decimal_places=3, allow_null=True)
+    
+    class Meta:
+        model = LoadSlot
+        fields = ['id', 'discom', 'discom_name', 'slot', 'date', 'block_number',
+                  'scheduled_drawal', 'actual_drawal']
+
+class GenerationSlotSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'generator'
+    generator_name = serializers.CharField(source='generator.name', read_only=True)
+    date = serializers.DateField(read_only=True)
+    block_number = serializers.IntegerField(read_only=True)
+    scheduled_generation = serializers.DecimalField(max_digits=15, decimal_places=3)
+    actual_generation = serializers.DecimalField(max_digits=15, decimal_places=3, allow_null=True)
+    
+    class Meta:
+        model = GenerationSlot
+        fields = ['id', 'generator', 'generator_name', 'slot', 'date', 'block_number',
+                  'scheduled_generation', 'actual_generation']
+
+class BlockArraySerializerField(serializers.ListField):
+    child = serializers.DecimalField(max_digits=15, decimal_places=3, allow_null=True)
+
+class LoadProfileSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'discom'
+    discom_name = serializers.CharField(source='discom.name', read_only=True)
+    scheduled_drawal = BlockArraySerializerField(read_only=True)
+    actual_drawal = BlockArraySerializerField(read_only=True)
+    
+    class Meta:
+        model = LoadProfile
+        fields = ['id', 'discom', 'discom_name', 'date', 'scheduled_drawal', 'actual_drawal']
+
+class GenerationProfileSerializer(TimedSerializerMixin, CachedReferenceMixin, serializers.ModelSerializer):
+    reference_field = 'generator'
+    generator_name = serializers.CharField(source='generator.name', read_only=True)
+    scheduled_generation = BlockArraySerializerField(read_only=True)
+    actual_generation = BlockArraySerializerField(read_only=True)
+    
+    class Meta:
+        model = GenerationProfile
+        fields = ['id', 'generator', 'generator_name', 'date', 'scheduled_generation', 'actual_generation']
+
 class IEXDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = IEXData
@@ -57,7 +142,7 @@ class GenerationDataSerializer(serializers.ModelSerializer):
         model = GenerationData
         fields = '__all__'
 
-class MarketAggregationSerializer(serializers.Serializer):
+class MarketAggregationSerializer(TimedSerializerMixin, serializers.Serializer):
     date = serializers.DateField()
     product = serializers.CharField()
     weighted_avg_price = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -65,7 +150,23 @@ class MarketAggregationSerializer(serializers.Serializer):
     min_price = serializers.DecimalField(max_digits=10, decimal_places=2)
     max_price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
-class LoadAggregationSerializer(serializers.Serializer):
+class MarketSeriesSerializer(TimedSerializerMixin, serializers.Serializer):
+    timestamp = serializers.DateTimeField()
+    block_number = serializers.IntegerField()
+    product = serializers.CharField()
+    mcp = serializers.DecimalField(max_digits=10, decimal_places=2)
+    mcv = serializers.DecimalField(max_digits=15, decimal_places=2)
+
+class MarketMonthlySerializer(TimedSerializerMixin, serializers.Serializer):
+    month = serializers.DateField()
+    product = serializers.CharField()
+    days = serializers.IntegerField()
+    weighted_avg_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_volume = serializers.DecimalField(max_digits=18, decimal_places=2)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class LoadAggregationSerializer(TimedSerializerMixin, serializers.Serializer):
     date = serializers.DateField()
     discom = serializers.CharField()
     total_scheduled_demand = serializers.DecimalField(max_digits=15, decimal_places=2)
@@ -0,0 +1,148 @@
+"""
+Slot-indexed, fixed-point storage for block data.
+
+A slot is ``days since 1970-01-01 * 96 + (block_number - 1)``, so one
+integer replaces the (date or timestamp, block_number) pair and a date range
+becomes a contiguous slot range. MarketSlot, LoadSlot and GenerationSlot
+mirror MarketData, LoadSchedule and GenerationSchedule with FixedPointField
+columns (paise and kWh) when FIXED_POINT_STORAGE is enabled.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+BLOCKS_PER_DAY = 96
+BLOCK_MINUTES = 15
+EPOCH = date(1970, 1, 1)
+
+
+def enabled():
+    return getattr(settings, 'FIXED_POINT_STORAGE', False)
+
+
+def slot_for(day, block_number):
+    return (day - EPOCH).days * BLOCKS_PER_DAY + block_number - 1
+
+
+def slot_date(slot):
+    return EPOCH + timedelta(days=slot // BLOCKS_PER_DAY)
+
+
+def slot_block(slot):
+    return slot % BLOCKS_PER_DAY + 1
+
+
+def slot_timestamp(slot):
+    start = timezone.make_aware(datetime.combine(slot_date(slot), time.min))
+    return start + timedelta(minutes=(slot_block(slot) - 1) * BLOCK_MINUTES)
+
+
+def slot_range(start_date=None, end_date=None):
+    """First and last slot of an inclusive date range (either end optional)."""
+    first = slot_for(start_date, 1) if start_date else None
+    last = slot_for(end_date, BLOCKS_PER_DAY) if end_date else None
+    return first, last
+
+
+def filter_slots(queryset, start_date=None, end_date=None):
+    first, last = slot_range(start_date, end_date)
+    if first is not None:
+        queryset = queryset.filter(slot__gte=first)
+    if last is not None:
+        queryset = queryset.filter(slot__lte=last)
+    return queryset
+
+
+def market_day(timestamp):
+    """Market (local time) day of a MarketData timestamp."""
+    if timezone.is_aware(timestamp):
+        timestamp = timezone.localtime(timestamp)
+    return timestamp.date()
+
+
+def block_for(timestamp):
+    """Block (1-96) of the market day that ``timestamp`` falls in."""
+    if timezone.is_aware(timestamp):
+        timestamp = timezone.localtime(timestamp)
+    return (timestamp.hour * 60 + timestamp.minute) // BLOCK_MINUTES + 1
+
+
+def _slot_objects(objs):
+    from .models import (
+        MarketData, LoadSchedule, GenerationSchedule, MarketSlot, LoadSlot, GenerationSlot
+    )
+    for obj in objs:
+        if isinstance(obj, MarketData):
+            yield MarketSlot(
+                product_id=obj.product_id,
+                slot=slot_for(market_day(obj.timestamp), obj.block_number),
+                mcp=obj.mcp,
+                mcv=obj.mcv,
+                purchase_bid_volume=obj.purchase_bid_volume,
+                sell_bid_volume=obj.sell_bid_volume,
+            )
+        elif isinstance(obj, LoadSchedule):
+            yield LoadSlot(
+                discom_id=obj.discom_id,
+                slot=slot_for(obj.date, obj.block_number),
+                scheduled_drawal=obj.scheduled_drawal,
+                actual_drawal=obj.actual_drawal,
+            )
+        elif isinstance(obj, GenerationSchedule):
+            yield GenerationSlot(
+                generator_id=obj.generator_id,
+                slot=slot_for(obj.date, obj.block_number),
+                scheduled_generation=obj.scheduled_generation,
+                actual_generation=obj.actual_generation,
+            )
+
+
+SLOT_KEYS = {
+    'MarketSlot': (['product', 'slot'], ['mcp', 'mcv', 'purchase_bid_volume', 'sell_bid_volume']),
+    'LoadSlot': (['discom', 'slot'], ['scheduled_drawal', 'actual_drawal']),
+    'GenerationSlot': (['generator', 'slot'], ['scheduled_generation', 'actual_generation']),
+}
+
+
+def mirror(objs, using='default'):
+    """Upsert the slot rows for MarketData/LoadSchedule/GenerationSchedule objects."""
+    by_model = {}
+    for slot_obj in _slot_objects(objs):
+        by_model.setdefault(type(slot_obj), []).append(slot_obj)
+    for model, slot_objs in by_model.items():
+        unique_fields, update_fields = SLOT_KEYS[model.__name__]
+        model.objects.using(using).bulk_create(
+            slot_objs,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+    return sum(len(slot_objs) for slot_objs in by_model.values())
+
+
+def mirror_saved(sender, instance, raw=False, using='default', **kwargs):
+    """
+    post_save receiver keeping the slot tables, which live on the primary,
+    in step with ORM saves.
+    """
+    if enabled() and not raw:
+        mirror([instance])
+
+
+def remove_deleted(sender, instance, using='default', **kwargs):
+    """
+    post_delete receiver dropping the slot row of a deleted source row.
+    ``QuerySet.delete()`` sends it for every row while it is connected;
+    raw SQL deletes do not, and ``build_slot_storage --rebuild`` resyncs.
+    Archive moves keep their slot rows, so the slot tables hold both tiers.
+    """
+    from .tiering import is_moving
+    if not enabled() or is_moving():
+        return
+    for slot_obj in _slot_objects([instance]):
+        unique_fields, _ = SLOT_KEYS[type(slot_obj).__name__]
+        type(slot_obj).objects.filter(**{
+            field: slot_obj.serializable_value(field) for field in unique_fields
+        }).delete()
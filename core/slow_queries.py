@@ -0,0 +1,111 @@
+"""
+Opt-in slow-query log.
+
+When SLOW_QUERY_THRESHOLD_MS is set, every database connection opened by the
+web workers or management commands gets an execute wrapper that times each
+statement. Statements over the threshold are explained with the backend's
+EXPLAIN prefix and written, with their parameters and call site, to the
+rotating log file SLOW_QUERY_LOG_FILE.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_local = threading.local()
+_handler_lock = threading.Lock()
+
+
+def call_site():
+    """Return the innermost frame inside the core app that issued the query."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(CORE_DIR) and filename != os.path.abspath(__file__):
+            return f'{os.path.relpath(filename, os.path.dirname(CORE_DIR))}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class SlowQueryLogger:
+    def __init__(self, connection, threshold_ms):
+        self.connection = connection
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explaining', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= self.threshold_ms:
+                self.log(sql, params, many, duration_ms)
+
+    def explain(self, sql, params, many):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        if many:
+            params = next(iter(params), None)
+        _local.explaining = True
+        try:
+            cursor = self.connection.create_cursor()
+            try:
+                cursor.execute(f'{self.connection.ops.explain_query_prefix()} {sql}', params)
+                return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
+        except Exception as exc:
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            _local.explaining = False
+
+    def log(self, sql, params, many, duration_ms):
+        logger.warning(
+            'Slow query (%.1fms) on %s at %s\nSQL: %s\nParams: %r\nPlan:\n%s',
+            duration_ms,
+            self.connection.alias,
+            call_site(),
+            sql,
+            params,
+            self.explain(sql, params, many),
+        )
+
+
+def _configure_handler():
+    log_file = getattr(settings, 'SLOW_QUERY_LOG_FILE', None)
+    if not log_file:
+        return
+    with _handler_lock:
+        if any(getattr(h, 'slow_query_log', False) for h in logger.handlers):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handler = RotatingFileHandler(
+            log_file,
+            maxBytes=getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=getattr(settings, 'SLOW_QUERY_LOG_BACKUP_COUNT', 5),
+        )
+        handler.slow_query_log = True
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver that attaches the slow-query wrapper."""
+    threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold_ms is None:
+        return
+    if any(isinstance(w, SlowQueryLogger) for w in connection.execute_wrappers):
+        return
+    _configure_handler()
+    # Innermost position: only the statement itself is timed, and wrappers
+    # pushed and popped by request middleware keep their stack order.
+    connection.execute_wrappers.insert(0, SlowQueryLogger(connection, threshold_ms))
@@ -0,0 +1,437 @@
+"""
+Memory-mapped columnar snapshot of the block tables.
+
+Behind several gunicorn workers, each worker that charts or aggregates a
+long range would otherwise pull the same rows into its own memory. When
+SNAPSHOT_PATH is set, ``refresh`` writes MarketData and LoadSchedule to one
+file of fixed-width arrays sorted by slot (see core/slots.py)::
+
+    header   magic, synced_until (µs since the epoch), rows per section
+    market   slot int32, product_id int32, mcp int64, mcv int64
+    load     slot int32, discom_id int32, scheduled_drawal int64, actual_drawal int64
+
+Values are scaled by 100 (paise, and hundredths of the volume units) and a
+missing actual is NULL. Arrays are in native byte order, so the file
+belongs to the host that wrote it.
+
+Every worker maps the file read-only: the operating system keeps a single
+copy in the page cache whatever the number of workers, and a date range is
+a bisected slice of memoryviews over the mapping, so nothing is copied
+until a handler reads the values.
+
+A refresh reads the rows changed since the last one, from SYNC_LAG seconds
+below its ``updated_at`` watermark because writers stamp rows before they
+commit, and the keys deleted since then (see core/changes.py). The mapped
+file is never written to: a refresh writes a new file next to it and swaps
+it in with ``os.replace``, so a reader sees either the old or the new pair
+of values, never half of each. Rows whose (slot, entity) is already in the
+file are located by bisecting the slot column, and the new file is written
+from slices of the old arrays around them; rows after the last key of their
+section (feeds adding new blocks) are appended. Workers notice the new file
+on their next read and map it; requests still using the old mapping finish
+on it. Only a row that falls between existing keys rebuilds its section
+from both tiers.
+
+Readers use the snapshot only while its watermark covers the newest write
+or delete on the primary, and fall back to the database otherwise.
+
+Refreshes run from the ingest commands and ``build_snapshot``, never from a
+request, and take an exclusive lock on ``<path>.lock`` so that two
+processes cannot write the file at once or swap in a stale copy.
+"""
+import array
+import bisect
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import changes, metrics, slots, tiering
+from .models import MarketData, LoadSchedule
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GNASNAP1'
+SCALE = 100
+NULL = -2 ** 63
+FETCH_BATCH = 10000
+
+# section -> (model, date field, entity column, value columns)
+SECTIONS = {
+    'market': (MarketData, 'trade_date', 'product_id', ('mcp', 'mcv')),
+    'load': (LoadSchedule, 'date', 'discom_id', ('scheduled_drawal', 'actual_drawal')),
+}
+
+HEADER = struct.Struct('=8sq' + 'q' * len(SECTIONS))
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+_current = None
+_current_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def enabled():
+    return bool(getattr(settings, 'SNAPSHOT_PATH', None))
+
+
+def _typecodes(section):
+    return ['i', 'i'] + ['q'] * len(SECTIONS[section][3])
+
+
+def _padding(size):
+    return -size % 8
+
+
+def _scaled(value):
+    return NULL if value is None else int(value * SCALE)
+
+
+def _decimal(value):
+    return None if value == NULL else Decimal(value).scaleb(-2)
+
+
+class Snapshot:
+    """A mapped snapshot file; ``sections`` holds one memoryview per column."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        view = memoryview(self._map)
+        magic, synced_until, *counts = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a snapshot file')
+        self.synced_until = None if synced_until < 0 else UNIX_EPOCH + timedelta(microseconds=synced_until)
+        self.sections = {}
+        offset = HEADER.size
+        for section, count in zip(SECTIONS, counts):
+            columns = []
+            for code in _typecodes(section):
+                size = count * struct.calcsize(code)
+                columns.append(view[offset:offset + size].cast(code))
+                offset += size + _padding(size)
+            self.sections[section] = columns
+
+    def rows(self, section):
+        return len(self.sections[section][0])
+
+    def last_key(self, section):
+        """The (slot, entity) of the section's last row, or None if it is empty."""
+        slot_column, entity_column = self.sections[section][:2]
+        return (slot_column[-1], entity_column[-1]) if len(slot_column) else None
+
+    def find(self, section, slot, entity):
+        """Index of the row for ``(slot, entity)``, or None."""
+        slot_column, entity_column = self.sections[section][:2]
+        lo = bisect.bisect_left(slot_column, slot)
+        hi = bisect.bisect_right(slot_column, slot, lo)
+        # Rows of one slot are sorted by entity
+        index = lo + bisect.bisect_left(entity_column[lo:hi], entity)
+        return index if index < hi and entity_column[index] == entity else None
+
+    def range(self, section, first_slot, last_slot):
+        """Slices of every column of ``section`` for slots first_slot..last_slot, without copying."""
+        columns = self.sections[section]
+        lo = bisect.bisect_left(columns[0], first_slot)
+        hi = bisect.bisect_right(columns[0], last_slot)
+        return [column[lo:hi] for column in columns]
+
+
+def current():
+    """This process's mapping of the snapshot, remapped after a refresh; None if there is none."""
+    global _current
+    if not enabled():
+        return None
+    path = str(settings.SNAPSHOT_PATH)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    with _current_lock:
+        if _current is None or _current.path != path or \
+                _current.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            try:
+                _current = Snapshot(path)
+            except (OSError, ValueError, struct.error):
+                logger.warning('Snapshot %s could not be mapped', path, exc_info=True)
+                _current = None
+        return _current
+
+
+def _fetch(section, since=None):
+    """
+    Rows of ``section`` as sorted ``(slot, entity, *scaled values)`` tuples,
+    and their newest updated_at. With ``since``, the rows updated from
+    SYNC_LAG seconds before it.
+    """
+    model, date_field, entity, values = SECTIONS[section]
+    queryset = model.objects.using('default').order_by()
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since - timedelta(seconds=settings.SYNC_LAG))
+    rows = []
+    newest = None
+    for queryset in tiering.tiers(queryset):
+        fields = (date_field, 'block_number', entity, *values, 'updated_at')
+        for day, block, entity_id, *amounts, updated_at in queryset.values_list(*fields).iterator(chunk_size=FETCH_BATCH):
+            rows.append((slots.slot_for(day, block), entity_id, *(_scaled(amount) for amount in amounts)))
+            if newest is None or updated_at > newest:
+                newest = updated_at
+    rows.sort()
+    return rows, newest
+
+
+def _deleted(section, since):
+    """(slot, entity) keys of ``section`` deleted since ``since``, and the newest deletion time."""
+    model = SECTIONS[section][0]
+    keys = set()
+    newest = None
+    for deleted in changes.deleted_since(model, since):
+        keys.add((slots.slot_for(deleted.date, deleted.block_number), deleted.entity_id))
+        newest = deleted.deleted_at
+    return keys, newest
+
+
+def _arrays(section, rows):
+    return [array.array(code, column) for code, column in zip(_typecodes(section), zip(*rows))] or \
+        [array.array(code) for code in _typecodes(section)]
+
+
+def _micros(synced_until):
+    return -1 if synced_until is None else (synced_until - UNIX_EPOCH) // timedelta(microseconds=1)
+
+
+def _write(path, synced_until, sections):
+    """Write ``{section: [column parts]}`` to a new file and swap it in for ``path``."""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            counts = [sum(len(part) for part in columns[0]) for columns in sections.values()]
+            file.write(HEADER.pack(MAGIC, _micros(synced_until), *counts))
+            for columns in sections.values():
+                for parts in columns:
+                    size = 0
+                    for part in parts:
+                        file.write(part)
+                        size += memoryview(part).nbytes
+                    file.write(b'\0' * _padding(size))
+        # Workers may run as another user of the same group
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold ``path``.lock exclusively, so one process at a time refreshes the snapshot."""
+    with _refresh_lock, open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _classify(snapshot, section, rows, deleted):
+    """
+    Split changed rows into edits ``{index: values}`` for keys already in the
+    file (None for a deleted key) and rows to append; None if a row falls
+    between existing keys.
+    """
+    columns = snapshot.sections[section]
+    last = snapshot.last_key(section)
+    edits = {}
+    appended = []
+    for row in rows:
+        slot, entity, *values = row
+        # A key written again after its delete is among the changed rows
+        deleted.discard((slot, entity))
+        if last is not None and (slot, entity) <= last:
+            index = snapshot.find(section, slot, entity)
+            if index is None:
+                return None
+            if any(column[index] != value for column, value in zip(columns[2:], values)):
+                edits[index] = values
+        else:
+            appended.append(row)
+    for slot, entity in deleted:
+        index = snapshot.find(section, slot, entity)
+        if index is not None:
+            edits[index] = None
+    return edits, appended
+
+
+def _edited(section, columns, edits):
+    """Column parts for the new file: slices of the old columns around the edited rows."""
+    codes = _typecodes(section)
+    parts = [[] for _ in columns]
+    start = 0
+    for index in sorted(edits):
+        values = edits[index]
+        for number, column in enumerate(columns):
+            parts[number].append(column[start:index])
+            if values is None:
+                continue
+            if number < 2:
+                parts[number].append(column[index:index + 1])
+            else:
+                parts[number].append(array.array(codes[number], [values[number - 2]]))
+        start = index + 1
+    for number, column in enumerate(columns):
+        parts[number].append(column[start:])
+    return parts
+
+
+def refresh(rebuild=False):
+    """
+    Bring the snapshot file up to date with the database. Returns
+    ``{section: (how, rows written)}`` where how is "rebuilt", "appended",
+    "patched" (changed or deleted rows only) or "unchanged".
+    """
+    path = str(settings.SNAPSHOT_PATH)
+    with _file_lock(path):
+        # Mapped under the lock, so this is the newest file
+        old = None if rebuild else current()
+        since = old.synced_until if old is not None else None
+        newest = since
+        sections = {}
+        report = {}
+        for section in SECTIONS:
+            edits = None
+            if old is not None:
+                rows, latest = _fetch(section, since)
+                deleted, deleted_at = _deleted(section, since) if since is not None else (set(), None)
+                edits = _classify(old, section, rows, deleted)
+                latest = tiering.COMBINE[Max](latest, deleted_at)
+            if edits is not None:
+                edits, appended = edits
+                how = 'appended' if appended else 'patched' if edits else 'unchanged'
+                parts = _edited(section, old.sections[section], edits)
+                if appended:
+                    parts = [part + [new] for part, new in zip(parts, _arrays(section, appended))]
+                count = len(edits) + len(appended)
+            else:
+                how = 'rebuilt'
+                rows, latest = _fetch(section)
+                # The watermark must cover earlier deletes too, or readers would never use the file
+                latest = tiering.COMBINE[Max](latest, changes.last_deleted(SECTIONS[section][0]))
+                parts = [[column] for column in _arrays(section, rows)]
+                count = len(rows)
+            if latest is not None and (newest is None or latest > newest):
+                newest = latest
+            sections[section] = parts
+            report[section] = (how, count)
+        if old is None or newest != since or any(how != 'unchanged' for how, _ in report.values()):
+            _write(path, newest, sections)
+    return report
+
+
+def refresh_after_write():
+    """Refresh the snapshot at the end of an ingest command; never fails the ingest."""
+    if not enabled():
+        return None
+    try:
+        return refresh()
+    except Exception:
+        logger.warning('Snapshot refresh failed; the next one will retry', exc_info=True)
+        return None
+
+
+def _mapped(section):
+    """The current snapshot if it covers the newest changes to ``section``'s table, else None."""
+    snapshot = current()
+    if snapshot is not None and changes.is_stale(SECTIONS[section][0], snapshot.synced_until):
+        snapshot = None
+    metrics.record_cache('snapshot', snapshot is not None)
+    return snapshot
+
+
+def _market_range(start_date, end_date):
+    snapshot = _mapped('market')
+    if snapshot is None:
+        return None
+    return snapshot.range('market', *slots.slot_range(start_date, end_date))
+
+
+def market_daily(start_date, end_date, product_id=None):
+    """Per day and product: total_volume, turnover, min_price, max_price, as ``analytics.market_daily``."""
+    columns = _market_range(start_date, end_date)
+    if columns is None:
+        return None
+    groups = {}
+    for slot, product, price, volume in zip(*columns):
+        if product_id is not None and product != product_id:
+            continue
+        key = (slot // slots.BLOCKS_PER_DAY, product)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [volume, price * volume, price, price]
+        else:
+            group[0] += volume
+            group[1] += price * volume
+            group[2] = min(group[2], price)
+            group[3] = max(group[3], price)
+    return [
+        {'date': slots.EPOCH + timedelta(days=day), 'product': product, 'total_volume': _decimal(volume),
+         'turnover': Decimal(turnover).scaleb(-4), 'min_price': _decimal(low), 'max_price': _decimal(high)}
+        for (day, product), (volume, turnover, low, high) in sorted(groups.items())
+    ]
+
+
+def market_series(start_date, end_date, product_id=None):
+    """``(slot, product_id, mcp, mcv)`` for every block in the range, in slot order."""
+    columns = _market_range(start_date, end_date)
+    if columns is None:
+        return None
+    return [
+        (slot, product, _decimal(price), _decimal(volume))
+        for slot, product, price, volume in zip(*columns)
+        if product_id is None or product == product_id
+    ]
+
+
+def load_daily(day, discom_id=None):
+    """
+    Per DISCOM on ``day``: total scheduled and actual drawal and the first
+    block with the peak scheduled drawal. None if there is no snapshot.
+    """
+    snapshot = _mapped('load')
+    if snapshot is None:
+        return None
+    groups = {}
+    for slot, discom, scheduled, actual in zip(*snapshot.range('load', *slots.slot_range(day, day))):
+        if discom_id is not None and discom != discom_id:
+            continue
+        group = groups.setdefault(discom, [0, None, NULL, None])
+        group[0] += scheduled
+        if actual != NULL:
+            group[1] = actual if group[1] is None else group[1] + actual
+        # Slots are in block order, so the first block with the peak is kept
+        if scheduled > group[2]:
+            group[2] = scheduled
+            group[3] = slots.slot_block(slot)
+    return [
+        {'discom': discom, 'total_scheduled_demand': _decimal(scheduled),
+         'total_actual_demand': None if actual is None else _decimal(actual),
+         'peak_demand_block': block, 'peak_demand_value': _decimal(peak)}
+        for discom, (scheduled, actual, peak, block) in sorted(groups.items())
+    ]
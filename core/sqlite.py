@@ -0,0 +1,45 @@
+"""
+SQLite connection profile.
+
+With the default rollback journal a writer locks the whole database file
+while it commits, so the dashboard and API readers wait behind every ingest
+batch. When SQLITE_WAL is on, each new SQLite connection switches the
+database to write-ahead logging, where readers keep reading the last
+committed state while a writer appends to the log, and applies the
+SQLITE_PRAGMAS profile: ``synchronous=NORMAL`` (safe in WAL mode), a larger
+page cache, memory-mapped reads and a busy timeout so that concurrent
+writers queue instead of failing with "database is locked".
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Negative: KiB rather than pages
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    # Truncate the log back to this size after checkpoints
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+
+def pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def configure(sender, connection, **kwargs):
+    """connection_created receiver applying the profile to SQLite connections."""
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_WAL', False):
+        return
+    # On the raw connection, so the profile is not counted as application queries
+    for name, value in pragmas().items():
+        # In-memory test databases stay in "memory" journal mode
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def current(connection, name):
+    """The value of a PRAGMA on ``connection``, e.g. ``current(connection, 'journal_mode')``."""
+    connection.ensure_connection()
+    return connection.connection.execute(f'PRAGMA {name}').fetchone()[0]
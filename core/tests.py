@@ -1,10 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase
 from rest_framework import status
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+import os
 
 from .models import (
     Product, Generator, Discom, MarketData, 
@@ -612,3 +613,2227 @@ class IntegrationTestCase(TestCase):
         if result['data']:
             self.assertIn('weighted_average_price', result['data'])
             self.assertGreater(float(result['data']['weighted_average_price']), 0)
+
+
+class RequestInstrumentationTestCase(TestCase):
+    """Test cases for the per-request SQL and timing middleware"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        for block in range(1, 5):
+            MarketData.objects.create(
+                product=self.product,
+                timestamp=datetime.now(),
+                block_number=block,
+                mcp=Decimal('2500.00'),
+                mcv=Decimal('1000.00')
+            )
+    
+    def test_server_timing_header(self):
+        """Test that API responses carry a Server-Timing header"""
+        response = self.client.get(reverse('core:market_data_list'))
+        
+        self.assertEqual(response.status_code, 200)
+        header = response['Server-Timing']
+        self.assertIn('db;dur=', header)
+        self.assertIn('serialize;dur=', header)
+        self.assertIn('total;dur=', header)
+        self.assertGreater(response.wsgi_request.timing.query_count, 0)
+    
+    def test_request_over_budget_is_logged(self):
+        """Test that requests exceeding the query budget are logged"""
+        from django.test.utils import override_settings
+        
+        with override_settings(REQUEST_QUERY_BUDGET=0):
+            with self.assertLogs('core.middleware', level='WARNING') as logs:
+                self.client.get(reverse('core:market_data_list'))
+        
+        self.assertIn('over budget', logs.output[0])
+
+
+class MetricsTestCase(TestCase):
+    """Test cases for the Prometheus metrics endpoint"""
+    
+    def setUp(self):
+        import tempfile
+        from django.test.utils import override_settings
+        
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS_DIR=self.metrics_dir.name)
+        self.settings_override.enable()
+        
+        from . import metrics
+        metrics.store._reset()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.metrics_dir.cleanup()
+    
+    def test_metrics_endpoint_reports_latency_and_nlp_intents(self):
+        """Test that /metrics exposes request latency and NLP intent counts"""
+        from .nlp_agent import NLPAgent
+        
+        self.client.get(reverse('core:market_data_list'))
+        NLPAgent().process_query('average price for DAM last week')
+        
+        response = self.client.get(reverse('core:metrics'))
+        body = response.content.decode()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn('gna_http_request_duration_seconds_bucket{le="+Inf",method="GET",url_name="market_data_list"}', body)
+        self.assertIn('gna_nlp_queries_total{intent="average_price"} 1', body)
+    
+    def test_metrics_are_merged_across_processes(self):
+        """Test that counters written by other worker processes are summed"""
+        import json
+        import os
+        from . import metrics
+        
+        metrics.record_cache('reference', hit=True)
+        with open(os.path.join(self.metrics_dir.name, '999999.json'), 'w') as handle:
+            json.dump({
+                'counters': {'gna_cache_requests_total|cache=reference,result=miss': 1},
+                'gauges': {},
+                'histograms': {},
+            }, handle)
+        
+        body = metrics.render()
+        self.assertIn('gna_cache_requests_total{cache="reference",result="miss"} 1', body)
+        self.assertIn('gna_cache_hit_ratio{cache="reference"} 0.5', body)
+    
+    def test_concurrent_flushes_do_not_fail(self):
+        """Test that threads flushing at once each write a complete file"""
+        from concurrent.futures import ThreadPoolExecutor
+        from . import metrics
+        metrics.record_cache('reference', hit=True)
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: metrics.store.flush(), range(200)))
+        
+        self.assertEqual([name for name in os.listdir(self.metrics_dir.name) if name.endswith('.tmp')], [])
+        self.assertIn('result="hit"} 1', metrics.render())
+    
+    def test_exited_process_files_are_folded(self):
+        """Test that the counts of exited processes survive compaction and are not counted twice"""
+        import json
+        from . import metrics
+        for name in ('999998-aaaa.json', '999999-bbbb.json'):
+            with open(os.path.join(self.metrics_dir.name, name), 'w') as handle:
+                json.dump({
+                    'counters': {'gna_cache_requests_total|cache=reference,result=miss': 2},
+                    'gauges': {},
+                    'histograms': {},
+                }, handle)
+        
+        metrics.render()
+        body = metrics.render()
+        
+        self.assertIn('gna_cache_requests_total{cache="reference",result="miss"} 4', body)
+        self.assertNotIn('999998-aaaa.json', os.listdir(self.metrics_dir.name))
+        self.assertIn(metrics.EXITED_FILE, os.listdir(self.metrics_dir.name))
+
+
+class SlowQueryLogTestCase(TestCase):
+    """Test cases for the opt-in slow-query log"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        MarketData.objects.create(
+            product=self.product,
+            timestamp=datetime.now(),
+            block_number=1,
+            mcp=Decimal('2500.00'),
+            mcv=Decimal('1000.00')
+        )
+    
+    def test_slow_query_is_logged_with_plan_and_call_site(self):
+        """Test that statements over the threshold are explained and logged"""
+        from django.db import connection
+        from .slow_queries import SlowQueryLogger
+        
+        with connection.execute_wrapper(SlowQueryLogger(connection, threshold_ms=0)):
+            with self.assertLogs('core.slow_queries', level='WARNING') as logs:
+                list(MarketData.objects.filter(timestamp__date=date.today()))
+        
+        output = logs.output[0]
+        self.assertIn('core_marketdata', output)
+        self.assertIn('Plan:', output)
+        self.assertIn('SCAN', output)
+        self.assertIn('core/tests.py', output)
+    
+    def test_install_is_opt_in(self):
+        """Test that no wrapper is attached unless a threshold is configured"""
+        from django.db import connection
+        from django.test.utils import override_settings
+        from .slow_queries import SlowQueryLogger, install
+        
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=None):
+            install(sender=None, connection=connection)
+        self.assertFalse(any(isinstance(w, SlowQueryLogger) for w in connection.execute_wrappers))
+
+
+class ProfilingTestCase(TestCase):
+    """Test cases for the on-demand profiling hook"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        MarketData.objects.create(
+            product=self.product,
+            timestamp=datetime.now(),
+            block_number=1,
+            mcp=Decimal('2500.00'),
+            mcv=Decimal('1000.00')
+        )
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.url = reverse('core:market_aggregation')
+        self.params = {'start_date': date.today(), 'end_date': date.today(), 'profile': '1'}
+    
+    def test_staff_profile_summary(self):
+        """Test that staff users get a profile summary and SQL list"""
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, self.params)
+        
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual(summary['view'], 'market_aggregation')
+        self.assertEqual(summary['status_code'], 200)
+        self.assertGreater(summary['query_count'], 0)
+        self.assertIn('cumulative', summary['profile'])
+        self.assertIn('weighted_avg_price', summary['response'])
+    
+    def test_flamegraph_file_is_written(self):
+        """Test that profile=flamegraph writes collapsed stack samples"""
+        import os
+        import tempfile
+        from django.test.utils import override_settings
+        
+        self.client.force_login(self.staff)
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(PROFILE_DIR=profile_dir, PROFILE_SAMPLE_INTERVAL=0.0001):
+                response = self.client.get(self.url, {**self.params, 'profile': 'flamegraph'})
+            
+            path = response.json()['flamegraph_file']
+            self.assertTrue(path.startswith(profile_dir))
+            self.assertTrue(os.path.exists(path))
+    
+    def test_profile_ignored_for_anonymous_users(self):
+        """Test that non-staff users get the normal response"""
+        response = self.client.get(self.url, self.params)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)
+    
+    def test_busy_profiler_serves_request_unprofiled(self):
+        """Test that a request is served normally when another profiler is active"""
+        import cProfile
+        from unittest import mock
+        self.client.force_login(self.staff)
+        
+        error = ValueError('Another profiling tool is already active')
+        with mock.patch.object(cProfile.Profile, 'enable', side_effect=error):
+            response = self.client.get(self.url, self.params)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Skipped'], 'busy')
+        self.assertIsInstance(response.data, list)
+
+
+class LoadTestCommandTestCase(TransactionTestCase):
+    """Test cases for the loadtest management command"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        for block in range(1, 5):
+            MarketData.objects.create(
+                product=self.product,
+                timestamp=datetime.now(),
+                block_number=block,
+                mcp=Decimal('2500.00'),
+                mcv=Decimal('1000.00')
+            )
+    
+    def test_loadtest_reports_percentiles_per_endpoint(self):
+        """Test that loadtest runs the request mix and reports latency percentiles"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('loadtest', requests=20, concurrency=2, seed=1, stdout=out)
+        output = out.getvalue()
+        
+        self.assertIn('20 requests', output)
+        self.assertIn('p99 ms', output)
+        self.assertIn('market_aggregation', output)
+    
+    def test_loadtest_with_concurrent_ingest(self):
+        """Test that --ingest reports the ingest that ran alongside the requests"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('loadtest', requests=10, concurrency=2, seed=1, ingest=True, ingest_batch=50, stdout=out)
+        
+        self.assertIn('Concurrent ingest', out.getvalue())
+        self.assertIn('0 failed commits', out.getvalue())
+    
+    def test_failures_are_reported_with_reason(self):
+        """Test that failed requests are listed with the exception type and message"""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from .management.commands.loadtest import Command
+        
+        def broken_sender(self):
+            def send(method, path, payload):
+                raise ConnectionResetError('peer went away')
+            return send
+        
+        err = StringIO()
+        with mock.patch.object(Command, 'client_sender', broken_sender):
+            call_command('loadtest', requests=6, concurrency=2, seed=1, stdout=StringIO(), stderr=err)
+        
+        self.assertIn('ConnectionResetError: peer went away', err.getvalue())
+    
+    def test_percentile(self):
+        """Test nearest-rank percentile calculation"""
+        from .management.commands.loadtest import percentile
+        
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class ReadReplicaRouterTestCase(TestCase):
+    """Test cases for read-replica routing"""
+    
+    def setUp(self):
+        from django.test.utils import override_settings
+        from . import routers
+        
+        self.router = routers.ReadReplicaRouter()
+        routers._lag_cache.clear()
+        self.settings_override = override_settings(
+            DATABASE_REPLICAS=['replica1'],
+            REPLICA_MAX_LAG_SECONDS=60,
+            REPLICA_STALE_FALLBACK='primary'
+        )
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+    
+    def test_reads_outside_analytics_use_primary(self):
+        """Test that reads outside replica_reads() are not routed"""
+        self.assertIsNone(self.router.db_for_read(MarketData))
+        self.assertEqual(self.router.db_for_write(MarketData), 'default')
+    
+    def test_analytics_reads_use_fresh_replica(self):
+        """Test that reads inside replica_reads() go to a fresh replica"""
+        from unittest import mock
+        from .routers import replica_reads
+        
+        with mock.patch('core.routers.replica_lag', return_value=5):
+            with replica_reads():
+                self.assertEqual(self.router.db_for_read(MarketData), 'replica1')
+    
+    def test_stale_replica_falls_back_to_primary(self):
+        """Test that a lagging replica is skipped"""
+        from unittest import mock
+        from django.test.utils import override_settings
+        from . import routers
+        
+        with mock.patch('core.routers.replica_lag', return_value=600):
+            with routers.replica_reads():
+                self.assertEqual(self.router.db_for_read(MarketData), 'default')
+                routers._lag_cache.clear()
+                with override_settings(REPLICA_STALE_FALLBACK='replica'):
+                    self.assertEqual(self.router.db_for_read(MarketData), 'replica1')
+    
+    def test_replicas_are_not_migrated(self):
+        """Test that migrations are never applied to replicas"""
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(ARCHIVE_ENABLED=True)
+class ArchiveTieringTestCase(TestCase):
+    """Test cases for hot/cold tiering with the archive database"""
+    databases = {'default', 'archive'}
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        self.discom = Discom.objects.create(name='UPCL', state='Uttarakhand', region='North')
+        self.old_day = date.today() - timedelta(days=400)
+        self.new_day = date.today() - timedelta(days=1)
+        for day in (self.old_day, self.new_day):
+            for block in range(1, 5):
+                MarketData.objects.create(
+                    product=self.product,
+                    timestamp=datetime.combine(day, datetime.min.time()) + timedelta(hours=block),
+                    block_number=block,
+                    mcp=Decimal('2000.00'),
+                    mcv=Decimal('100.00')
+                )
+                LoadSchedule.objects.create(
+                    discom=self.discom,
+                    date=day,
+                    block_number=block,
+                    scheduled_drawal=Decimal(f'{100 + block}.00')
+                )
+    
+    def archive(self):
+        from io import StringIO
+        from django.core.management import call_command
+        call_command('archive_data', older_than_days=365, stdout=StringIO())
+    
+    def test_archive_moves_old_rows(self):
+        """Test that rows older than the cutoff move to the archive database"""
+        from .models import ArchivedRange
+        
+        self.archive()
+        
+        self.assertEqual(MarketData.objects.count(), 4)
+        self.assertEqual(MarketData.objects.using('archive').count(), 4)
+        self.assertEqual(LoadSchedule.objects.using('archive').count(), 4)
+        self.assertEqual(Product.objects.using('archive').get().name, 'DAM')
+        self.assertEqual(
+            ArchivedRange.objects.get(table='core_marketdata').archived_before,
+            date.today() - timedelta(days=365)
+        )
+    
+    def test_reads_span_both_tiers(self):
+        """Test that lists, aggregations and NLP queries read both tiers"""
+        from .nlp_agent import NLPAgent
+        
+        self.archive()
+        
+        response = self.client.get(reverse('core:market_data_list'), {'start_date': self.old_day})
+        self.assertEqual(response.data['count'], 8)
+        self.assertEqual(response.data['results'][-1]['product']['name'], 'DAM')
+        
+        response = self.client.get(reverse('core:market_aggregation'), {
+            'start_date': self.old_day,
+            'end_date': self.new_day
+        })
+        self.assertEqual([row['date'] for row in response.data], [str(self.old_day), str(self.new_day)])
+        self.assertEqual(float(response.data[0]['weighted_avg_price']), 2000.0)
+        
+        response = self.client.get(reverse('core:load_aggregation'), {'date': self.old_day})
+        self.assertEqual(response.data[0]['peak_demand_block'], 4)
+        
+        result = NLPAgent().process_query('total volume for DAM last 500 days')
+        self.assertEqual(result['data']['total_volume'], 800.0)
+    
+    def test_recent_ranges_skip_archive(self):
+        """Test that ranges after the archive boundary only query the hot tier"""
+        from . import tiering
+        
+        self.archive()
+        
+        queryset = MarketData.objects.all()
+        self.assertEqual(len(tiering.tiers(queryset, self.new_day)), 1)
+        self.assertEqual(len(tiering.tiers(queryset, self.old_day)), 2)
+    
+    def test_archive_is_opt_in(self):
+        """Test that reads skip the boundary lookup while the archive tier is off"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import tiering
+        
+        with override_settings(ARCHIVE_ENABLED=False), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(tiering.tiers(MarketData.objects.all(), self.old_day)), 1)
+        self.assertEqual(len(queries), 0)
+    
+    def test_archived_rows_keep_created_at(self):
+        """Test that moving a row to the archive keeps its created_at"""
+        created = MarketData.objects.get(trade_date=self.old_day, block_number=1).created_at
+        
+        self.archive()
+        
+        self.assertEqual(MarketData.objects.using('archive').get(block_number=1).created_at, created)
+    
+    def test_rows_in_both_tiers_count_once(self):
+        """Test that each tier only answers for its side of the boundary"""
+        from .merge import merge_rows
+        from .nlp_agent import NLPAgent
+        self.archive()
+        # A later run's copies that are not yet behind the boundary, and a
+        # hot row left behind by an interrupted delete
+        merge_rows(MarketData, [
+            MarketData(product=self.product, timestamp=row.timestamp, block_number=row.block_number,
+                       mcp=row.mcp, mcv=row.mcv)
+            for row in MarketData.objects.filter(trade_date=self.new_day)
+        ], using='archive')
+        LoadSchedule.objects.create(
+            discom=self.discom, date=self.old_day, block_number=1, scheduled_drawal=Decimal('999.00')
+        )
+        
+        result = NLPAgent().process_query('total volume for DAM last 500 days')
+        response = self.client.get(reverse('core:load_aggregation'), {'date': self.old_day})
+        
+        self.assertEqual(result['data']['total_volume'], 800.0)
+        self.assertEqual(response.data[0]['peak_demand_block'], 4)
+    
+    @override_settings(FIXED_POINT_STORAGE=True, DAY_PROFILE_STORAGE=True)
+    def test_slot_and_profile_reads_cover_archived_rows(self):
+        """Test that the slot and day-profile aggregations keep archived rows"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .merge import merge_rows
+        call_command('build_slot_storage', stdout=StringIO())
+        call_command('build_day_profiles', stdout=StringIO())
+        market_params = {'start_date': self.old_day, 'end_date': self.new_day}
+        before = self.client.get(reverse('core:market_aggregation'), market_params).data
+        
+        self.archive()
+        
+        self.assertEqual(self.client.get(reverse('core:market_aggregation'), market_params).data, before)
+        call_command('build_slot_storage', rebuild=True, stdout=StringIO())
+        self.assertEqual(self.client.get(reverse('core:market_aggregation'), market_params).data, before)
+        
+        merge_rows(LoadSchedule, [
+            LoadSchedule(discom=self.discom, date=self.old_day, block_number=1, scheduled_drawal=Decimal('999.00'))
+        ])
+        response = self.client.get(reverse('core:load_aggregation'), {'date': self.old_day})
+        self.assertEqual(response.data[0]['peak_demand_block'], 1)
+        self.assertEqual(float(response.data[0]['total_scheduled_demand']), 999 + 102 + 103 + 104)
+    
+    def test_actuals_for_archived_blocks_patch_the_archive(self):
+        """Test that late actuals older than the boundary update the archived rows"""
+        from . import actuals
+        self.archive()
+        
+        result = actuals.apply_actuals(LoadSchedule, [
+            LoadSchedule(discom_id=self.discom.id, date=day, block_number=1, actual_drawal=Decimal('90.00'))
+            for day in (self.old_day, self.new_day)
+        ])
+        
+        self.assertEqual((result['updated'], result['missing']), (2, 0))
+        self.assertEqual(
+            LoadSchedule.objects.using('archive').get(date=self.old_day, block_number=1).actual_drawal, Decimal('90.00')
+        )
+        self.assertEqual(LoadSchedule.objects.get(date=self.new_day, block_number=1).actual_drawal, Decimal('90.00'))
+    
+    def test_merge_of_archived_key_updates_archive(self):
+        """Test that merging a row older than the boundary updates the archived copy"""
+        from .merge import merge_rows
+        self.archive()
+        row = LoadSchedule(discom=self.discom, date=self.old_day, block_number=1, scheduled_drawal=Decimal('999.00'))
+        
+        counts = merge_rows(LoadSchedule, [row])
+        
+        self.assertEqual(counts, {'inserted': 0, 'updated': 1, 'unchanged': 0})
+        self.assertFalse(LoadSchedule.objects.filter(date=self.old_day).exists())
+        self.assertEqual(
+            LoadSchedule.objects.using('archive').get(block_number=1).scheduled_drawal, Decimal('999.00')
+        )
+
+
+@override_settings(FIXED_POINT_STORAGE=True)
+class SlotStorageTestCase(TestCase):
+    """Test cases for the fixed-point, slot-indexed storage layout"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        self.day = date.today() - timedelta(days=1)
+        for block in range(1, 5):
+            MarketData.objects.create(
+                product=self.product,
+                timestamp=datetime.combine(self.day, datetime.min.time()) + timedelta(minutes=(block - 1) * 15),
+                block_number=block,
+                mcp=Decimal(f'{2000 + block * 100}.25'),
+                mcv=Decimal(f'{100 * block}.50')
+            )
+    
+    def test_slot_math(self):
+        """Test conversion between slots and (date, block)"""
+        from . import slots
+        
+        slot = slots.slot_for(date(2024, 1, 2), 96)
+        self.assertEqual(slot, 19724 * 96 + 95)
+        self.assertEqual(slots.slot_date(slot), date(2024, 1, 2))
+        self.assertEqual(slots.slot_block(slot), 96)
+    
+    def test_saves_are_mirrored_as_integers(self):
+        """Test that saves are mirrored into integer paise/kWh columns"""
+        from django.db import connection
+        from .models import MarketSlot
+        
+        slot = MarketSlot.objects.get(product=self.product, slot__gt=0, mcp=Decimal('2100.25'))
+        self.assertEqual(slot.mcv, Decimal('100.500'))
+        self.assertEqual(slot.date, self.day)
+        self.assertEqual(slot.block_number, 1)
+        
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT mcp, mcv FROM core_marketslot WHERE id = %s', [slot.id])
+            self.assertEqual(cursor.fetchone(), (210025, 100500))
+    
+    def test_aggregation_uses_slot_tables(self):
+        """Test that the market aggregation matches the decimal layout"""
+        url = reverse('core:market_aggregation')
+        params = {'start_date': self.day.isoformat(), 'end_date': self.day.isoformat()}
+        
+        response = self.client.get(url, params)
+        with override_settings(FIXED_POINT_STORAGE=False):
+            expected = self.client.get(url, params)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected.data)
+    
+    def test_market_slot_list(self):
+        """Test the slot list API converts at the edges"""
+        response = self.client.get(reverse('core:market_slot_list'), {
+            'product': 'DAM',
+            'start_date': self.day.isoformat()
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['results'][-1]['block_number'], 1)
+        self.assertEqual(response.data['results'][-1]['mcp'], '2100.25')
+    
+    def test_deletes_remove_slot_rows(self):
+        """Test that instance and queryset deletes drop the mirrored slot rows"""
+        from .models import MarketSlot
+        
+        MarketData.objects.get(block_number=1).delete()
+        MarketData.objects.filter(block_number__in=[2, 3]).delete()
+        
+        self.assertEqual(
+            [slot.block_number for slot in MarketSlot.objects.filter(product=self.product)], [4]
+        )
+    
+    def test_archive_moves_keep_slot_rows(self):
+        """Test that deletes inside an archive move leave the slot rows alone"""
+        from .models import MarketSlot
+        from .tiering import moving
+        
+        with moving():
+            MarketData.objects.all().delete()
+        
+        self.assertEqual(MarketSlot.objects.filter(product=self.product).count(), 4)
+    
+    def test_load_aggregation_and_lists_use_slot_tables(self):
+        """Test the load aggregation and the load/generation slot lists"""
+        from .models import Generator, GenerationSchedule
+        
+        discom = Discom.objects.create(name='DISCOM1', state='State')
+        generator = Generator.objects.create(name='GEN1', capacity_mw=Decimal('500'), fuel_type='Coal')
+        for block in range(1, 4):
+            LoadSchedule.objects.create(
+                discom=discom, date=self.day, block_number=block,
+                scheduled_drawal=Decimal(f'{100 + (block % 3) * 10}.25'),
+                actual_drawal=Decimal('90.500') if block < 3 else None
+            )
+            GenerationSchedule.objects.create(
+                generator=generator, date=self.day, block_number=block,
+                scheduled_generation=Decimal('250.125')
+            )
+        url = reverse('core:load_aggregation')
+        
+        response = self.client.get(url, {'date': self.day.isoformat()})
+        with override_settings(FIXED_POINT_STORAGE=False):
+            expected = self.client.get(url, {'date': self.day.isoformat()})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected.data)
+        self.assertEqual(response.data[0]['peak_demand_block'], 2)
+        
+        loads = self.client.get(reverse('core:load_slot_list'), {'discom': 'DISCOM1'})
+        self.assertEqual(loads.data['count'], 3)
+        self.assertEqual(loads.data['results'][0]['block_number'], 3)
+        self.assertIsNone(loads.data['results'][0]['actual_drawal'])
+        generation = self.client.get(reverse('core:generation_slot_list'), {
+            'generator': 'GEN1', 'start_date': self.day.isoformat(), 'end_date': self.day.isoformat()
+        })
+        self.assertEqual(generation.data['count'], 3)
+        self.assertEqual(generation.data['results'][0]['scheduled_generation'], '250.125')
+
+
+@override_settings(DAY_PROFILE_STORAGE=True)
+class DayProfileStorageTestCase(TestCase):
+    """Test cases for the one-row-per-day load and generation profiles"""
+    
+    def setUp(self):
+        self.discom = Discom.objects.create(name='DISCOM1', state='State')
+        self.day = date.today() - timedelta(days=1)
+        for block in range(1, 5):
+            LoadSchedule.objects.create(
+                discom=self.discom,
+                date=self.day,
+                block_number=block,
+                scheduled_drawal=Decimal(f'{100 + block * 10}.25'),
+                actual_drawal=Decimal(f'{95 + block * 10}.500') if block < 4 else None
+            )
+    
+    def test_block_array_packing(self):
+        """Test that block arrays round-trip decimals and missing blocks"""
+        from .fields import BlockArrayField
+        
+        field = BlockArrayField()
+        values = [None] * 96
+        values[0] = Decimal('12.345')
+        values[95] = Decimal('-1.5')
+        
+        unpacked = field.unpack(field.pack(values))
+        self.assertEqual(len(field.pack(values)), 96 * 8)
+        self.assertEqual(unpacked[0], Decimal('12.345'))
+        self.assertEqual(unpacked[95], Decimal('-1.500'))
+        self.assertIsNone(unpacked[1])
+    
+    def test_saves_update_day_profile(self):
+        """Test that schedule saves write their block into the day profile"""
+        from .models import LoadProfile
+        
+        profile = LoadProfile.objects.get(discom=self.discom, date=self.day)
+        self.assertEqual(profile.scheduled_drawal[0], Decimal('110.25'))
+        self.assertEqual(profile.actual_drawal[2], Decimal('125.500'))
+        self.assertIsNone(profile.actual_drawal[3])
+        self.assertIsNone(profile.scheduled_drawal[4])
+    
+    def test_deletes_clear_day_profile_blocks(self):
+        """Test that deleted schedule blocks are emptied in the day profile"""
+        from .models import LoadProfile
+        
+        LoadSchedule.objects.filter(block_number__in=[1, 2]).delete()
+        
+        profile = LoadProfile.objects.get(discom=self.discom, date=self.day)
+        self.assertEqual(profile.scheduled_drawal[:4], [None, None, Decimal('130.25'), Decimal('140.25')])
+        self.assertIsNone(profile.actual_drawal[0])
+    
+    def test_block_save_locks_profile_before_reading(self):
+        """Test that a block save takes the write lock before reading the day blob"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import LoadProfile
+        
+        with CaptureQueriesContext(connection) as queries:
+            LoadSchedule.objects.create(discom=self.discom, date=self.day, block_number=5,
+                                        scheduled_drawal=Decimal('150.25'))
+        
+        statements = [query['sql'] for query in queries.captured_queries if 'core_loadprofile' in query['sql']]
+        # The read of the blob that is written back is locking, or follows the locking UPDATE
+        read = max(index for index, sql in enumerate(statements) if sql.startswith('SELECT'))
+        self.assertTrue('FOR UPDATE' in statements[read] or
+                        any(sql.startswith('UPDATE') for sql in statements[:read]))
+        profile = LoadProfile.objects.get(discom=self.discom, date=self.day)
+        self.assertEqual(profile.scheduled_drawal[3], Decimal('140.25'))
+        self.assertEqual(profile.scheduled_drawal[4], Decimal('150.25'))
+    
+    def test_build_day_profiles_command(self):
+        """Test converting existing schedules with build_day_profiles"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import LoadProfile
+        
+        LoadProfile.objects.all().delete()
+        out = StringIO()
+        call_command('build_day_profiles', stdout=out)
+        
+        self.assertIn('LoadSchedule: wrote 1 day profiles', out.getvalue())
+        blocks = LoadProfile.objects.get(discom=self.discom).blocks()
+        self.assertEqual(blocks[3]['block_number'], 4)
+        self.assertEqual(blocks[3]['scheduled'], Decimal('140.25'))
+    
+    def test_load_aggregation_uses_profiles(self):
+        """Test that the load aggregation matches the block layout"""
+        url = reverse('core:load_aggregation')
+        params = {'date': self.day.isoformat()}
+        
+        response = self.client.get(url, params)
+        with override_settings(DAY_PROFILE_STORAGE=False):
+            expected = self.client.get(url, params)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data, expected.data)
+    
+    def test_load_profile_list(self):
+        """Test the load profile list API"""
+        response = self.client.get(reverse('core:load_profile_list'), {'discom': 'DISCOM1'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results'][0]['scheduled_drawal']), 96)
+        self.assertEqual(response.data['results'][0]['scheduled_drawal'][0], '110.250')
+
+
+class MarketTurnoverTestCase(TestCase):
+    """Test cases for the stored MarketData turnover column"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        self.day = date.today() - timedelta(days=1)
+        self.timestamp = datetime.combine(self.day, datetime.min.time())
+        self.first = MarketData.objects.create(
+            product=self.product,
+            timestamp=self.timestamp,
+            block_number=1,
+            mcp=Decimal('2000.50'),
+            mcv=Decimal('100.25')
+        )
+        MarketData.objects.create(
+            product=self.product,
+            timestamp=self.timestamp + timedelta(minutes=15),
+            block_number=2,
+            mcp=Decimal('3000.00'),
+            mcv=Decimal('300.00')
+        )
+    
+    def test_turnover_maintained_on_save(self):
+        """Test that turnover follows mcp and mcv, including partial saves"""
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.turnover, Decimal('200550.1250'))
+        
+        self.first.mcv = Decimal('50.00')
+        self.first.save(update_fields=['mcv'])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.turnover, Decimal('100025.0000'))
+    
+    def test_bulk_rows_fill_turnover(self):
+        """Test that bulk-created rows carry turnover and trade_date"""
+        row = MarketData(
+            product=self.product,
+            timestamp=self.timestamp + timedelta(minutes=30),
+            block_number=3,
+            mcp=Decimal('10.00'),
+            mcv=Decimal('2.50')
+        )
+        MarketData.objects.bulk_create([row])
+        
+        self.assertEqual(MarketData.objects.get(block_number=3).turnover, Decimal('25.0000'))
+        self.assertEqual(MarketData.objects.get(block_number=3).trade_date, self.day)
+    
+    def test_queryset_update_recomputes_derived_fields(self):
+        """Test that QuerySet.update keeps turnover and trade_date in step"""
+        from django.db.models import F
+        
+        MarketData.objects.filter(block_number=1).update(mcv=Decimal('50.00'))
+        MarketData.objects.filter(block_number=2).update(mcp=F('mcp') + 1, timestamp=self.timestamp + timedelta(days=1))
+        
+        self.assertEqual(MarketData.objects.get(block_number=1).turnover, Decimal('100025.0000'))
+        second = MarketData.objects.get(block_number=2)
+        self.assertEqual(second.turnover, Decimal('900300.0000'))
+        self.assertEqual(second.trade_date, self.day + timedelta(days=1))
+    
+    def test_weighted_average_uses_turnover(self):
+        """Test weighted averages from the stored turnover"""
+        response = self.client.get(reverse('core:market_aggregation'), {
+            'start_date': self.day.isoformat(),
+            'end_date': self.day.isoformat()
+        })
+        
+        expected = (200550.125 + 900000) / 400.25
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(float(response.data[0]['weighted_avg_price']), expected, places=2)
+
+
+class TradeDateTestCase(TestCase):
+    """Test cases for the denormalised MarketData trade_date column"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+    
+    def test_trade_date_is_market_day(self):
+        """Test that trade_date is the IST day of the timestamp"""
+        from datetime import timezone as dt_timezone
+        
+        # 20:00 UTC is 01:30 the next morning in India
+        row = MarketData.objects.create(
+            product=self.product,
+            timestamp=datetime(2024, 3, 1, 20, 0, tzinfo=dt_timezone.utc),
+            block_number=7,
+            mcp=Decimal('2500.00'),
+            mcv=Decimal('100.00')
+        )
+        
+        self.assertEqual(row.trade_date, date(2024, 3, 2))
+        self.assertEqual(MarketData.objects.filter(trade_date=date(2024, 3, 2)).count(), 1)
+    
+    def test_day_aggregation_groups_on_column(self):
+        """Test that the market aggregation groups on trade_date without date casts"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        day = date.today() - timedelta(days=1)
+        MarketData.objects.create(
+            product=self.product,
+            timestamp=datetime.combine(day, datetime.min.time()),
+            block_number=1,
+            mcp=Decimal('2500.00'),
+            mcv=Decimal('100.00')
+        )
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('core:market_aggregation'), {
+                'start_date': day.isoformat(),
+                'end_date': day.isoformat()
+            })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['date'], day.isoformat())
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn('trade_date', sql)
+        self.assertNotIn('django_datetime_cast_date', sql)
+
+
+class ReferenceCacheTestCase(TestCase):
+    """Test cases for the product/discom/generator reference cache"""
+    
+    def setUp(self):
+        self.product = Product.objects.create(name='DAM')
+        self.day = date.today() - timedelta(days=1)
+        for block in range(1, 4):
+            MarketData.objects.create(
+                product=self.product,
+                timestamp=datetime.combine(self.day, datetime.min.time()) + timedelta(minutes=(block - 1) * 15),
+                block_number=block,
+                mcp=Decimal('2500.00'),
+                mcv=Decimal('100.00')
+            )
+    
+    def test_name_filters_use_foreign_key(self):
+        """Test that name filters resolve to an integer FK without a join"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import refdata
+        
+        refdata.products.id_for('DAM')
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(refdata.filter_by_name(MarketData.objects.all(), 'product', 'DAM'))
+        
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertFalse(refdata.filter_by_name(MarketData.objects.all(), 'product', 'XYZ').exists())
+    
+    def test_saves_invalidate_cache(self):
+        """Test that renaming a product is visible immediately"""
+        from . import refdata
+        
+        self.assertEqual(refdata.products.id_for('DAM'), self.product.id)
+        self.product.name = 'DAM-X'
+        self.product.save()
+        
+        self.assertEqual(refdata.products.id_for('DAM-X'), self.product.id)
+        self.assertEqual(refdata.products.name_for(self.product.id), 'DAM-X')
+    
+    def test_list_serializes_without_reference_queries(self):
+        """Test that the market data list does not query products per row"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        url = reverse('core:market_data_list')
+        self.client.get(url, {'product': 'DAM'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'product': 'DAM'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['product_name'], 'DAM')
+        self.assertFalse(any('core_product' in query['sql'] for query in queries.captured_queries))
+
+
+class IncrementalIngestTestCase(TestCase):
+    """Test cases for ledger-based incremental ingest"""
+    
+    def setUp(self):
+        import tempfile
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'iex_data.csv')
+        self.write('timestamp,price,volume\n2024-01-01T00:00:00,2500.00,100\n2024-01-01T00:15:00,2600.00,120\n')
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.data_dir)
+    
+    def write(self, text, mode='w'):
+        with open(self.path, mode) as file:
+            file.write(text)
+    
+    def ingest(self, **options):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        options.setdefault('file', 'iex_data')
+        call_command('ingest_data', data_dir=self.data_dir, stdout=out, stderr=out, **options)
+        return out.getvalue()
+    
+    def test_rerun_skips_unchanged_file(self):
+        """Test that a second run inserts nothing"""
+        self.ingest()
+        output = self.ingest()
+        
+        self.assertIn('up to date', output)
+        self.assertEqual(IEXData.objects.count(), 2)
+    
+    def test_appended_rows_resume_from_offset(self):
+        """Test that only appended lines are ingested, and partial lines wait"""
+        from .models import IngestLedger
+        
+        self.ingest()
+        self.write('2024-01-01T00:30:00,2700.00,130\n2024-01-01T00:45', mode='a')
+        output = self.ingest()
+        
+        self.assertIn('Resumed', output)
+        self.assertEqual(IEXData.objects.count(), 3)
+        ledger = IngestLedger.objects.get()
+        self.assertLess(ledger.offset, os.path.getsize(self.path))
+        
+        self.write(':00,2800.00,140\n', mode='a')
+        self.ingest()
+        self.assertEqual(IEXData.objects.count(), 4)
+        self.assertEqual(IngestLedger.objects.get().offset, os.path.getsize(self.path))
+    
+    def test_rewritten_file_is_not_reingested(self):
+        """Test that a rewritten file is reported instead of duplicated"""
+        self.ingest()
+        self.write('timestamp,price,volume\n2024-02-01T00:00:00,1.00,1\n2024-02-01T00:15:00,2.00,2\n')
+        output = self.ingest()
+        
+        self.assertIn('new file name', output)
+        self.assertEqual(IEXData.objects.count(), 2)
+        
+        # IEX rows have no unique key, so a reset would duplicate them
+        output = self.ingest(reset=True)
+        self.assertIn('Not resetting', output)
+        self.assertEqual(IEXData.objects.count(), 2)
+    
+    def test_reset_reingests_market_file_without_duplicates(self):
+        """Test that --reset replays a rewritten market file onto the keyed rows"""
+        from .models import MarketData
+        
+        Product.objects.create(name='DAM')
+        path = os.path.join(self.data_dir, 'market_data.csv')
+        with open(path, 'w') as file:
+            file.write('timestamp,product,mcp,mcv\n2024-01-01T00:00:00,DAM,2500.00,100\n')
+        self.ingest(file='market_data')
+        with open(path, 'w') as file:
+            file.write('timestamp,product,mcp,mcv\n2024-01-01T00:00:00,DAM,2600.00,100\n2024-01-01T00:15:00,DAM,2700.00,90\n')
+        
+        self.assertIn('use --reset', self.ingest(file='market_data'))
+        self.ingest(file='market_data', reset=True)
+        self.assertEqual(MarketData.objects.count(), 2)
+        self.assertEqual(MarketData.objects.get(block_number=1).mcp, Decimal('2600.00'))
+    
+    def test_resume_checks_only_the_tail_window(self):
+        """Test that a resume hashes the header and the bytes just before the offset"""
+        from unittest import mock
+        from . import ingest
+        from .models import IngestLedger
+        
+        with mock.patch.object(ingest, 'TAIL_WINDOW', 16):
+            self.ingest()
+            ledger = IngestLedger.objects.get()
+            self.assertEqual(ledger.hash_start, ledger.offset - 16)
+            
+            # A change before the window goes unread; one inside it is caught
+            with open(self.path, 'r+b') as file:
+                file.seek(len('timestamp,price,volume\n'))
+                file.write(b'2025')
+            self.write('2024-01-01T00:30:00,2700.00,130\n', mode='a')
+            self.assertIn('Resumed', self.ingest())
+            self.assertEqual(IEXData.objects.count(), 3)
+            
+            with open(self.path, 'r+b') as file:
+                file.seek(os.path.getsize(self.path) - 4)
+                file.write(b'999\n')
+            self.write('2024-01-01T00:45:00,2800.00,140\n', mode='a')
+            self.assertIn('was rewritten', self.ingest())
+            self.assertEqual(IEXData.objects.count(), 3)
+    
+    def test_whole_prefix_hash_is_still_accepted(self):
+        """Test that a ledger hashed before tail windows resumes and moves to one"""
+        import hashlib
+        from .models import IngestLedger
+        
+        self.ingest()
+        with open(self.path, 'rb') as file:
+            prefix = file.read()
+        IngestLedger.objects.update(hash_start=0, content_hash=hashlib.sha256(prefix).hexdigest())
+        self.write('2024-01-01T00:30:00,2700.00,130\n', mode='a')
+        
+        self.assertIn('Resumed', self.ingest())
+        self.assertEqual(IEXData.objects.count(), 3)
+        self.assertEqual(IngestLedger.objects.get().hash_start, len('timestamp,price,volume\n'))
+    
+    def test_crash_resumes_after_last_committed_batch(self):
+        """Test that a failure mid-file keeps committed batches and the ledger in step"""
+        from . import ingest
+        
+        self.write('2024-01-01T00:30:00,2700.00,130\nnot-a-date,1,1\n', mode='a')
+        
+        def build(row):
+            return IEXData(timestamp=datetime.fromisoformat(row['timestamp']), price=row['price'], volume=row['volume'])
+        
+        with self.assertRaises(ValueError):
+            ingest.ingest_csv(self.path, IEXData, build, batch_size=2)
+        self.assertEqual(IEXData.objects.count(), 2)
+        
+        with open(self.path) as file:
+            lines = file.readlines()
+        self.write(''.join(lines[:-1]) + '2024-01-01T00:45:00,2800.00,140\n')
+        result = ingest.ingest_csv(self.path, IEXData, build, batch_size=2)
+        
+        self.assertEqual(result['status'], 'resumed')
+        self.assertEqual(IEXData.objects.count(), 4)
+
+
+class WatchIngestTestCase(TestCase):
+    """Test cases for the watch_ingest streaming command"""
+    
+    def setUp(self):
+        import tempfile
+        self.data_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.data_dir)
+    
+    def write(self, name, text, mode='w'):
+        with open(os.path.join(self.data_dir, name), mode) as file:
+            file.write(text)
+    
+    def test_scans_pick_up_new_and_appended_files(self):
+        """Test that each scan ingests only the rows that arrived since the last"""
+        from io import StringIO
+        from .management.commands.watch_ingest import Command
+        
+        command = Command(stdout=StringIO(), stderr=StringIO())
+        command.seen = {}
+        self.write('iex_data_rtm.csv', 'timestamp,price,volume\n2024-01-01T00:00:00,2500.00,100\n')
+        self.write('notes.txt', 'ignored\n')
+        command.scan(self.data_dir, batch_size=100)
+        self.assertEqual(IEXData.objects.count(), 1)
+        
+        self.write('iex_data_rtm.csv', '2024-01-01T00:15:00,2600.00,110\n', mode='a')
+        self.write('load_data_today.csv', 'timestamp,load_value,region\n2024-01-01T00:00:00,500.00,North\n')
+        command.scan(self.data_dir, batch_size=100)
+        command.scan(self.data_dir, batch_size=100)
+        
+        self.assertEqual(IEXData.objects.count(), 2)
+        self.assertEqual(LoadData.objects.count(), 1)
+    
+    def test_once_option(self):
+        """Test a single pass from the command line"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        self.write('generation_data.csv', 'timestamp,generation_value,fuel_type,region\n2024-01-01T00:00:00,300.00,Solar,North\n')
+        out = StringIO()
+        call_command('watch_ingest', data_dir=self.data_dir, once=True, stdout=out)
+        
+        self.assertIn('Ingested 1 rows from generation_data.csv', out.getvalue())
+        self.assertEqual(GenerationData.objects.count(), 1)
+
+
+class StagingMergeTestCase(TestCase):
+    """Test cases for the staging-table merge into the block tables"""
+    
+    def setUp(self):
+        self.discom = Discom.objects.create(name='DISCOM1', state='State')
+        self.day = date(2024, 1, 1)
+    
+    def schedule(self, block, scheduled, actual=None):
+        return LoadSchedule(
+            discom=self.discom,
+            date=self.day,
+            block_number=block,
+            scheduled_drawal=Decimal(scheduled),
+            actual_drawal=None if actual is None else Decimal(actual)
+        )
+    
+    def test_merge_reports_inserted_updated_unchanged(self):
+        """Test that one merge inserts new keys and updates only changed rows"""
+        from .merge import merge_rows
+        
+        counts = merge_rows(LoadSchedule, [self.schedule(1, '100.00'), self.schedule(2, '200.00')])
+        self.assertEqual(counts, {'inserted': 2, 'updated': 0, 'unchanged': 0})
+        
+        counts = merge_rows(LoadSchedule, [
+            self.schedule(1, '100.00'),
+            self.schedule(2, '200.00', '210.00'),
+            self.schedule(3, '300.00'),
+        ])
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1})
+        self.assertEqual(LoadSchedule.objects.count(), 3)
+        self.assertEqual(LoadSchedule.objects.get(block_number=2).actual_drawal, Decimal('210.00'))
+    
+    def test_merge_fills_market_derived_fields(self):
+        """Test that merged market rows carry turnover and trade_date"""
+        from .merge import merge_rows
+        
+        product = Product.objects.create(name='DAM')
+        counts = merge_rows(MarketData, [MarketData(
+            product=product,
+            timestamp=datetime(2024, 1, 1, 0, 15),
+            block_number=2,
+            mcp=Decimal('2000.00'),
+            mcv=Decimal('10.00')
+        )])
+        
+        row = MarketData.objects.get()
+        self.assertEqual(counts['inserted'], 1)
+        self.assertEqual(row.turnover, Decimal('20000.0000'))
+        self.assertEqual(row.trade_date, date(2024, 1, 1))
+    
+    def test_generate_sample_keeps_existing_rows(self):
+        """Test that regenerating sample data inserts nothing the second time"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        call_command('ingest_data', generate_sample=True, days=1, stdout=StringIO())
+        first = LoadSchedule.objects.order_by('pk').values_list('scheduled_drawal', flat=True).first()
+        out = StringIO()
+        call_command('ingest_data', generate_sample=True, days=1, stdout=out)
+        
+        self.assertIn('market_data: 0 rows inserted', out.getvalue())
+        self.assertEqual(MarketData.objects.count(), 2 * 96)
+        self.assertEqual(LoadSchedule.objects.order_by('pk').values_list('scheduled_drawal', flat=True).first(), first)
+    
+    def test_generate_sample_times_each_table(self):
+        """Test that each table's ingest metric gets the time of its own writes"""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from . import metrics
+        from .management.commands import ingest_data
+        
+        clock = mock.Mock()
+        clock.perf_counter.side_effect = [0.0, 1.0, 10.0, 13.0, 20.0, 26.0]
+        with mock.patch.object(ingest_data, 'time', clock), \
+                mock.patch.object(metrics, 'record_ingest') as record_ingest:
+            call_command('ingest_data', generate_sample=True, days=1, stdout=StringIO())
+        
+        self.assertEqual(
+            {call.args[0]: call.args[2] for call in record_ingest.call_args_list},
+            {'market_data': 1.0, 'load_schedule': 3.0, 'generation_schedule': 6.0}
+        )
+    
+    @override_settings(FIXED_POINT_STORAGE=True, DAY_PROFILE_STORAGE=True)
+    def test_merge_refreshes_rollups(self):
+        """Test that merged rows reach the slot and day-profile tables"""
+        from .merge import merge_rows
+        from .models import LoadSlot, LoadProfile
+        
+        merge_rows(LoadSchedule, [self.schedule(1, '100.00'), self.schedule(2, '200.00')])
+        
+        self.assertEqual(LoadSlot.objects.count(), 2)
+        self.assertEqual(LoadProfile.objects.get().scheduled_drawal[1], Decimal('200.000'))
+
+
+class CopyIngestTestCase(TestCase):
+    """Test cases for the PostgreSQL COPY fast path and its fallback"""
+    
+    def test_copy_payload_keeps_nulls_distinct(self):
+        """Test the CSV sent to COPY for NULLs, empty strings and numbers"""
+        from django.db import connection
+        from .pgcopy import copy_rows
+        
+        class RawCursor:
+            def copy_expert(self, sql, file):
+                self.sql = sql
+                self.data = file.read()
+        
+        class Cursor:
+            db = connection
+            cursor = RawCursor()
+        
+        cursor = Cursor()
+        copy_rows(cursor, 'core_loaddata', ['load_value', 'region'], [[Decimal('1.50'), ''], [None, 'North']])
+        
+        self.assertIn('FROM STDIN WITH (FORMAT csv)', cursor.cursor.sql)
+        self.assertEqual(cursor.cursor.data, '"1.50",""\n,"North"\n')
+    
+    def test_copy_streams_rows_in_chunks(self):
+        """Test that rows are encoded and sent a chunk at a time with both psycopg APIs"""
+        from django.db import connection
+        from unittest import mock
+        from . import pgcopy
+        
+        consumed = []
+        
+        def rows():
+            for index in range(5):
+                consumed.append(index)
+                yield [index]
+        
+        class Copy:
+            def __init__(self):
+                self.writes = []
+            
+            def __enter__(self):
+                return self
+            
+            def __exit__(self, *exc):
+                return False
+            
+            def write(self, data):
+                # Only the rows of the chunks sent so far have been generated
+                self.writes.append((data, len(consumed)))
+        
+        class Psycopg3Cursor:
+            def copy(self, sql):
+                self.copy_block = Copy()
+                return self.copy_block
+        
+        class Psycopg2Cursor:
+            def copy_expert(self, sql, file, size=8):
+                self.reads = []
+                while True:
+                    data = file.read(size)
+                    if not data:
+                        break
+                    self.reads.append(data)
+        
+        class Cursor:
+            db = connection
+        
+        with mock.patch.object(pgcopy, 'CHUNK_ROWS', 2):
+            cursor = Cursor()
+            cursor.cursor = Psycopg3Cursor()
+            pgcopy.copy_rows(cursor, 'core_loaddata', ['load_value'], rows())
+            self.assertEqual(cursor.cursor.copy_block.writes, [('"0"\n"1"\n', 2), ('"2"\n"3"\n', 4), ('"4"\n', 5)])
+            
+            consumed.clear()
+            cursor.cursor = Psycopg2Cursor()
+            pgcopy.copy_rows(cursor, 'core_loaddata', ['load_value'], rows())
+            self.assertEqual(''.join(cursor.cursor.reads), '"0"\n"1"\n"2"\n"3"\n"4"\n')
+            self.assertTrue(all(len(data) <= 8 for data in cursor.cursor.reads))
+    
+    def test_bulk_insert_falls_back_to_bulk_create(self):
+        """Test that other databases get batched inserts"""
+        from .pgcopy import bulk_insert
+        
+        bulk_insert(LoadData, [
+            LoadData(timestamp=datetime(2024, 1, 1), load_value=Decimal('500.00'), region='North'),
+            LoadData(timestamp=datetime(2024, 1, 1, 0, 15), load_value=Decimal('510.00'), region='North'),
+        ])
+        
+        self.assertEqual(LoadData.objects.count(), 2)
+        self.assertIsNotNone(LoadData.objects.first().created_at)
+    
+    def test_copy_into_postgresql(self):
+        """Test COPY ingest and staging merge against a PostgreSQL default database"""
+        from django.db import connection
+        from .merge import merge_rows
+        from .pgcopy import bulk_insert
+        
+        if connection.vendor != 'postgresql':
+            self.skipTest('set GNA_POSTGRES_DB to run against PostgreSQL')
+        
+        bulk_insert(LoadData, [LoadData(timestamp=datetime(2024, 1, 1), load_value=Decimal('500.00'), region='')])
+        self.assertEqual(LoadData.objects.get().region, '')
+        
+        discom = Discom.objects.create(name='DISCOM1', state='State')
+        row = LoadSchedule(discom=discom, date=date(2024, 1, 1), block_number=1, scheduled_drawal=Decimal('100.00'))
+        self.assertEqual(merge_rows(LoadSchedule, [row])['inserted'], 1)
+        self.assertIsNone(LoadSchedule.objects.get().actual_drawal)
+
+
+class CompressedIngestTestCase(TestCase):
+    """Test cases for ingesting .csv.gz files and .zip bundles"""
+    
+    def setUp(self):
+        import tempfile
+        self.data_dir = tempfile.mkdtemp()
+        self.rows = 'timestamp,price,volume\n2024-01-01T00:00:00,2500.00,100\n2024-01-01T00:15:00,2600.00,120\n'
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.data_dir)
+    
+    def ingest(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('ingest_data', file='iex_data', data_dir=self.data_dir, stdout=out)
+        return out.getvalue()
+    
+    def test_gzip_file_is_streamed_once(self):
+        """Test that a .csv.gz is ingested and then left alone"""
+        import gzip
+        
+        with gzip.open(os.path.join(self.data_dir, 'iex_data.csv.gz'), 'wt') as file:
+            file.write(self.rows)
+        
+        self.assertIn('2 rows', self.ingest())
+        self.assertIn('up to date', self.ingest())
+        self.assertEqual(IEXData.objects.count(), 2)
+    
+    def test_zip_members_are_ingested_separately(self):
+        """Test that each CSV member of a zip bundle gets its own ledger entry"""
+        import zipfile
+        from .models import IngestLedger
+        
+        with zipfile.ZipFile(os.path.join(self.data_dir, 'iex_data.zip'), 'w') as bundle:
+            bundle.writestr('2024-01-01.csv', self.rows)
+            bundle.writestr('2024-01-02.csv', self.rows.replace('2024-01-01', '2024-01-02'))
+            bundle.writestr('README.txt', 'not data')
+        
+        self.ingest()
+        
+        self.assertEqual(IEXData.objects.count(), 4)
+        self.assertEqual(IngestLedger.objects.filter(path__contains='.zip::', complete=True).count(), 2)
+    
+    def test_interrupted_gzip_resumes(self):
+        """Test that a compressed file re-read after a failure skips committed rows"""
+        import gzip
+        from . import ingest
+        
+        path = os.path.join(self.data_dir, 'iex_data.csv.gz')
+        with gzip.open(path, 'wt') as file:
+            file.write(self.rows + 'bad,1,1\n')
+        with self.assertRaises(ValueError):
+            ingest.ingest_csv(path, IEXData, ingest.build_iex_data, batch_size=1)
+        
+        with gzip.open(path, 'wt') as file:
+            file.write(self.rows + '2024-01-01T00:30:00,2700.00,130\n')
+        result = ingest.ingest_csv(path, IEXData, ingest.build_iex_data, batch_size=1)
+        
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(IEXData.objects.count(), 3)
+
+
+class MarketWorkbookIngestTestCase(TestCase):
+    """Test cases for exchange market report ingest"""
+    
+    def setUp(self):
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+    
+    def test_report_header_is_mapped(self):
+        """Test that exchange column names map onto MarketData fields"""
+        from .market_ingest import market_columns, normalise
+        
+        self.assertEqual(normalise('MCP (Rs/MWh)'), 'mcp')
+        self.assertEqual(normalise('Time Block'), 'time_block')
+        columns = market_columns(['Date', 'Time Block', 'Purchase Bid (MW)', 'Sell Bid (MW)', 'MCV (MW)', 'MCP (Rs/MWh)'])
+        self.assertEqual(columns, {
+            'date': 0, 'block_number': 1, 'purchase_bid_volume': 2,
+            'sell_bid_volume': 3, 'mcv': 4, 'mcp': 5,
+        })
+        self.assertIsNone(market_columns(['Market Snapshot', None, None]))
+    
+    def test_block_is_derived_from_time_range(self):
+        """Test that a '00:15 - 00:30' block becomes block 2 at 00:15 local time"""
+        from django.utils import timezone
+        from .market_ingest import build_market_data, market_columns
+        
+        columns = market_columns(['Date', 'Time Block', 'MCP', 'MCV'])
+        obj = build_market_data(['15-01-2024', '00:15 - 00:30', '3,250.50', '1200'], columns, product='dam')
+        
+        self.assertEqual(obj.product_id, self.dam.id)
+        self.assertEqual(obj.block_number, 2)
+        self.assertEqual(timezone.localtime(obj.timestamp).strftime('%Y-%m-%d %H:%M'), '2024-01-15 00:15')
+        self.assertEqual(obj.mcp, Decimal('3250.50'))
+        with self.assertRaises(ValueError):
+            build_market_data(['15-01-2024', '1', '1', '1'], columns, product='XYZ')
+    
+    def test_workbook_is_merged(self):
+        """Test that a workbook's rows are merged once and re-ingest leaves them alone"""
+        import shutil
+        import tempfile
+        from . import market_ingest
+        
+        if market_ingest.openpyxl is None:
+            self.skipTest('openpyxl is not installed')
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'dam.xlsx')
+        workbook = market_ingest.openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'DAM'
+        sheet.append(['IEX Day Ahead Market Snapshot'])
+        sheet.append(['Date', 'Block', 'MCP (Rs/MWh)', 'MCV (MW)'])
+        for block in range(1, 5):
+            sheet.append(['2024-01-15', block, 3000 + block, 1000])
+        workbook.save(path)
+        
+        result = market_ingest.ingest_xlsx(path, batch_size=3)
+        
+        self.assertEqual(result['inserted'], 4)
+        self.assertEqual(MarketData.objects.filter(product=self.dam).count(), 4)
+        self.assertEqual(market_ingest.ingest_xlsx(path)['status'], 'unchanged')
+    
+    def test_bad_workbook_is_rejected_before_writing(self):
+        """Test that an unknown product fails the workbook up front and headerless sheets are reported"""
+        import shutil
+        import tempfile
+        from . import market_ingest
+        
+        if market_ingest.openpyxl is None:
+            self.skipTest('openpyxl is not installed')
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'dam.xlsx')
+        workbook = market_ingest.openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'DAM'
+        sheet.append(['Date', 'Block', 'MCP', 'MCV'])
+        for block in range(1, 5):
+            sheet.append(['2024-01-15', block, 3000 + block, 1000])
+        workbook.create_sheet('Notes').append(['Prices are provisional'])
+        other = workbook.create_sheet('Other')
+        other.append(['Product', 'Date', 'Block', 'MCP', 'MCV'])
+        other.append(['GDAM', '2024-01-15', 1, 3000, 1000])
+        workbook.save(path)
+        
+        with self.assertRaisesMessage(ValueError, "Sheet 'Other', data row 5: Unknown product 'GDAM'"):
+            market_ingest.ingest_xlsx(path, batch_size=2)
+        self.assertEqual(MarketData.objects.count(), 0)
+        
+        Product.objects.create(name='GDAM')
+        result = market_ingest.ingest_xlsx(path, batch_size=2)
+        self.assertEqual(result['inserted'], 5)
+        self.assertEqual(result['skipped_sheets'], ['Notes'])
+    
+    def test_blank_price_rejects_workbook_before_writing(self):
+        """Test that a blank MCP cell or an out-of-range block rejects the workbook with nothing merged"""
+        import shutil
+        import tempfile
+        from . import market_ingest
+        
+        if market_ingest.openpyxl is None:
+            self.skipTest('openpyxl is not installed')
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        path = os.path.join(data_dir, 'dam.xlsx')
+        workbook = market_ingest.openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'DAM'
+        sheet.append(['Date', 'Block', 'MCP', 'MCV'])
+        for block in range(1, 4):
+            sheet.append(['2024-01-15', block, 3000 + block, 1000])
+        sheet.append(['2024-01-15', 4, None, 1000])
+        workbook.save(path)
+        
+        with self.assertRaisesMessage(ValueError, "data row 4: Missing MCP"):
+            market_ingest.ingest_xlsx(path, batch_size=2)
+        self.assertEqual(MarketData.objects.count(), 0)
+        
+        columns = market_ingest.market_columns(['Date', 'Block', 'MCP', 'MCV'])
+        for block in (0, 97):
+            with self.assertRaises(ValueError):
+                market_ingest.build_market_data(['2024-01-15', block, 1, 1], columns, product='DAM')
+
+
+class MarketFeedIngestTestCase(TestCase):
+    """Test cases for ingesting exchange feeds straight into MarketData"""
+    
+    def setUp(self):
+        import tempfile
+        self.data_dir = tempfile.mkdtemp()
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+        self.rtm = Product.objects.create(name='RTM', description='Real Time Market')
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.data_dir)
+    
+    def write(self, text, mode='w'):
+        with open(os.path.join(self.data_dir, 'market_data.csv'), mode) as file:
+            file.write(text)
+    
+    def ingest(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('ingest_data', file='market_data', data_dir=self.data_dir, stdout=out)
+        return out.getvalue()
+    
+    def test_block_and_product_are_derived(self):
+        """Test that feed rows land in MarketData with block and product resolved"""
+        self.write(
+            'timestamp,product,price,volume\n'
+            '2024-01-15T00:00:00,DAM,3000.00,1000\n'
+            '2024-01-15T00:15:00,rtm,3100.00,900\n'
+            '2024-01-15T23:45:00,DAM,2900.00,800\n'
+        )
+        
+        self.assertIn('3 rows of Market data', self.ingest())
+        
+        last = MarketData.objects.get(product=self.dam, block_number=96)
+        self.assertEqual(last.trade_date, date(2024, 1, 15))
+        self.assertEqual(last.turnover, Decimal('2320000.0000'))
+        self.assertEqual(MarketData.objects.get(product=self.rtm).block_number, 2)
+    
+    def test_revised_block_updates_row(self):
+        """Test that a later row for the same block updates it instead of failing on the key"""
+        self.write('timestamp,product,mcp,mcv\n2024-01-15T00:00:00,DAM,3000.00,1000\n')
+        self.ingest()
+        self.write('2024-01-15T00:07:30,DAM,3050.00,1000\n', mode='a')
+        self.ingest()
+        
+        row = MarketData.objects.get(product=self.dam)
+        self.assertEqual(row.mcp, Decimal('3050.00'))
+        self.assertEqual(row.block_number, 1)
+    
+    def test_bad_row_is_reported_with_its_row_and_field(self):
+        """Test that a malformed row stops the command with a CommandError naming it"""
+        from django.core.management.base import CommandError
+        self.write(
+            'timestamp,product,price,volume\n'
+            '2024-01-15T00:00:00,DAM,3000.00,1000\n'
+            '2024-01-15T00:15:00,DAM,n/a,900\n'
+        )
+        
+        with self.assertRaisesMessage(CommandError, "data row 2: Invalid price 'n/a'"):
+            self.ingest()
+        self.write('timestamp,product,price,volume\n2024-01-15T00:00:00,DAM,3000.00\n')
+        with self.assertRaisesMessage(CommandError, 'data row 1: Missing mcv or volume'):
+            self.ingest()
+    
+    def test_unknown_product_is_rejected(self):
+        """Test that a row naming an unknown product stops the ingest"""
+        from . import ingest
+        
+        with self.assertRaises(ValueError):
+            ingest.build_market_data({'timestamp': '2024-01-15T00:00:00', 'product': 'XYZ', 'mcp': '1', 'mcv': '1'})
+
+
+class LegacyMigrationTestCase(TestCase):
+    """Test cases for converting the legacy feed tables"""
+    
+    def setUp(self):
+        from django.utils import timezone
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+        self.upcl = Discom.objects.create(name='UPCL', state='Uttarakhand', region='North')
+        self.tehri = Generator.objects.create(name='Tehri Hydro', capacity_mw=1000, fuel_type='Hydro', location='Uttarakhand')
+        start = timezone.make_aware(datetime(2024, 1, 15))
+        for minutes, price in ((0, '3000.00'), (15, '3100.00'), (20, '3300.00')):
+            IEXData.objects.create(timestamp=start + timedelta(minutes=minutes), price=price, volume=1000)
+        LoadData.objects.create(timestamp=start + timedelta(minutes=30), load_value='800.00', region='North')
+        LoadData.objects.create(timestamp=start + timedelta(minutes=35), load_value='900.00', region='North')
+        LoadData.objects.create(timestamp=start, load_value='100.00', region='South')
+        GenerationData.objects.create(timestamp=start + timedelta(hours=23, minutes=45), generation_value='700.00', fuel_type='Hydro', region='Uttarakhand')
+    
+    def migrate(self, **options):
+        from io import StringIO
+        from django.core.management import call_command
+        out, err = StringIO(), StringIO()
+        call_command('migrate_legacy_data', stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+    
+    def test_rows_are_mapped_to_blocks(self):
+        """Test that legacy rows land in the block models with derived day and block"""
+        from django.utils import timezone
+        
+        out, err = self.migrate()
+        
+        self.assertEqual(MarketData.objects.count(), 2)
+        second = MarketData.objects.get(block_number=2)
+        self.assertEqual(second.mcp, Decimal('3200.00'))
+        self.assertEqual(second.timestamp, timezone.make_aware(datetime(2024, 1, 15, 0, 15)))
+        self.assertEqual(second.trade_date, date(2024, 1, 15))
+        self.assertEqual(second.turnover, Decimal('3200000.0000'))
+        load = LoadSchedule.objects.get()
+        self.assertEqual((load.discom, load.block_number, load.actual_drawal), (self.upcl, 3, Decimal('850.00')))
+        self.assertEqual(GenerationSchedule.objects.get().block_number, 96)
+        self.assertIn('1 rows have no matching DISCOM', err)
+        self.assertIn('ids (100%)', out)
+    
+    def test_blocks_spanning_chunks_are_averaged_whole(self):
+        """Test that readings of one block in different chunks are averaged together"""
+        self.migrate(chunk_size=1)
+        
+        self.assertEqual(MarketData.objects.get(block_number=2).mcp, Decimal('3200.00'))
+        self.assertEqual(LoadSchedule.objects.get().actual_drawal, Decimal('850.00'))
+    
+    def test_rerun_resumes(self):
+        """Test that a second run converts only rows added since the first"""
+        from django.utils import timezone
+        from .models import IngestLedger
+        
+        self.migrate(table=['load_data'], discom=['South=UPCL'])
+        self.assertEqual(LoadSchedule.objects.get(block_number=1).actual_drawal, Decimal('100.00'))
+        LoadData.objects.create(timestamp=timezone.make_aware(datetime(2024, 1, 16)), load_value='500.00', region='North')
+        
+        out, _ = self.migrate(table=['load_data'], discom=['South=UPCL'])
+        
+        self.assertIn('wrote 1 LoadSchedule rows', out)
+        self.assertEqual(LoadSchedule.objects.count(), 3)
+        self.assertEqual(IngestLedger.objects.get(path='legacy:core_loaddata').offset, LoadData.objects.latest('id').id)
+
+
+class BulkUpsertAPITestCase(TestCase):
+    """Test cases for the bulk upsert endpoints"""
+    
+    def setUp(self):
+        from django.contrib.auth.models import Permission
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+        self.upcl = Discom.objects.create(name='UPCL', state='Uttarakhand', region='North')
+        self.user = User.objects.create_user('scada', password='secret')
+        self.user.user_permissions.add(*Permission.objects.filter(
+            codename__in=['add_marketdata', 'change_marketdata', 'add_loadschedule', 'change_loadschedule']
+        ))
+        self.client.force_authenticate(self.user)
+    
+    def test_anonymous_request_is_refused(self):
+        """Test that the endpoints need an authenticated user"""
+        self.client.force_authenticate(None)
+        response = self.client.post(reverse('core:load_schedule_bulk'), [], format='json')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+    
+    def test_user_without_change_permission_is_refused(self):
+        """Test that upserting needs the add and change permissions"""
+        other = User.objects.create_user('viewer', password='secret')
+        self.client.force_authenticate(other)
+        response = self.client.post(reverse('core:load_schedule_bulk'), [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_json_batch_is_upserted(self):
+        """Test that a JSON batch inserts new blocks and updates existing ones"""
+        LoadSchedule.objects.create(discom=self.upcl, date=date(2024, 1, 15), block_number=1, scheduled_drawal=100)
+        rows = [
+            {'discom': 'UPCL', 'date': '2024-01-15', 'block_number': block, 'scheduled_drawal': '500.00'}
+            for block in range(1, 97)
+        ]
+        
+        response = self.client.post(reverse('core:load_schedule_bulk'), rows, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'inserted': 95, 'updated': 1, 'unchanged': 0, 'rows': 96})
+        self.assertEqual(LoadSchedule.objects.get(block_number=1).scheduled_drawal, Decimal('500.00'))
+        self.assertIsNone(LoadSchedule.objects.get(block_number=1).actual_drawal)
+    
+    def test_ndjson_and_csv_batches(self):
+        """Test that NDJSON and CSV bodies are accepted"""
+        ndjson = (
+            '{"product": "DAM", "timestamp": "2024-01-15T00:15:00", "mcp": "3000", "mcv": "1000"}\n'
+            '{"product": "DAM", "timestamp": "2024-01-15T00:30:00", "mcp": "3100", "mcv": "900"}\n'
+        )
+        response = self.client.post(reverse('core:market_data_bulk'), ndjson, content_type='application/x-ndjson')
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual(MarketData.objects.get(mcp=Decimal('3000')).block_number, 2)
+        
+        csv_body = 'discom,date,block_number,scheduled_drawal,actual_drawal\nUPCL,2024-01-15,5,400,\n'
+        response = self.client.post(reverse('core:load_schedule_bulk'), csv_body, content_type='text/csv')
+        self.assertEqual(response.data['inserted'], 1)
+    
+    def test_invalid_batch_is_rejected_whole(self):
+        """Test that one bad row rejects the batch and reports every bad row"""
+        rows = [
+            {'discom': 'UPCL', 'date': '2024-01-15', 'block_number': 1, 'scheduled_drawal': '500.00'},
+            {'discom': 'XYZ', 'date': '2024-01-15', 'block_number': 2, 'scheduled_drawal': '500.00'},
+            {'discom': 'UPCL', 'date': '2024-01-15', 'block_number': 97, 'scheduled_drawal': 'abc'},
+        ]
+        
+        response = self.client.post(reverse('core:load_schedule_bulk'), rows, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'block_number', 'scheduled_drawal'})
+        self.assertEqual(LoadSchedule.objects.count(), 0)
+
+
+class LateActualsTestCase(TestCase):
+    """Test cases for patching late-arriving actuals"""
+    
+    def setUp(self):
+        from django.contrib.auth.models import Permission
+        from rest_framework.test import APIClient
+        self.upcl = Discom.objects.create(name='UPCL', state='Uttarakhand', region='North')
+        self.day = date(2024, 1, 15)
+        for block in (1, 2):
+            LoadSchedule.objects.create(discom=self.upcl, date=self.day, block_number=block, scheduled_drawal=500)
+        self.client = APIClient()
+        user = User.objects.create_user('scada', password='secret')
+        user.user_permissions.add(Permission.objects.get(codename='change_loadschedule'))
+        self.client.force_authenticate(user)
+    
+    def test_actuals_are_patched_and_missing_reported(self):
+        """Test that existing blocks get their actuals and unknown blocks are only reported"""
+        from . import actuals
+        
+        objs = [
+            LoadSchedule(discom_id=self.upcl.id, date=self.day, block_number=1, actual_drawal=Decimal('480.00')),
+            LoadSchedule(discom_id=self.upcl.id, date=self.day, block_number=3, actual_drawal=Decimal('470.00')),
+        ]
+        result = actuals.apply_actuals(LoadSchedule, objs)
+        
+        self.assertEqual((result['updated'], result['unchanged'], result['missing']), (1, 0, 1))
+        self.assertEqual(result['missing_keys'], [[self.upcl.id, '2024-01-15', 3]])
+        self.assertEqual(LoadSchedule.objects.get(block_number=1).actual_drawal, Decimal('480.00'))
+        self.assertEqual(LoadSchedule.objects.count(), 2)
+        self.assertEqual(actuals.apply_actuals(LoadSchedule, objs[:1])['unchanged'], 1)
+    
+    def test_only_the_sent_keys_are_fetched(self):
+        """Test that the lookup does not fetch the cross product of entities, days and blocks"""
+        from unittest import mock
+        from . import actuals
+        
+        ptcul = Discom.objects.create(name='PTCUL', state='Uttarakhand', region='North')
+        other_day = self.day + timedelta(days=1)
+        for discom in (self.upcl, ptcul):
+            for day in (self.day, other_day):
+                for block in (1, 2, 3):
+                    LoadSchedule.objects.get_or_create(discom=discom, date=day, block_number=block,
+                                                       defaults={'scheduled_drawal': 500})
+        keys = [(self.upcl.id, self.day, 1), (ptcul.id, other_day, 3)]
+        
+        rows = actuals._stored_rows(LoadSchedule, keys)
+        self.assertEqual(sorted(rows), sorted(keys))
+        
+        with mock.patch.object(actuals, 'KEY_QUERY_BATCH', 1):
+            result = actuals.apply_actuals(LoadSchedule, [
+                LoadSchedule(discom_id=entity, date=day, block_number=block, actual_drawal=Decimal('400.00'))
+                for entity, day, block in keys
+            ])
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual(LoadSchedule.objects.filter(actual_drawal=Decimal('400.00')).count(), 2)
+    
+    @override_settings(DAY_PROFILE_STORAGE=True)
+    def test_day_profile_is_refreshed(self):
+        """Test that the patched block's day profile carries the actual"""
+        from . import actuals
+        from .models import LoadProfile
+        
+        actuals.apply_actuals(LoadSchedule, [
+            LoadSchedule(discom_id=self.upcl.id, date=self.day, block_number=2, actual_drawal=Decimal('490.00')),
+        ])
+        
+        profile = LoadProfile.objects.get(discom=self.upcl, date=self.day)
+        self.assertEqual(profile.actual_drawal[1], Decimal('490.00'))
+    
+    def test_actuals_file_is_ingested(self):
+        """Test that a load_actuals CSV patches schedules through ingest_data"""
+        import shutil
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        with open(os.path.join(data_dir, 'load_actuals.csv'), 'w') as file:
+            file.write('discom,date,block_number,actual_drawal\nUPCL,2024-01-15,2,510.00\nUPCL,2024-01-16,2,400.00\n')
+        out, err = StringIO(), StringIO()
+        
+        call_command('ingest_data', file='load_actuals', data_dir=data_dir, stdout=out, stderr=err)
+        
+        self.assertIn('1 updated', out.getvalue())
+        self.assertIn('1 rows', err.getvalue())
+        self.assertEqual(LoadSchedule.objects.get(block_number=2).actual_drawal, Decimal('510.00'))
+    
+    def test_actuals_endpoint(self):
+        """Test that the actuals endpoint patches rows and reports missing ones"""
+        rows = [
+            {'discom': 'UPCL', 'date': '2024-01-15', 'block_number': 1, 'actual_drawal': '495.50'},
+            {'discom': 'UPCL', 'date': '2024-01-15', 'block_number': 50, 'actual_drawal': '495.50'},
+        ]
+        
+        response = self.client.post(reverse('core:load_actuals'), rows, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['missing'], 1)
+        self.assertEqual(LoadSchedule.objects.get(block_number=1).actual_drawal, Decimal('495.50'))
+
+
+class SQLiteProfileTestCase(TestCase):
+    """Test cases for the SQLite connection profile"""
+    
+    def open_file_database(self):
+        import shutil
+        import tempfile
+        from django.db import connection
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory, 'wal.sqlite3')}, alias='wal_test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+    
+    @override_settings(SQLITE_WAL=True, SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_new_connections_use_wal(self):
+        """Test that a new connection to a database file is switched to WAL with the tuned pragmas"""
+        from . import sqlite
+        wrapper = self.open_file_database()
+        
+        self.assertEqual(sqlite.current(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(sqlite.current(wrapper, 'synchronous'), 1)
+        self.assertEqual(sqlite.current(wrapper, 'busy_timeout'), 1234)
+    
+    @override_settings(SQLITE_WAL=False)
+    def test_profile_can_be_disabled(self):
+        """Test that GNA_SQLITE_WAL=0 leaves SQLite's defaults"""
+        from . import sqlite
+        wrapper = self.open_file_database()
+        
+        self.assertEqual(sqlite.current(wrapper, 'journal_mode'), 'delete')
+
+
+class AnalyticsSidecarTestCase(TestCase):
+    """Test cases for the DuckDB analytics sidecar"""
+    
+    def setUp(self):
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+        for day, price in ((15, 3000), (16, 4000), (20, 5000)):
+            MarketData.objects.create(
+                product=self.dam,
+                timestamp=timezone.make_aware(datetime(2024, 1, day, 10, 0)),
+                block_number=41,
+                mcp=Decimal(price),
+                mcv=Decimal('100.00')
+            )
+        MarketData.objects.create(
+            product=self.dam,
+            timestamp=timezone.make_aware(datetime(2024, 2, 1, 10, 0)),
+            block_number=41,
+            mcp=Decimal('2000.00'),
+            mcv=Decimal('300.00')
+        )
+    
+    def use_sidecar(self):
+        import shutil
+        import tempfile
+        from . import analytics
+        if analytics.duckdb is None:
+            self.skipTest('duckdb is not installed')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(ANALYTICS_DB_PATH=os.path.join(directory, 'analytics.duckdb'))
+        override.enable()
+        self.addCleanup(override.disable)
+    
+    @override_settings(ANALYTICS_DB_PATH=None)
+    def test_disabled_without_path(self):
+        """Test that the sidecar is off unless GNA_ANALYTICS_DB is set, and queries fall back"""
+        from . import analytics
+        self.assertFalse(analytics.enabled())
+        self.assertIsNone(analytics.market_daily('2024-01-01', '2024-01-31'))
+        self.assertIsNone(analytics.sync_after_write())
+    
+    def test_market_monthly_endpoint(self):
+        """Test the monthly summary from the database"""
+        response = self.client.get(reverse('core:market_monthly'), {
+            'start_date': '2024-01-01', 'end_date': '2024-02-29', 'product': 'DAM'
+        })
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['month'] for row in response.data], ['2024-01-01', '2024-02-01'])
+        january = response.data[0]
+        self.assertEqual(january['days'], 3)
+        self.assertEqual(Decimal(january['weighted_avg_price']), Decimal('4000'))
+        self.assertEqual(Decimal(january['max_price']), Decimal('5000'))
+    
+    def test_market_monthly_requires_dates(self):
+        """Test that the monthly summary validates its range"""
+        response = self.client.get(reverse('core:market_monthly'), {'start_date': '2024-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_sync_command_requires_path(self):
+        """Test that sync_analytics refuses to run without GNA_ANALYTICS_DB"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        with override_settings(ANALYTICS_DB_PATH=None):
+            with self.assertRaises(CommandError):
+                call_command('sync_analytics')
+    
+    def test_rows_committed_behind_the_watermark_are_synced(self):
+        """Test that a row stamped before the last sync but committed after it is still copied"""
+        from django.utils import timezone
+        from . import analytics
+        self.use_sidecar()
+        
+        analytics.sync()
+        row = MarketData.objects.create(
+            product=self.dam, timestamp=timezone.make_aware(datetime(2024, 1, 21, 10, 0)),
+            block_number=41, mcp=Decimal('3000.00'), mcv=Decimal('100.00')
+        )
+        # As if its transaction had stamped it a minute ago and committed just now
+        MarketData.objects.filter(pk=row.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        analytics.sync()
+        
+        self.assertEqual(analytics.market_totals('2024-01-01', '2024-01-31')['rows'], 4)
+        with override_settings(SYNC_LAG=0):
+            MarketData.objects.filter(pk=row.pk).update(mcp=Decimal('9000.00'), updated_at=timezone.now() - timedelta(minutes=1))
+            analytics.sync()
+        self.assertEqual(analytics.market_monthly('2024-01-01', '2024-01-31')[0]['max_price'], Decimal('5000.00'))
+    
+    def test_bulk_writes_do_not_sync(self):
+        """Test that the bulk endpoints leave the sidecar sync to the commands"""
+        from unittest import mock
+        from . import analytics, bulk
+        self.use_sidecar()
+        
+        with mock.patch.object(analytics, 'sync') as sync:
+            result, errors = bulk.upsert(MarketData, [{
+                'product': 'DAM', 'timestamp': '2024-03-01T10:00:00+05:30', 'block_number': 41,
+                'mcp': '3500.00', 'mcv': '100.00',
+            }])
+        
+        self.assertIsNone(errors)
+        self.assertEqual(result['inserted'], 1)
+        sync.assert_not_called()
+    
+    def test_sync_and_aggregate(self):
+        """Test that synced rows answer the aggregations, and later writes are synced incrementally"""
+        from . import analytics
+        self.use_sidecar()
+        
+        self.assertEqual(analytics.sync()['market_data'], 4)
+        daily = analytics.market_daily('2024-01-01', '2024-01-31', self.dam.id)
+        self.assertEqual([row['date'] for row in daily], [date(2024, 1, 15), date(2024, 1, 16), date(2024, 1, 20)])
+        
+        MarketData.objects.filter(trade_date=date(2024, 1, 20)).update(mcp=Decimal('6000.00'))
+        MarketData.objects.filter(trade_date=date(2024, 1, 20)).first().save()
+        analytics.sync_after_write()
+        
+        totals = analytics.market_totals('2024-01-01', '2024-01-31')
+        self.assertEqual(totals['rows'], 3)
+        self.assertEqual(analytics.market_monthly('2024-01-01', '2024-01-31')[0]['max_price'], Decimal('6000.00'))
+    
+    def test_writes_after_the_watermark_fall_back(self):
+        """Test that the sidecar stops answering once the primary has newer rows"""
+        from django.utils import timezone
+        from . import analytics
+        self.use_sidecar()
+        analytics.sync()
+        
+        MarketData.objects.create(
+            product=self.dam, timestamp=timezone.make_aware(datetime(2024, 1, 21, 10, 0)),
+            block_number=41, mcp=Decimal('3000.00'), mcv=Decimal('100.00')
+        )
+        response = self.client.get(reverse('core:market_aggregation'), {
+            'start_date': '2024-01-01', 'end_date': '2024-01-31'
+        })
+        
+        self.assertIsNone(analytics.market_totals('2024-01-01', '2024-01-31'))
+        self.assertEqual(len(response.data), 4)
+        analytics.sync()
+        self.assertEqual(analytics.market_totals('2024-01-01', '2024-01-31')['rows'], 4)
+    
+    def test_deletes_reach_the_sidecar(self):
+        """Test that deleted rows are dropped by the next sync, and archive moves are not recorded"""
+        from . import analytics
+        from .models import DeletedBlock
+        from .tiering import moving
+        self.use_sidecar()
+        analytics.sync()
+        
+        MarketData.objects.filter(trade_date=date(2024, 1, 20)).delete()
+        
+        self.assertIsNone(analytics.market_totals('2024-01-01', '2024-01-31'))
+        analytics.sync()
+        self.assertEqual(analytics.market_totals('2024-01-01', '2024-01-31')['rows'], 2)
+        with moving():
+            MarketData.objects.filter(trade_date=date(2024, 1, 15)).delete()
+        self.assertEqual(DeletedBlock.objects.count(), 1)
+        analytics.sync(rebuild=True)
+        self.assertEqual(analytics.market_totals('2024-01-01', '2024-01-31')['rows'], 1)
+
+
+class SnapshotTestCase(TestCase):
+    """Test cases for the memory-mapped columnar snapshot"""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.utils import timezone
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'blocks.snapshot')
+        override = override_settings(SNAPSHOT_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.dam = Product.objects.create(name='DAM', description='Day Ahead Market')
+        self.rtm = Product.objects.create(name='RTM', description='Real Time Market')
+        self.upcl = Discom.objects.create(name='UPCL', state='Uttarakhand', region='North')
+        for product, price in ((self.dam, 3000), (self.rtm, 3500)):
+            for block in (1, 2):
+                MarketData.objects.create(
+                    product=product,
+                    timestamp=timezone.make_aware(datetime(2024, 1, 15, 0, 15 * (block - 1))),
+                    block_number=block,
+                    mcp=Decimal(price + block),
+                    mcv=Decimal('100.50')
+                )
+        for block, scheduled, actual in ((1, '400.00', '390.25'), (2, '450.00', None), (3, '450.00', None)):
+            LoadSchedule.objects.create(discom=self.upcl, date=date(2024, 1, 15), block_number=block,
+                                        scheduled_drawal=Decimal(scheduled),
+                                        actual_drawal=None if actual is None else Decimal(actual))
+    
+    def add_market_block(self, day, block, price):
+        from django.utils import timezone
+        MarketData.objects.create(
+            product=self.dam,
+            timestamp=timezone.make_aware(datetime(2024, 1, day, 0, 0)) + timedelta(minutes=15 * (block - 1)),
+            block_number=block,
+            mcp=Decimal(price),
+            mcv=Decimal('10.00')
+        )
+    
+    def test_snapshot_matches_database_aggregation(self):
+        """Test that the market aggregation reads the same figures from the snapshot"""
+        from . import snapshot
+        params = {'start_date': '2024-01-15', 'end_date': '2024-01-15'}
+        with override_settings(SNAPSHOT_PATH=None):
+            expected = self.client.get(reverse('core:market_aggregation'), params).data
+        
+        self.assertEqual(snapshot.refresh(), {'market': ('rebuilt', 4), 'load': ('rebuilt', 3)})
+        response = self.client.get(reverse('core:market_aggregation'), params)
+        
+        self.assertEqual(response.data, expected)
+        self.assertEqual(snapshot.current().rows('market'), 4)
+    
+    def test_columns_are_views_of_the_mapping(self):
+        """Test that range slices are memoryviews over the mapped file"""
+        from . import slots, snapshot
+        snapshot.refresh()
+        
+        columns = snapshot.current().range('market', *slots.slot_range(date(2024, 1, 15), date(2024, 1, 15)))
+        
+        self.assertTrue(all(isinstance(column, memoryview) for column in columns))
+        self.assertEqual(columns[0].obj, snapshot.current()._map)
+        self.assertEqual(list(columns[2]), [300100, 350100, 300200, 350200])
+    
+    def test_refresh_appends_new_blocks_and_patches_updates(self):
+        """Test that later blocks are appended and earlier changes go to a new file, never the mapped one"""
+        from . import snapshot
+        snapshot.refresh()
+        first = snapshot.current()
+        
+        self.add_market_block(16, 1, 5000)
+        self.assertEqual(snapshot.refresh(), {'market': ('appended', 1), 'load': ('unchanged', 0)})
+        self.assertIsNot(snapshot.current(), first)
+        self.assertEqual(snapshot.current().rows('market'), 5)
+        
+        before = snapshot.current()
+        row = MarketData.objects.get(product=self.dam, trade_date=date(2024, 1, 15), block_number=1)
+        row.mcp = Decimal('2000.00')
+        row.save()
+        LoadSchedule.objects.filter(block_number=2).update(actual_drawal=Decimal('440.00'))
+        
+        self.assertEqual(snapshot.refresh(), {'market': ('patched', 1), 'load': ('patched', 1)})
+        self.assertIsNot(snapshot.current(), before)
+        self.assertEqual(before.sections['market'][2][0], 300100)
+        daily = snapshot.market_daily(date(2024, 1, 15), date(2024, 1, 15), self.dam.id)
+        self.assertEqual(daily[0]['min_price'], Decimal('2000.00'))
+        self.assertEqual(snapshot.load_daily(date(2024, 1, 15))[0]['total_actual_demand'], Decimal('830.25'))
+    
+    def test_stale_snapshot_falls_back_and_deletes_are_dropped(self):
+        """Test that unrefreshed writes and deletes are read from the database until the next refresh"""
+        from . import snapshot
+        snapshot.refresh()
+        
+        MarketData.objects.filter(product=self.rtm).delete()
+        LoadSchedule.objects.get(block_number=3).delete()
+        
+        self.assertIsNone(snapshot.market_daily(date(2024, 1, 15), date(2024, 1, 15)))
+        self.assertIsNone(snapshot.load_daily(date(2024, 1, 15)))
+        response = self.client.get(reverse('core:market_aggregation'), {
+            'start_date': '2024-01-15', 'end_date': '2024-01-15'
+        })
+        self.assertEqual([row['product'] for row in response.data], ['DAM'])
+        
+        self.assertEqual(snapshot.refresh(), {'market': ('patched', 2), 'load': ('patched', 1)})
+        self.assertEqual(snapshot.current().rows('market'), 2)
+        self.assertEqual(
+            [row['product'] for row in snapshot.market_daily(date(2024, 1, 15), date(2024, 1, 15))], [self.dam.id]
+        )
+        self.assertEqual(snapshot.load_daily(date(2024, 1, 15))[0]['total_scheduled_demand'], Decimal('850.00'))
+    
+    def test_row_between_existing_keys_rebuilds_its_section(self):
+        """Test that a block inserted before the last one rebuilds only its section"""
+        from . import snapshot
+        snapshot.refresh()
+        self.add_market_block(16, 1, 5000)
+        snapshot.refresh()
+        
+        self.add_market_block(15, 3, 4000)
+        
+        self.assertEqual(snapshot.refresh(), {'market': ('rebuilt', 6), 'load': ('unchanged', 0)})
+        series = snapshot.market_series(date(2024, 1, 15), date(2024, 1, 16), self.dam.id)
+        self.assertEqual([price for _, _, price, _ in series], [
+            Decimal('3001.00'), Decimal('3002.00'), Decimal('4000.00'), Decimal('5000.00'),
+        ])
+    
+    def test_refresh_holds_the_file_lock(self):
+        """Test that a refresh takes the cross-process lock next to the snapshot"""
+        from unittest import mock
+        from . import snapshot
+        if snapshot.fcntl is None:
+            self.skipTest('fcntl is not available')
+        
+        with mock.patch.object(snapshot.fcntl, 'flock', wraps=snapshot.fcntl.flock) as flock:
+            snapshot.refresh()
+        
+        self.assertTrue(os.path.exists(self.path + '.lock'))
+        self.assertEqual([call.args[1] for call in flock.call_args_list],
+                         [snapshot.fcntl.LOCK_EX, snapshot.fcntl.LOCK_UN])
+    
+    def test_bulk_writes_do_not_refresh(self):
+        """Test that the bulk endpoints leave the snapshot refresh to the commands"""
+        from unittest import mock
+        from . import bulk, snapshot
+        snapshot.refresh()
+        
+        with mock.patch.object(snapshot, 'refresh') as refresh:
+            result, errors = bulk.upsert(MarketData, [{
+                'product': 'DAM', 'timestamp': '2024-01-16T00:00:00+05:30', 'block_number': 1,
+                'mcp': '3500.00', 'mcv': '100.00',
+            }])
+        
+        self.assertEqual(result['inserted'], 1)
+        refresh.assert_not_called()
+    
+    def test_market_series_endpoint(self):
+        """Test that the chart series is the same from the snapshot and the database"""
+        from . import snapshot
+        params = {'start_date': '2024-01-15', 'end_date': '2024-01-15', 'product': 'RTM'}
+        expected = self.client.get(reverse('core:market_series'), params).data
+        
+        snapshot.refresh()
+        response = self.client.get(reverse('core:market_series'), params)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data, expected)
+        self.assertEqual(response.data[0]['mcp'], '3501.00')
+    
+    def test_load_aggregation_from_snapshot(self):
+        """Test that load totals, nullable actuals and the first peak block come from the snapshot"""
+        from . import snapshot
+        params = {'date': '2024-01-15', 'discom': 'UPCL'}
+        with override_settings(SNAPSHOT_PATH=None):
+            expected = self.client.get(reverse('core:load_aggregation'), params).data
+        
+        snapshot.refresh()
+        response = self.client.get(reverse('core:load_aggregation'), params)
+        
+        self.assertEqual(response.data, expected)
+        self.assertEqual(response.data[0]['peak_demand_block'], 2)
+        self.assertEqual(response.data[0]['total_actual_demand'], '390.25')
+    
+    def test_missing_snapshot_falls_back(self):
+        """Test that the endpoints use the database until the snapshot is built"""
+        from . import snapshot
+        self.assertIsNone(snapshot.current())
+        response = self.client.get(reverse('core:market_aggregation'), {
+            'start_date': '2024-01-15', 'end_date': '2024-01-15'
+        })
+        self.assertEqual(len(response.data), 2)
+    
+    def test_build_snapshot_command(self):
+        """Test the build_snapshot command"""
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        
+        call_command('build_snapshot', stdout=out)
+        call_command('build_snapshot', stdout=out)
+        
+        self.assertIn('market: rebuilt, 4 rows written', out.getvalue())
+        self.assertIn('load: unchanged, 0 rows written', out.getvalue())
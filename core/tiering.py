@@ -0,0 +1,175 @@
+"""
+Hot/cold tiering of the block-level tables.
+
+``archive_data`` moves MarketData, LoadSchedule and GenerationSchedule rows
+older than ARCHIVE_AFTER_DAYS into the ARCHIVE_DATABASE and records the
+boundary in ``ArchivedRange``. The helpers here let the list views,
+aggregations and NLPAgent read both tiers as if they were one table: a
+query whose range starts before the boundary is run on each tier and the
+results are concatenated (lists) or combined (aggregates).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+
+from .models import ArchivedRange
+
+def _add(a, b):
+    return b if a is None else a if b is None else a + b
+
+
+COMBINE = {
+    Sum: _add,
+    Count: _add,
+    Min: lambda a, b: b if a is None else a if b is None else min(a, b),
+    Max: lambda a, b: b if a is None else a if b is None else max(a, b),
+}
+
+
+# Field the archive boundary is compared with, per tiered model
+DATE_FIELDS = {'MarketData': 'trade_date', 'LoadSchedule': 'date', 'GenerationSchedule': 'date'}
+
+_moving = ContextVar('archive_move', default=False)
+
+
+@contextmanager
+def moving():
+    """Mark the deletes inside the block as archive moves rather than removals."""
+    token = _moving.set(True)
+    try:
+        yield
+    finally:
+        _moving.reset(token)
+
+
+def is_moving():
+    return _moving.get()
+
+
+def archive_alias():
+    if not getattr(settings, 'ARCHIVE_ENABLED', False):
+        return None
+    alias = getattr(settings, 'ARCHIVE_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def archive_boundary(model):
+    if archive_alias() is None:
+        return None
+    return ArchivedRange.objects.filter(table=model._meta.db_table).values_list(
+        'archived_before', flat=True
+    ).first()
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def tiers(queryset, start_date=None):
+    """Return the hot queryset, plus its archive copy when the range needs it."""
+    boundary = archive_boundary(queryset.model)
+    start_date = _as_date(start_date)
+    if boundary is None or (start_date is not None and start_date >= boundary):
+        return [queryset]
+    # Each tier answers for its own side of the boundary, so rows that
+    # archive_data has copied but not yet deleted are counted once
+    field = DATE_FIELDS[queryset.model.__name__]
+    return [
+        queryset.filter(**{f'{field}__gte': boundary}),
+        queryset.using(archive_alias()).filter(**{f'{field}__lt': boundary}),
+    ]
+
+
+def tiered_queryset(queryset, start_date=None):
+    """The queryset itself, or a TieredQuerySet spanning both tiers."""
+    querysets = tiers(queryset, start_date)
+    return querysets[0] if len(querysets) == 1 else TieredQuerySet(querysets)
+
+
+def _check_combinable(aggregates):
+    for name, aggregate in aggregates.items():
+        if type(aggregate) not in COMBINE:
+            raise TypeError(f"Aggregate '{name}' cannot be combined across tiers")
+
+
+def aggregate(querysets, **aggregates):
+    """``QuerySet.aggregate`` over several tiers (Sum, Count, Min, Max only)."""
+    _check_combinable(aggregates)
+    result = dict.fromkeys(aggregates)
+    for queryset in querysets:
+        partial = queryset.aggregate(**aggregates)
+        for name, agg in aggregates.items():
+            result[name] = COMBINE[type(agg)](result[name], partial[name])
+    return result
+
+
+def group(querysets, fields, **aggregates):
+    """
+    ``values(*fields).annotate(...)`` over several tiers, combined per group.
+    Returns a list of dicts ordered by the group fields.
+    """
+    _check_combinable(aggregates)
+    groups = {}
+    for queryset in querysets:
+        rows = queryset.order_by().values(*fields).annotate(**aggregates)
+        for row in rows:
+            key = tuple(row[field] for field in fields)
+            combined = groups.get(key)
+            if combined is None:
+                groups[key] = row
+                continue
+            for name, agg in aggregates.items():
+                combined[name] = COMBINE[type(agg)](combined[name], row[name])
+    return [groups[key] for key in sorted(groups)]
+
+
+class TieredQuerySet:
+    """
+    Read-only sequence over the hot tier followed by the archive tier, for
+    pagination of lists ordered newest first. Every archived row is older than
+    every hot row, so concatenation keeps that order.
+    """
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for queryset in self.querysets:
+            yield from queryset
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            items = self[key:key + 1]
+            if not items:
+                raise IndexError(key)
+            return items[0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        items = []
+        offset = 0
+        for queryset, size in zip(self.querysets, self.counts()):
+            if start < offset + size and stop > offset:
+                items.extend(queryset[max(start - offset, 0):min(stop - offset, size)])
+            offset += size
+        return items
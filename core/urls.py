@@ -13,7 +13,22 @@ urlpatterns = [
     path('api/market-data/', views.MarketDataListView.as_view(), name='market_data_list'),
     path('api/load-schedule/', views.LoadScheduleListView.as_view(), name='load_schedule_list'),
     path('api/generation-schedule/', views.GenerationScheduleListView.as_view(), name='generation_schedule_list'),
+    path('api/market-data/bulk/', views.MarketDataBulkView.as_view(), name='market_data_bulk'),
+    path('api/load-schedule/bulk/', views.LoadScheduleBulkView.as_view(), name='load_schedule_bulk'),
+    path('api/generation-schedule/bulk/', views.GenerationScheduleBulkView.as_view(), name='generation_schedule_bulk'),
+    path('api/load-schedule/actuals/', views.LoadActualsView.as_view(), name='load_actuals'),
+    path('api/generation-schedule/actuals/', views.GenerationActualsView.as_view(), name='generation_actuals'),
+    path('api/market-slots/', views.MarketSlotListView.as_view(), name='market_slot_list'),
+    path('api/load-slots/', views.LoadSlotListView.as_view(), name='load_slot_list'),
+    path('api/generation-slots/', views.GenerationSlotListView.as_view(), name='generation_slot_list'),
+    path('api/load-profiles/', views.LoadProfileListView.as_view(), name='load_profile_list'),
+    path('api/generation-profiles/', views.GenerationProfileListView.as_view(), name='generation_profile_list'),
     path('api/market-aggregation/', views.market_aggregation, name='market_aggregation'),
+    path('api/analytics/market-monthly/', views.market_monthly, name='market_monthly'),
+    path('api/market-series/', views.market_series, name='market_series'),
     path('api/load-aggregation/', views.load_aggregation, name='load_aggregation'),
     path('api/nlp-query/', views.nlp_query, name='nlp_query'),
+    
+    # Monitoring
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
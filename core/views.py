@@ -1,22 +1,36 @@
+from django.http import HttpResponse
 from django.shortcuts import render
-from django.db.models import Sum, Avg, Min, Max, Q
-from django.db.models.functions import Coalesce
+from django.utils.decorators import method_decorator
+from django.db.models import Sum, Avg, Count, Min, Max, Q, F
+from django.db.models.functions import Coalesce, TruncMonth
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework import generics, status
+from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from datetime import datetime, timedelta
+from . import analytics, bulk, metrics, profiles, refdata, slots, snapshot, tiering
+from .fields import FixedPointField
+from .middleware import timed
+from .routers import use_replicas
 from .models import (
     Product, Generator, Discom, MarketData, LoadSchedule, 
-    GenerationSchedule, IEXData, LoadData, GenerationData
+    GenerationSchedule, IEXData, LoadData, GenerationData, MarketSlot,
+    LoadSlot, GenerationSlot, LoadProfile, GenerationProfile
 )
 from .serializers import (
     ProductSerializer, GeneratorSerializer, DiscomSerializer, MarketDataSerializer, 
-    LoadScheduleSerializer, GenerationScheduleSerializer, MarketAggregationSerializer,
-    LoadAggregationSerializer, IEXDataSerializer, LoadDataSerializer, GenerationDataSerializer
+    LoadScheduleSerializer, GenerationScheduleSerializer, MarketAggregationSerializer, MarketMonthlySerializer,
+    MarketSeriesSerializer,
+    LoadAggregationSerializer, IEXDataSerializer, LoadDataSerializer, GenerationDataSerializer,
+    MarketSlotSerializer, LoadSlotSerializer, GenerationSlotSerializer,
+    LoadProfileSerializer, GenerationProfileSerializer
 )
 
 # Market Data API Views
+@method_decorator(use_replicas, name='dispatch')
 class MarketDataListView(generics.ListAPIView):
     serializer_class = MarketDataSerializer
     
@@ -27,14 +41,15 @@ class MarketDataListView(generics.ListAPIView):
         end_date = self.request.query_params.get('end_date')
         
         if product:
-            queryset = queryset.filter(product__name=product)
+            queryset = refdata.filter_by_name(queryset, 'product', product)
         if start_date:
-            queryset = queryset.filter(timestamp__date__gte=start_date)
+            queryset = queryset.filter(trade_date__gte=start_date)
         if end_date:
-            queryset = queryset.filter(timestamp__date__lte=end_date)
+            queryset = queryset.filter(trade_date__lte=end_date)
             
-        return queryset
+        return tiering.tiered_queryset(queryset, start_date)
 
+@method_decorator(use_replicas, name='dispatch')
 class LoadScheduleListView(generics.ListAPIView):
     serializer_class = LoadScheduleSerializer
     
@@ -44,12 +59,13 @@ class LoadScheduleListView(generics.ListAPIView):
         date = self.request.query_params.get('date')
         
         if discom:
-            queryset = queryset.filter(discom__name=discom)
+            queryset = refdata.filter_by_name(queryset, 'discom', discom)
         if date:
             queryset = queryset.filter(date=date)
             
-        return queryset
+        return tiering.tiered_queryset(queryset, date)
 
+@method_decorator(use_replicas, name='dispatch')
 class GenerationScheduleListView(generics.ListAPIView):
     serializer_class = GenerationScheduleSerializer
     
@@ -59,12 +75,203 @@ class GenerationScheduleListView(generics.ListAPIView):
         date = self.request.query_params.get('date')
         
         if generator:
-            queryset = queryset.filter(generator__name=generator)
+            queryset = refdata.filter_by_name(queryset, 'generator', generator)
         if date:
             queryset = queryset.filter(date=date)
             
+        return tiering.tiered_queryset(queryset, date)
+
+@method_decorator(use_replicas, name='dispatch')
+class MarketSlotListView(generics.ListAPIView):
+    serializer_class = MarketSlotSerializer
+    
+    def get_queryset(self):
+        queryset = MarketSlot.objects.all()
+        product = self.request.query_params.get('product')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        
+        if product:
+            queryset = refdata.filter_by_name(queryset, 'product', product)
+        try:
+            return slots.filter_slots(
+                queryset,
+                datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+            )
+        except ValueError:
+            raise ValidationError({'error': 'start_date and end_date must be YYYY-MM-DD'})
+
+@method_decorator(use_replicas, name='dispatch')
+class LoadSlotListView(generics.ListAPIView):
+    serializer_class = LoadSlotSerializer
+    
+    def get_queryset(self):
+        queryset = LoadSlot.objects.all()
+        discom = self.request.query_params.get('discom')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        
+        if discom:
+            queryset = refdata.filter_by_name(queryset, 'discom', discom)
+        try:
+            return slots.filter_slots(
+                queryset,
+                datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+            )
+        except ValueError:
+            raise ValidationError({'error': 'start_date and end_date must be YYYY-MM-DD'})
+
+@method_decorator(use_replicas, name='dispatch')
+class GenerationSlotListView(generics.ListAPIView):
+    serializer_class = GenerationSlotSerializer
+    
+    def get_queryset(self):
+        queryset = GenerationSlot.objects.all()
+        generator = self.request.query_params.get('generator')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        
+        if generator:
+            queryset = refdata.filter_by_name(queryset, 'generator', generator)
+        try:
+            return slots.filter_slots(
+                queryset,
+                datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+            )
+        except ValueError:
+            raise ValidationError({'error': 'start_date and end_date must be YYYY-MM-DD'})
+
+@method_decorator(use_replicas, name='dispatch')
+class LoadProfileListView(generics.ListAPIView):
+    serializer_class = LoadProfileSerializer
+    
+    def get_queryset(self):
+        queryset = LoadProfile.objects.all()
+        discom = self.request.query_params.get('discom')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        
+        if discom:
+            queryset = refdata.filter_by_name(queryset, 'discom', discom)
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+            
+        return queryset
+
+@method_decorator(use_replicas, name='dispatch')
+class GenerationProfileListView(generics.ListAPIView):
+    serializer_class = GenerationProfileSerializer
+    
+    def get_queryset(self):
+        queryset = GenerationProfile.objects.all()
+        generator = self.request.query_params.get('generator')
+        start_date = self.request.query_params.get('start_date')
+        end_date = self.request.query_params.get('end_date')
+        
+        if generator:
+            queryset = refdata.filter_by_name(queryset, 'generator', generator)
+        if start_date:
+            queryset = queryset.filter(date__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+            
         return queryset
 
+# Bulk upsert API Views
+class BulkUpsertPermission(permissions.DjangoModelPermissions):
+    """An upsert both adds and changes rows, so it needs both permissions."""
+    perms_map = {
+        **permissions.DjangoModelPermissions.perms_map,
+        'POST': ['%(app_label)s.add_%(model_name)s', '%(app_label)s.change_%(model_name)s'],
+    }
+
+class BulkUpsertView(APIView):
+    """
+    POST a batch of blocks as JSON, NDJSON or CSV. The whole batch is
+    validated first and merged in one transaction, or rejected with the
+    errors of each bad row.
+    """
+    model = None
+    parser_classes = [JSONParser, bulk.NDJSONParser, bulk.CSVParser]
+    permission_classes = [permissions.IsAuthenticated, BulkUpsertPermission]
+    
+    def get_queryset(self):
+        # For DjangoModelPermissions
+        return self.model.objects.none()
+    
+    def apply(self, rows):
+        return bulk.upsert(self.model, rows)
+    
+    def post(self, request):
+        rows = bulk.rows_from(request.data)
+        with timed('upsert'):
+            result, errors = self.apply(rows)
+        if errors:
+            return Response({'rows': len(rows), 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+class ActualsPermission(permissions.DjangoModelPermissions):
+    perms_map = {
+        **permissions.DjangoModelPermissions.perms_map,
+        'POST': ['%(app_label)s.change_%(model_name)s'],
+    }
+
+class ActualsPatchView(BulkUpsertView):
+    """
+    POST late actuals for existing schedule blocks. Blocks that have no
+    schedule row are counted as missing and listed, not created.
+    """
+    permission_classes = [permissions.IsAuthenticated, ActualsPermission]
+    
+    def apply(self, rows):
+        return bulk.patch_actuals(self.model, rows)
+
+class MarketDataBulkView(BulkUpsertView):
+    model = MarketData
+
+class LoadScheduleBulkView(BulkUpsertView):
+    model = LoadSchedule
+
+class GenerationScheduleBulkView(BulkUpsertView):
+    model = GenerationSchedule
+
+class LoadActualsView(ActualsPatchView):
+    model = LoadSchedule
+
+class GenerationActualsView(ActualsPatchView):
+    model = GenerationSchedule
+
+def _parse_dates(*values):
+    try:
+        return [datetime.strptime(value, '%Y-%m-%d').date() for value in values]
+    except ValueError:
+        return None
+
+def _market_daily_from_snapshot(start_date, end_date, product=None):
+    """Daily market groups from the mapped snapshot, or None to use the database."""
+    dates = _parse_dates(start_date, end_date) if snapshot.enabled() else None
+    if dates is None:
+        return None
+    product_id = refdata.products.id_for(product) if product else None
+    if product and product_id is None:
+        return []
+    return snapshot.market_daily(*dates, product_id)
+
+def _market_daily_from_analytics(start_date, end_date, product=None):
+    """Daily market groups from the analytics sidecar, or None to use the database."""
+    if not analytics.enabled():
+        return None
+    product_id = refdata.products.id_for(product) if product else None
+    if product and product_id is None:
+        return []
+    return analytics.market_daily(start_date, end_date, product_id)
+
+@use_replicas
 @api_view(['GET'])
 def market_aggregation(request):
     start_date = request.query_params.get('start_date')
@@ -75,50 +282,175 @@ def market_aggregation(request):
         return Response({'error': 'start_date and end_date are required'}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
-    queryset = MarketData.objects.filter(
-        timestamp__date__gte=start_date,
-        timestamp__date__lte=end_date
-    )
-    
-    if product:
-        queryset = queryset.filter(product__name=product)
+    groups = _market_daily_from_snapshot(start_date, end_date, product)
+    if groups is None:
+        groups = _market_daily_from_analytics(start_date, end_date, product)
+    if groups is None and slots.enabled():
+        try:
+            first_slot, last_slot = slots.slot_range(
+                datetime.strptime(start_date, '%Y-%m-%d').date(),
+                datetime.strptime(end_date, '%Y-%m-%d').date()
+            )
+        except ValueError:
+            return Response({'error': 'start_date and end_date must be YYYY-MM-DD'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = MarketSlot.objects.filter(slot__gte=first_slot, slot__lte=last_slot)
+        if product:
+            queryset = refdata.filter_by_name(queryset, 'product', product)
+        
+        # Integer sums over paise and kWh; slot / 96 is the day number
+        groups = tiering.group(
+            [queryset.annotate(day=F('slot') / slots.BLOCKS_PER_DAY)],
+            ['day', 'product'],
+            total_volume=Sum('mcv'),
+            turnover=Sum(F('mcp') * F('mcv'), output_field=FixedPointField(decimal_places=5)),
+            min_price=Min('mcp'),
+            max_price=Max('mcp'),
+        )
+        for row in groups:
+            row['date'] = slots.EPOCH + timedelta(days=row['day'])
+    elif groups is None:
+        queryset = MarketData.objects.filter(
+            trade_date__gte=start_date,
+            trade_date__lte=end_date
+        )
+        
+        if product:
+            queryset = refdata.filter_by_name(queryset, 'product', product)
+        
+        # One grouped query per tier instead of a query per day and product
+        groups = tiering.group(
+            tiering.tiers(queryset, start_date),
+            ['trade_date', 'product'],
+            total_volume=Sum('mcv'),
+            turnover=Sum('turnover'),
+            min_price=Min('mcp'),
+            max_price=Max('mcp'),
+        )
+        for row in groups:
+            row['date'] = row['trade_date']
     
     aggregated_data = []
+    for row in groups:
+        total_volume = row['total_volume'] or 0
+        if total_volume > 0:
+            weighted_price = float(row['turnover'] or 0) / float(total_volume)
+        else:
+            weighted_price = 0
+        
+        aggregated_data.append({
+            'date': row['date'],
+            'product': refdata.products.name_for(row['product']),
+            'weighted_avg_price': round(weighted_price, 2),
+            'total_volume': total_volume,
+            'min_price': row['min_price'],
+            'max_price': row['max_price']
+        })
     
-    # Group by date and product
-    dates = queryset.values_list('timestamp__date', flat=True).distinct()
-    products = queryset.values_list('product__name', flat=True).distinct()
+    aggregated_data.sort(key=lambda item: (item['date'], item['product']))
+    serializer = MarketAggregationSerializer(aggregated_data, many=True)
+    return Response(serializer.data)
+
+@use_replicas
+@api_view(['GET'])
+def market_monthly(request):
+    """Monthly market summary over long ranges, answered by the analytics sidecar when enabled."""
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    product = request.query_params.get('product')
+    
+    if not start_date or not end_date:
+        return Response({'error': 'start_date and end_date are required'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        return Response({'error': 'start_date and end_date must be YYYY-MM-DD'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    product_id = refdata.products.id_for(product) if product else None
+    if product and product_id is None:
+        return Response([])
+    
+    groups = analytics.market_monthly(start_date, end_date, product_id) if analytics.enabled() else None
+    if groups is None:
+        queryset = MarketData.objects.filter(trade_date__gte=start_date, trade_date__lte=end_date)
+        if product_id is not None:
+            queryset = queryset.filter(product_id=product_id)
+        groups = tiering.group(
+            [qs.annotate(month=TruncMonth('trade_date')) for qs in tiering.tiers(queryset, start_date)],
+            ['month', 'product'],
+            total_volume=Sum('mcv'),
+            turnover=Sum('turnover'),
+            min_price=Min('mcp'),
+            max_price=Max('mcp'),
+            days=Count('trade_date', distinct=True),
+        )
+    
+    summary = []
+    for row in groups:
+        total_volume = row['total_volume'] or 0
+        weighted_price = float(row['turnover'] or 0) / float(total_volume) if total_volume > 0 else 0
+        summary.append({
+            'month': row['month'],
+            'product': refdata.products.name_for(row['product']),
+            'days': row['days'],
+            'weighted_avg_price': round(weighted_price, 2),
+            'total_volume': total_volume,
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+        })
+    
+    summary.sort(key=lambda item: (item['month'], item['product']))
+    return Response(MarketMonthlySerializer(summary, many=True).data)
+
+@use_replicas
+@api_view(['GET'])
+def market_series(request):
+    """Every block of a range for the charts, read from the mapped snapshot when there is one."""
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    product = request.query_params.get('product')
     
-    for date in dates:
-        for prod in products:
-            day_data = queryset.filter(
-                timestamp__date=date,
-                product__name=prod
+    if not start_date or not end_date:
+        return Response({'error': 'start_date and end_date are required'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    dates = _parse_dates(start_date, end_date)
+    if dates is None:
+        return Response({'error': 'start_date and end_date must be YYYY-MM-DD'},
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    product_id = refdata.products.id_for(product) if product else None
+    if product and product_id is None:
+        return Response([])
+    
+    blocks = snapshot.market_series(*dates, product_id)
+    if blocks is not None:
+        points = [
+            {'timestamp': slots.slot_timestamp(slot), 'block_number': slots.slot_block(slot),
+             'product': refdata.products.name_for(pk), 'mcp': mcp, 'mcv': mcv}
+            for slot, pk, mcp, mcv in blocks
+        ]
+    else:
+        queryset = MarketData.objects.filter(trade_date__gte=dates[0], trade_date__lte=dates[1])
+        if product_id is not None:
+            queryset = queryset.filter(product_id=product_id)
+        points = []
+        for tier in tiering.tiers(queryset.order_by('timestamp', 'product_id'), dates[0]):
+            points.extend(
+                {'timestamp': timestamp, 'block_number': block, 'product': refdata.products.name_for(pk),
+                 'mcp': mcp, 'mcv': mcv}
+                for timestamp, block, pk, mcp, mcv in tier.values_list(
+                    'timestamp', 'block_number', 'product_id', 'mcp', 'mcv'
+                )
             )
-            
-            if day_data.exists():
-                # Calculate weighted average price
-                total_volume = day_data.aggregate(Sum('mcv'))['mcv__sum'] or 0
-                if total_volume > 0:
-                    weighted_price = sum(
-                        float(item.mcp * item.mcv) for item in day_data
-                    ) / float(total_volume)
-                else:
-                    weighted_price = 0
-                
-                aggregation = {
-                    'date': date,
-                    'product': prod,
-                    'weighted_avg_price': round(weighted_price, 2),
-                    'total_volume': total_volume,
-                    'min_price': day_data.aggregate(Min('mcp'))['mcp__min'],
-                    'max_price': day_data.aggregate(Max('mcp'))['mcp__max']
-                }
-                aggregated_data.append(aggregation)
+        points.sort(key=lambda point: (point['timestamp'], point['product']))
     
-    serializer = MarketAggregationSerializer(aggregated_data, many=True)
-    return Response(serializer.data)
+    return Response(MarketSeriesSerializer(points, many=True).data)
 
+@use_replicas
 @api_view(['GET'])
 def load_aggregation(request):
     date = request.query_params.get('date')
@@ -128,42 +460,142 @@ def load_aggregation(request):
         return Response({'error': 'date is required'}, 
                        status=status.HTTP_400_BAD_REQUEST)
     
+    aggregated_data = _load_aggregation_from_snapshot(date, discom)
+    if aggregated_data is None and profiles.enabled():
+        aggregated_data = _load_aggregation_from_profiles(date, discom)
+    if aggregated_data is None and slots.enabled():
+        aggregated_data = _load_aggregation_from_slots(date, discom)
+    if aggregated_data is None:
+        aggregated_data = _load_aggregation_from_schedules(date, discom)
+    
+    aggregated_data.sort(key=lambda item: item['discom'])
+    serializer = LoadAggregationSerializer(aggregated_data, many=True)
+    return Response(serializer.data)
+
+def _load_aggregation_from_snapshot(date, discom):
+    dates = _parse_dates(date) if snapshot.enabled() else None
+    if dates is None:
+        return None
+    discom_id = refdata.discoms.id_for(discom) if discom else None
+    if discom and discom_id is None:
+        return []
+    totals = snapshot.load_daily(dates[0], discom_id)
+    if totals is None:
+        return None
+    for row in totals:
+        row['date'] = date
+        row['discom'] = refdata.discoms.name_for(row['discom'])
+    return totals
+
+def _load_aggregation_from_schedules(date, discom):
     queryset = LoadSchedule.objects.filter(date=date)
     
     if discom:
-        queryset = queryset.filter(discom__name=discom)
+        queryset = refdata.filter_by_name(queryset, 'discom', discom)
+    
+    tiers = tiering.tiers(queryset, date)
+    totals = tiering.group(
+        tiers,
+        ['discom'],
+        total_scheduled_demand=Sum('scheduled_drawal'),
+        total_actual_demand=Sum('actual_drawal'),
+        peak_demand_value=Max('scheduled_drawal'),
+    )
+    
+    aggregated_data = []
+    for row in totals:
+        peak_block = None
+        for tier in tiers:
+            peak_block = tier.filter(
+                discom_id=row['discom'],
+                scheduled_drawal=row['peak_demand_value']
+            ).order_by('block_number').values_list('block_number', flat=True).first()
+            if peak_block is not None:
+                break
+        
+        aggregated_data.append({
+            'date': date,
+            'discom': refdata.discoms.name_for(row['discom']),
+            'total_scheduled_demand': row['total_scheduled_demand'],
+            'total_actual_demand': row['total_actual_demand'],
+            'peak_demand_block': peak_block,
+            'peak_demand_value': row['peak_demand_value']
+        })
+    
+    return aggregated_data
+
+def _load_aggregation_from_slots(date, discom):
+    dates = _parse_dates(date)
+    if dates is None:
+        return None
+    first_slot, last_slot = slots.slot_range(dates[0], dates[0])
+    queryset = LoadSlot.objects.filter(slot__gte=first_slot, slot__lte=last_slot)
+    
+    if discom:
+        queryset = refdata.filter_by_name(queryset, 'discom', discom)
+    
+    # Integer sums over kWh; the slot order within a day is the block order
+    totals = queryset.values('discom').annotate(
+        total_scheduled_demand=Sum('scheduled_drawal'),
+        total_actual_demand=Sum('actual_drawal'),
+        peak_demand_value=Max('scheduled_drawal'),
+    ).order_by()
     
     aggregated_data = []
-    discoms = queryset.values_list('discom__name', flat=True).distinct()
+    for row in totals:
+        peak_slot = queryset.filter(
+            discom_id=row['discom'],
+            scheduled_drawal=row['peak_demand_value']
+        ).order_by('slot').values_list('slot', flat=True).first()
+        
+        aggregated_data.append({
+            'date': date,
+            'discom': refdata.discoms.name_for(row['discom']),
+            'total_scheduled_demand': row['total_scheduled_demand'],
+            'total_actual_demand': row['total_actual_demand'],
+            'peak_demand_block': slots.slot_block(peak_slot),
+            'peak_demand_value': row['peak_demand_value']
+        })
+    
+    return aggregated_data
+
+def _load_aggregation_from_profiles(date, discom):
+    # One row per discom and day; totals and peak come from the unpacked arrays
+    queryset = LoadProfile.objects.filter(date=date)
     
-    for disc in discoms:
-        discom_data = queryset.filter(discom__name=disc)
+    if discom:
+        queryset = refdata.filter_by_name(queryset, 'discom', discom)
+    
+    aggregated_data = []
+    for profile in queryset:
+        scheduled = [
+            (block, value) for block, value in enumerate(profile.scheduled_drawal, start=1)
+            if value is not None
+        ]
+        if not scheduled:
+            continue
+        actual = [value for value in profile.actual_drawal if value is not None]
+        peak_block, peak_value = max(scheduled, key=lambda item: item[1])
         
-        if discom_data.exists():
-            peak_demand = discom_data.order_by('-scheduled_drawal').first()
-            
-            aggregation = {
-                'date': date,
-                'discom': disc,
-                'total_scheduled_demand': discom_data.aggregate(
-                    Sum('scheduled_drawal'))['scheduled_drawal__sum'],
-                'total_actual_demand': discom_data.aggregate(
-                    Sum('actual_drawal'))['actual_drawal__sum'],
-                'peak_demand_block': peak_demand.block_number,
-                'peak_demand_value': peak_demand.scheduled_drawal
-            }
-            aggregated_data.append(aggregation)
+        aggregated_data.append({
+            'date': date,
+            'discom': refdata.discoms.name_for(profile.discom_id),
+            'total_scheduled_demand': sum(value for _, value in scheduled),
+            'total_actual_demand': sum(actual) if actual else None,
+            'peak_demand_block': peak_block,
+            'peak_demand_value': peak_value
+        })
     
-    serializer = LoadAggregationSerializer(aggregated_data, many=True)
-    return Response(serializer.data)
+    return aggregated_data
 
 # Frontend Views
+@use_replicas
 def dashboard(request):
     # Get recent data for dashboard
     recent_market_data = MarketData.objects.select_related('product').order_by('-timestamp')[:100]
-    products = Product.objects.all()
-    generators = Generator.objects.all()
-    discoms = Discom.objects.all()
+    products = refdata.products.all()
+    generators = refdata.generators.all()
+    discoms = refdata.discoms.all()
     
     context = {
         'recent_market_data': recent_market_data,
@@ -189,10 +621,17 @@ def nlp_query(request):
     try:
         from .nlp_agent import NLPAgent
         agent = NLPAgent()
-        result = agent.process_query(query)
+        with timed('nlp'):
+            result = agent.process_query(query)
         return Response(result)
     except Exception as e:
         return Response({
             'response': f"Sorry, I encountered an error processing your query: {str(e)}",
             'data': None
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def prometheus_metrics(request):
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
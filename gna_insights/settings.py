@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,11 +28,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +68,50 @@ DATABASES = {
     }
 }
 
+# Set GNA_POSTGRES_DB to run on PostgreSQL instead (needs psycopg or psycopg2);
+# ingest then loads rows with COPY FROM STDIN
+if os.environ.get('GNA_POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['GNA_POSTGRES_DB'],
+        'USER': os.environ.get('GNA_POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('GNA_POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('GNA_POSTGRES_HOST', ''),
+        'PORT': os.environ.get('GNA_POSTGRES_PORT', ''),
+    }
+
+# Read replicas for the analytics views and NLP agent, given as a
+# os.pathsep-separated list of SQLite files kept in sync with the primary.
+# Writes (ingest_data, admin) always go to 'default'.
+DATABASE_REPLICAS = []
+for index, replica_path in enumerate(filter(None, os.environ.get('GNA_REPLICA_DB_PATHS', '').split(os.pathsep)), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': replica_path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+# Archive tier (opt-in with GNA_ARCHIVE=1): MarketData, LoadSchedule and
+# GenerationSchedule rows older than ARCHIVE_AFTER_DAYS are moved here by
+# `manage.py archive_data`. While it is off, reads never look for an archive
+# boundary; the database stays defined so it can be migrated beforehand.
+ARCHIVE_ENABLED = os.environ.get('GNA_ARCHIVE', '').lower() in ('1', 'true', 'yes')
+ARCHIVE_DATABASE = 'archive'
+ARCHIVE_AFTER_DAYS = int(os.environ.get('GNA_ARCHIVE_AFTER_DAYS', 365))
+DATABASES[ARCHIVE_DATABASE] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.environ.get('GNA_ARCHIVE_DB_PATH', BASE_DIR / 'archive.sqlite3'),
+}
+
+DATABASE_ROUTERS = ['core.routers.ArchiveRouter', 'core.routers.ReadReplicaRouter']
+
+# A replica trailing the primary by more than this is skipped; set the
+# fallback to 'replica' to serve stale reads instead of hitting the primary
+REPLICA_MAX_LAG_SECONDS = int(os.environ.get('GNA_REPLICA_MAX_LAG_SECONDS', 300))
+REPLICA_LAG_CHECK_INTERVAL = 30
+REPLICA_STALE_FALLBACK = os.environ.get('GNA_REPLICA_STALE_FALLBACK', 'primary')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,3 +163,73 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only for development
+
+# Request instrumentation: requests over either budget are logged by
+# core.middleware.QueryTimingMiddleware
+REQUEST_QUERY_BUDGET = int(os.environ.get('GNA_REQUEST_QUERY_BUDGET', 50))
+REQUEST_TIME_BUDGET_MS = int(os.environ.get('GNA_REQUEST_TIME_BUDGET_MS', 1000))
+
+# Prometheus metrics: each process writes its counters to its own file in
+# METRICS_DIR so /metrics reports totals across all gunicorn workers
+METRICS_DIR = os.environ.get('GNA_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'gna_insights_metrics'))
+METRICS_FLUSH_INTERVAL = float(os.environ.get('GNA_METRICS_FLUSH_INTERVAL', 1.0))
+
+# SQLite connection profile (core/sqlite.py): WAL journal so readers are not
+# blocked by ingest commits, plus cache, mmap and busy-timeout tuning.
+# GNA_SQLITE_WAL=0 keeps SQLite's defaults.
+SQLITE_WAL = os.environ.get('GNA_SQLITE_WAL', '1').lower() in ('1', 'true', 'yes')
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.environ.get('GNA_SQLITE_BUSY_TIMEOUT_MS', 5000)),
+}
+
+# Rows per ingest transaction; smaller batches hold the write lock for less time
+INGEST_BATCH_SIZE = int(os.environ.get('GNA_INGEST_BATCH_SIZE', 1000))
+
+# Slow-query log (opt-in): statements slower than GNA_SLOW_QUERY_MS are
+# explained and written to a rotating log by core.slow_queries
+SLOW_QUERY_THRESHOLD_MS = float(os.environ['GNA_SLOW_QUERY_MS']) if os.environ.get('GNA_SLOW_QUERY_MS') else None
+SLOW_QUERY_LOG_FILE = os.environ.get('GNA_SLOW_QUERY_LOG', BASE_DIR / 'logs' / 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+
+# On-demand profiling (?profile=1 for staff users); flamegraph samples are
+# written to PROFILE_DIR by core.middleware.ProfilingMiddleware
+PROFILE_DIR = os.environ.get('GNA_PROFILE_DIR', BASE_DIR / 'logs' / 'profiles')
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+# Fixed-point, slot-indexed mirror of the block tables (core/slots.py). When
+# enabled, saves are mirrored into MarketSlot/LoadSlot/GenerationSlot and the
+# market aggregation runs on their integer columns.
+FIXED_POINT_STORAGE = os.environ.get('GNA_FIXED_POINT_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+# One-row-per-day LoadProfile/GenerationProfile storage (core/profiles.py).
+# When enabled, schedule saves update the day profiles and load_aggregation
+# reads them.
+DAY_PROFILE_STORAGE = os.environ.get('GNA_DAY_PROFILE_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+# Seconds a process trusts its in-memory Product/Discom/Generator cache
+# (core/refdata.py). Local saves clear it immediately; other processes see
+# changes after this long.
+REFERENCE_CACHE_TTL = int(os.environ.get('GNA_REFERENCE_CACHE_TTL', 300))
+
+# Directory polled by `manage.py watch_ingest`, and seconds between polls
+INGEST_WATCH_DIR = os.environ.get('GNA_INGEST_WATCH_DIR', BASE_DIR / 'core' / 'sample_data')
+INGEST_WATCH_INTERVAL = float(os.environ.get('GNA_INGEST_WATCH_INTERVAL', 2))
+
+# Largest batch accepted by the bulk upsert endpoints (core/bulk.py)
+BULK_UPSERT_MAX_ROWS = int(os.environ.get('GNA_BULK_UPSERT_MAX_ROWS', 50000))
+
+# Optional DuckDB analytics sidecar (core/analytics.py): when set and duckdb
+# is installed, the block tables are mirrored into this file by the ingest
+# commands and `manage.py sync_analytics`, and range aggregations read it.
+ANALYTICS_DB_PATH = os.environ.get('GNA_ANALYTICS_DB') or None
+
+# Seconds below their updated_at watermark that the sidecar and snapshot
+# re-read on each sync: rows are stamped before their transaction commits,
+# so this must exceed the longest write transaction.
+SYNC_LAG = float(os.environ.get('GNA_SYNC_LAG', 300))
+
+# Memory-mapped columnar snapshot (core/snapshot.py) of MarketData and
+# LoadSchedule, refreshed by the ingest commands and `manage.py build_snapshot`
+# and mapped read-only by every worker for the chart and aggregation endpoints.
+SNAPSHOT_PATH = os.environ.get('GNA_SNAPSHOT_PATH') or None